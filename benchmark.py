@@ -0,0 +1,383 @@
+"""
+Benchmark harness for the mining pipeline. It builds synthetic fixtures at several scales, times the loader,
+gitcounter, jiracounter and relcounter stages over them and compares the results against previous runs.
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import catalog
+import dbutils
+import gdata
+import ghgraphql
+import ghraw
+import gitbackend
+import gitcache
+import gitcounter
+import gjdata
+import gminer
+import jdata
+import jiracounter
+import loader
+import mockgithub
+import relcounter
+import synthetic
+
+RESULTS_FILE = "benchmark_results.csv"
+RESULTS_HEADER = ["run_id", "revision", "scale", "issues", "stage", "wall_time"]
+
+DEFAULT_SCALES = ["small", "medium"]
+REGRESSION_THRESHOLD = 1.2
+
+CATALOG_REPOSITORIES = 8
+CATALOG_ISSUES = 80
+CATALOG_RELEASES = 4
+CATALOG_RATE_LIMIT = 60
+CATALOG_RATE_LIMIT_WINDOW = 2
+CATALOG_MAX_REQUESTS = 2
+
+JIRA_POINT_QUERIES = ["SELECT * FROM Issue WHERE id = ?",
+                      "SELECT * FROM Comment WHERE issueId = ?",
+                      "SELECT h.created, h.authorId, c.* FROM History h, ChangeLogItem c "
+                      "WHERE h.issueId = ? AND h.id = c.historyId"]
+
+
+class SilentOutput(object):
+    """
+    Context manager that discards what the pipeline prints, so the console output does not affect the timings.
+    """
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def get_revision():
+    """
+    Returns the Git revision of the code being benchmarked.
+    :return: Commit SHA, or None if it is not available.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_stage(function, *args, **kwargs):
+    """
+    Executes a function with its output silenced.
+    :param function: Function to execute.
+    :return: Elapsed wall time in seconds.
+    """
+    start_time = time.time()
+    with SilentOutput():
+        function(*args, **kwargs)
+    return time.time() - start_time
+
+
+def run_loader(fixture_config):
+    """
+    Executes the loader stages twice over an empty JIRA-Github database, restoring the fixture one afterwards. The
+    git result cache of the fixture starts empty, so the first run is timed with a cold cache and the second one
+    with a warm cache.
+    :param fixture_config: Fixture configuration.
+    :return: List of stage names and wall times.
+    """
+    project_id = fixture_config['project_id']
+    repositories = fixture_config['repositories']
+
+    fixture_database = gjdata.DATABASE_FILE
+    gjdata.DATABASE_FILE = os.path.join(fixture_config['directory'], "loader_" + synthetic.JIRA_GITHUB_DATABASE)
+    cache_database = gitcache.DATABASE_FILE
+    gitcache.DATABASE_FILE = os.path.join(fixture_config['directory'], "loader_" + gitcache.DATABASE_FILE)
+
+    timings = []
+    try:
+        if os.path.exists(gitcache.DATABASE_FILE):
+            os.remove(gitcache.DATABASE_FILE)
+
+        for suffix in ["", " (cached)"]:
+            if os.path.exists(gjdata.DATABASE_FILE):
+                os.remove(gjdata.DATABASE_FILE)
+            dbutils.create_schema([gjdata.COMMITS_DDL, gjdata.TAGS_DDL, gjdata.TAG_TABLE_DDL,
+                                   gjdata.COMMIT_TABLE_DDL], gjdata.DATABASE_FILE)
+
+            timings.extend([("loader.get_issues_and_commits" + suffix,
+                             time_stage(loader.get_issues_and_commits, repositories, project_id)),
+                            ("loader.get_tags_per_commit" + suffix,
+                             time_stage(loader.get_tags_per_commit, project_id)),
+                            ("loader.get_tags" + suffix, time_stage(loader.get_tags, project_id, repositories)),
+                            ("loader.get_commit_information" + suffix,
+                             time_stage(loader.get_commit_information, project_id))])
+    finally:
+        gjdata.DATABASE_FILE = fixture_database
+        gitcache.DATABASE_FILE = cache_database
+
+    return timings
+
+
+def get_github_metrics(project_id, project_issues, release_regex):
+    for issue in project_issues:
+        gitcounter.get_github_metrics(project_id, issue.key, release_regex, issue.created)
+
+
+def get_jira_metrics(project_id, project_issues):
+    for issue in project_issues:
+        jiracounter.get_JIRA_metrics(issue.issue_id, project_id, issue.created)
+
+
+def run_jira_point_queries(project_issues, execute_function):
+    for issue in project_issues:
+        for sql_query in JIRA_POINT_QUERIES:
+            execute_function(sql_query, (issue.issue_id,), jdata.DATABASE_FILE)
+
+
+def run_github_backends(fixture_config):
+    """
+    Mines the commit history of the fixture repositories from a mock GitHub server, with the PyGithub, raw-JSON
+    and GraphQL backends, and from their local clones. Compares their cost per commit and their output.
+    :param fixture_config: Fixture configuration.
+    :return: List of stage names and wall times.
+    """
+    directory = fixture_config['directory']
+    base_url, stop_server = mockgithub.start_server_process(os.path.join(directory, synthetic.REPOSITORY_DIRECTORY))
+
+    fixture_database = gdata.DATABASE_FILE
+    timings = []
+    mined_commits = {}
+    try:
+        for backend, mine_function in [(gminer.PYGITHUB_BACKEND, gminer.mine_repository),
+                                       (gminer.RAW_BACKEND, ghraw.mine_repository),
+                                       (gminer.GRAPHQL_BACKEND, ghgraphql.mine_repository),
+                                       (gminer.LOCAL_SOURCE, gitbackend.mine_repository)]:
+            gdata.DATABASE_FILE = os.path.join(directory, backend + "_" + synthetic.GITHUB_DATABASE)
+
+            start_time = time.time()
+            with SilentOutput():
+                gdata.create_schema()
+                measures = [ghraw.measure_commit_mining(repository, base_url, mine_function) for repository in
+                            fixture_config['repositories']]
+            wall_time = time.time() - start_time
+
+            commits = sum(commits for commits, _, _ in measures)
+            requests = sum(commits * requests_per_commit for commits, requests_per_commit, _ in measures)
+            cpu_time = sum(commits * cpu_per_commit for commits, _, cpu_per_commit in measures)
+            print backend, ": ", commits, " commits. ", "%.1f" % (1000 * requests / (commits or 1)), \
+                " requests per 1,000 commits, ", "%.3f" % (1000 * cpu_time / (commits or 1)), " ms of CPU per commit"
+
+            mined_commits[backend] = sorted(commit for repository in fixture_config['repositories'] for commit in
+                                            gdata.get_commits_by_repository(repository))
+            timings.append(("gminer commits (" + backend + ")", wall_time))
+            timings.append(("gminer commits (" + backend + ", CPU)", cpu_time))
+    finally:
+        gdata.DATABASE_FILE = fixture_database
+        stop_server()
+
+    for backend in [gminer.RAW_BACKEND, gminer.GRAPHQL_BACKEND, gminer.LOCAL_SOURCE]:
+        print backend, " stored the same commits as ", gminer.PYGITHUB_BACKEND, ": ", \
+            mined_commits[backend] == mined_commits[gminer.PYGITHUB_BACKEND]
+    return timings
+
+
+def run_catalog_mining(directory):
+    """
+    Mines a fixture of several repositories with gminer.mine_catalog, one worker per repository, from a mock GitHub
+    server with a small rate limit, so the workers share and wait on the budget. The stored commits are compared with
+    the ones read from the local clones.
+    :param directory: Directory where the fixture is built.
+    :return: List of stage names and wall times.
+    """
+    fixture_directory = os.path.join(directory, "catalog")
+    fixture_config = synthetic.build_fixture(fixture_directory, issues=CATALOG_ISSUES, releases=CATALOG_RELEASES,
+                                             repositories=CATALOG_REPOSITORIES)
+    repositories_directory = os.path.join(fixture_directory, synthetic.REPOSITORY_DIRECTORY)
+    base_url, stop_server = mockgithub.start_server_process(repositories_directory, CATALOG_RATE_LIMIT,
+                                                            CATALOG_RATE_LIMIT_WINDOW)
+
+    release_matcher = catalog.get_release_matcher(fixture_config['release_regex'])
+    repositories = [(repository_name, release_matcher) for repository_name in fixture_config['repositories']]
+    stage_names = [stage_name for stage_name, _ in gminer.MINING_STAGES]
+
+    fixture_database = gdata.DATABASE_FILE
+    repository_location = loader.REPO_LOCATION
+    mined_commits = {}
+    try:
+        gdata.DATABASE_FILE = os.path.join(fixture_directory, "catalog_" + synthetic.GITHUB_DATABASE)
+        start_time = time.time()
+        with SilentOutput():
+            results = gminer.mine_catalog(repositories, stage_names, workers=CATALOG_REPOSITORIES,
+                                          base_url=base_url, max_concurrent_requests=CATALOG_MAX_REQUESTS)
+        wall_time = time.time() - start_time
+        mined_commits[gminer.API_SOURCE] = sorted(commit for repository_name, _ in repositories for commit in
+                                                  gdata.get_commits_by_repository(repository_name))
+
+        gdata.DATABASE_FILE = os.path.join(fixture_directory, gminer.LOCAL_SOURCE + "_" + synthetic.GITHUB_DATABASE)
+        loader.REPO_LOCATION = repositories_directory + os.sep
+        with SilentOutput():
+            gdata.create_schema()
+            for repository_name, _ in repositories:
+                gitbackend.mine_repository(repository_name, release_matcher, stage_names, base_url)
+        mined_commits[gminer.LOCAL_SOURCE] = sorted(commit for repository_name, _ in repositories for commit in
+                                                    gdata.get_commits_by_repository(repository_name))
+    finally:
+        gdata.DATABASE_FILE = fixture_database
+        loader.REPO_LOCATION = repository_location
+        stop_server()
+
+    for repository_name, error in sorted(results.items()):
+        if error:
+            print "gminer.mine_catalog failed for repository ", repository_name, ": ", error
+    print "gminer.mine_catalog: ", len(repositories), " repositories, ", len(mined_commits[gminer.API_SOURCE]), \
+        " commits. Same commits as ", gminer.LOCAL_SOURCE, ": ", \
+        mined_commits[gminer.API_SOURCE] == mined_commits[gminer.LOCAL_SOURCE]
+
+    return [("gminer.mine_catalog", wall_time)]
+
+
+def run_scale(scale, directory):
+    """
+    Builds the fixture for a scale and times each pipeline stage over it.
+    :param scale: Name of the scale, as in synthetic.SCALES.
+    :param directory: Directory where the fixture is built.
+    :return: Number of issues, and a list of stage names and wall times.
+    """
+    fixture_directory = os.path.join(directory, scale)
+
+    start_time = time.time()
+    fixture_config = synthetic.build_fixture(fixture_directory, **synthetic.SCALES[scale])
+    timings = [("synthetic.build_fixture", time.time() - start_time)]
+
+    synthetic.use_fixture(fixture_config)
+    project_id = fixture_config['project_id']
+    release_regex = fixture_config['release_regex']
+    project_issues = jdata.get_project_issues(project_id)
+
+    timings.extend(run_loader(fixture_config))
+    timings.append(("gitcounter.get_github_metrics",
+                    time_stage(get_github_metrics, project_id, project_issues, release_regex)))
+    timings.append(("jiracounter.get_JIRA_metrics", time_stage(get_jira_metrics, project_id, project_issues)))
+    timings.append(("jdata point queries (default open)",
+                    time_stage(run_jira_point_queries, project_issues, dbutils.execute_query)))
+    timings.append(("jdata point queries (read-only mmap)",
+                    time_stage(run_jira_point_queries, project_issues, dbutils.execute_read_only_query)))
+    dbutils.close_read_only_connections()
+    timings.extend(run_github_backends(fixture_config))
+    timings.extend(run_catalog_mining(fixture_directory))
+
+    current_directory = os.getcwd()
+    os.chdir(fixture_directory)
+    try:
+        timings.append(("relcounter.consolidate_information",
+                        time_stage(relcounter.consolidate_information, project_id, release_regex,
+                                   fixture_config['project_key'], use_cache=False)))
+        time_stage(relcounter.consolidate_information, project_id, release_regex, fixture_config['project_key'])
+        timings.append(("relcounter.consolidate_information (cached)",
+                        time_stage(relcounter.consolidate_information, project_id, release_regex,
+                                   fixture_config['project_key'])))
+    finally:
+        os.chdir(current_directory)
+
+    return len(project_issues), timings
+
+
+def load_previous_results(results_file):
+    """
+    Loads the latest previous wall time per scale and stage.
+    :param results_file: CSV file with benchmark results.
+    :return: Dictionary from (scale, stage) to the run identifier and wall time.
+    """
+    previous_results = {}
+    if not os.path.exists(results_file):
+        return previous_results
+
+    with open(results_file, "rb") as results:
+        for row in csv.DictReader(results):
+            previous_results[(row['scale'], row['stage'])] = row['run_id'], float(row['wall_time'])
+
+    return previous_results
+
+
+def write_results(results_file, result_rows):
+    write_header = not os.path.exists(results_file)
+    with open(results_file, "ab") as results:
+        writer = csv.writer(results)
+        if write_header:
+            writer.writerow(RESULTS_HEADER)
+        writer.writerows(result_rows)
+
+
+def compare_results(result_rows, previous_results, threshold):
+    """
+    Prints the comparison of the current timings against the previous ones.
+    :param result_rows: Rows of the current run.
+    :param previous_results: Output of load_previous_results.
+    :param threshold: Ratio over the previous wall time that is reported as a regression.
+    :return: List of regressed (scale, stage) pairs.
+    """
+    regressions = []
+    for _, _, scale, issues, stage, wall_time in result_rows:
+        if (scale, stage) not in previous_results:
+            print scale, stage, ": ", "%.3f" % wall_time, "s (no previous run)"
+            continue
+
+        previous_run, previous_time = previous_results[(scale, stage)]
+        ratio = wall_time / previous_time if previous_time else float('inf')
+        status = "REGRESSION" if ratio > threshold else "ok"
+        print scale, stage, ": ", "%.3f" % wall_time, "s vs ", "%.3f" % previous_time, "s in run ", previous_run, \
+            " (", "%.2f" % ratio, "x) ", status
+
+        if ratio > threshold:
+            regressions.append((scale, stage))
+
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the mining pipeline over synthetic fixtures.")
+    parser.add_argument("--scale", action="append", choices=sorted(synthetic.SCALES.keys()),
+                        help="Fixture scale. It can be repeated. By default: " + ", ".join(DEFAULT_SCALES))
+    parser.add_argument("--results", default=RESULTS_FILE, help="CSV file where results are accumulated.")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown ratio reported as a regression.")
+    parser.add_argument("--keep", action="store_true", help="Keep the fixtures after the run.")
+    arguments = parser.parse_args(arguments)
+
+    run_id = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    revision = get_revision()
+    results_file = os.path.abspath(arguments.results)
+    previous_results = load_previous_results(results_file)
+
+    directory = tempfile.mkdtemp(prefix="benchmark_")
+    result_rows = []
+    try:
+        for scale in arguments.scale or DEFAULT_SCALES:
+            print "Benchmarking scale ", scale, " on ", directory
+            issues, timings = run_scale(scale, directory)
+            result_rows.extend([(run_id, revision, scale, issues, stage, wall_time) for stage, wall_time in timings])
+    finally:
+        if arguments.keep:
+            print "Fixtures kept on ", directory
+        else:
+            shutil.rmtree(directory)
+
+    write_results(results_file, result_rows)
+    regressions = compare_results(result_rows, previous_results, arguments.threshold)
+    print len(regressions), " regressions found. Results stored in ", results_file
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,62 @@
 This Module contains information about the Apache Projects considered for analysis.
 """
 
+import re
+
+
+class ReleaseMatcher(object):
+    """
+    Compiled release regular expression, that remembers the classification of each tag name it has seen.
+    """
+
+    def __init__(self, release_regex):
+        self.release_regex = release_regex
+        self.pattern = re.compile(release_regex)
+        self.classification = {}
+
+    def is_release(self, tag_name):
+        """
+        Returns True if the tag name is a valid release name.
+        :param tag_name: Tag name.
+        :return: True if valid, False otherwise.
+        """
+        try:
+            return self.classification[tag_name]
+        except KeyError:
+            is_release = self.pattern.match(tag_name) is not None
+            self.classification[tag_name] = is_release
+            return is_release
+
+    def filter_tags(self, tags, tag_name_index):
+        """
+        Returns only the tags with a valid release name.
+        :param tags: List of tag tuples.
+        :param tag_name_index: Position of the tag name on the tuple.
+        :return: List of release tags.
+        """
+        return [tag for tag in tags if self.is_release(tag[tag_name_index])]
+
+    def __str__(self):
+        return self.release_regex
+
+
+release_matchers = {}
+
+
+def get_release_matcher(release_regex):
+    """
+    Returns the matcher for a release regular expression. Matchers are shared, so each tag name is classified once.
+    :param release_regex: Regular expression, or a ReleaseMatcher instance.
+    :return: ReleaseMatcher instance.
+    """
+    if isinstance(release_regex, ReleaseMatcher):
+        return release_regex
+
+    if release_regex not in release_matchers:
+        release_matchers[release_regex] = ReleaseMatcher(release_regex)
+
+    return release_matchers[release_regex]
+
 
 def get_cloudstack():
     """
@@ -316,10 +372,11 @@ def get_vcl():
 
 def get_project_catalog():
     """
-    Returns the configuration for each project analyzed.
+    Returns the configuration for each project analyzed. Each configuration includes a 'release_matcher' entry, with
+    the compiled version of 'release_regex'.
     :return: List of dicts.
     """
-    return [
+    project_catalog = [
         get_obbiz(),
         get_flex(),
         get_cassandra(),
@@ -346,3 +403,9 @@ def get_project_catalog():
         get_acummulo()
 
     ]
+
+    for config in project_catalog:
+        if config:
+            config['release_matcher'] = get_release_matcher(config['release_regex'])
+
+    return project_catalog
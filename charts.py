@@ -0,0 +1,206 @@
+"""
+Module for rendering the analysis charts. Charts are described as plain dictionaries (chart jobs), so they can be
+rendered on a process pool with a non-interactive backend.
+"""
+
+import hashlib
+import json
+import os
+
+from multiprocessing import Pool
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+FIGURE_SIZE = (10, 10)
+MANIFEST_FILE = "chart_manifest.json"
+
+BAR_CHART = "bar"
+HISTOGRAM = "histogram"
+BOXPLOT = "boxplot"
+PIE_CHART = "pie"
+
+
+def get_bar_chart(file_name, title, xlabel, ylabel, labels, values):
+    """
+    Describes a bar chart.
+    :param file_name: Output file.
+    :param title: Chart title.
+    :param xlabel: Label of the X axis.
+    :param ylabel: Label of the Y axis.
+    :param labels: Bar labels.
+    :param values: Bar heights.
+    :return: Chart job.
+    """
+    return {'kind': BAR_CHART, 'file_name': file_name, 'title': title, 'xlabel': xlabel, 'ylabel': ylabel,
+            'labels': [str(label) for label in labels], 'values': [float(value) for value in values]}
+
+
+def get_histogram(file_name, title, xlabel, ylabel, counts, bin_edges):
+    """
+    Describes a histogram from precomputed bins.
+    :param file_name: Output file.
+    :param title: Chart title.
+    :param xlabel: Label of the X axis.
+    :param ylabel: Label of the Y axis.
+    :param counts: Values per bin.
+    :param bin_edges: Bin edges, one more than counts.
+    :return: Chart job.
+    """
+    return {'kind': HISTOGRAM, 'file_name': file_name, 'title': title, 'xlabel': xlabel, 'ylabel': ylabel,
+            'counts': [float(count) for count in counts], 'bin_edges': [float(edge) for edge in bin_edges]}
+
+
+def get_boxplot(file_name, title, xlabel, ylabel, box_statistics, yscale='log'):
+    """
+    Describes a boxplot from precomputed statistics, one box per item.
+    :param file_name: Output file.
+    :param title: Chart title.
+    :param xlabel: Label of the X axis.
+    :param ylabel: Label of the Y axis.
+    :param box_statistics: List of dictionaries in the format of Axes.bxp: label, med, q1, q3, whislo, whishi, fliers.
+    :param yscale: Scale of the Y axis.
+    :return: Chart job.
+    """
+    statistics = []
+    for box in box_statistics:
+        box = dict(box)
+        box['fliers'] = [float(value) for value in box['fliers']]
+        statistics.append(box)
+
+    return {'kind': BOXPLOT, 'file_name': file_name, 'title': title, 'xlabel': xlabel, 'ylabel': ylabel,
+            'statistics': statistics, 'yscale': yscale}
+
+
+def get_pie_chart(file_name, title, labels, sizes):
+    """
+    Describes a pie chart.
+    :param file_name: Output file.
+    :param title: Chart title.
+    :param labels: Legend labels.
+    :param sizes: Slice sizes.
+    :return: Chart job.
+    """
+    return {'kind': PIE_CHART, 'file_name': file_name, 'title': title, 'labels': list(labels),
+            'sizes': [float(size) for size in sizes]}
+
+
+def get_fingerprint(chart_job):
+    """
+    Returns a digest of the chart job, including its data.
+    :param chart_job: Chart job.
+    :return: Digest as string.
+    """
+    return hashlib.md5(json.dumps(chart_job, sort_keys=True)).hexdigest()
+
+
+def draw_chart(chart_job, axes):
+    """
+    Draws a chart on a set of axes.
+    :param chart_job: Chart job.
+    :param axes: Matplotlib axes.
+    :return: None.
+    """
+    kind = chart_job['kind']
+
+    if kind == BAR_CHART:
+        positions = range(len(chart_job['values']))
+        axes.bar(positions, chart_job['values'], align='center')
+        axes.set_xticks(positions)
+        axes.set_xticklabels(chart_job['labels'], rotation=90)
+    elif kind == HISTOGRAM:
+        bin_edges = chart_job['bin_edges']
+        bin_widths = [upper - lower for lower, upper in zip(bin_edges[:-1], bin_edges[1:])]
+        axes.bar(bin_edges[:-1], chart_job['counts'], width=bin_widths, align='edge')
+        axes.grid(True)
+    elif kind == BOXPLOT:
+        axes.bxp(chart_job['statistics'])
+        axes.set_yscale(chart_job['yscale'])
+    elif kind == PIE_CHART:
+        patches, texts = axes.pie(chart_job['sizes'])
+        axes.legend(patches, chart_job['labels'], loc="best")
+    else:
+        raise ValueError("Unsupported chart kind: " + str(kind))
+
+    if 'xlabel' in chart_job:
+        axes.set_xlabel(chart_job['xlabel'])
+    if 'ylabel' in chart_job:
+        axes.set_ylabel(chart_job['ylabel'])
+    axes.set_title(chart_job['title'])
+
+
+def render_chart(chart_job):
+    """
+    Renders a chart job into its file. The figure is always closed afterwards.
+    :param chart_job: Chart job.
+    :return: File name.
+    """
+    file_name = chart_job['file_name']
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    figure, axes = plt.subplots(1, 1, figsize=FIGURE_SIZE)
+    try:
+        draw_chart(chart_job, axes)
+        figure.savefig(file_name)
+    finally:
+        plt.close(figure)
+
+    return file_name
+
+
+def load_manifest(manifest_file):
+    """
+    Loads the fingerprints of the charts already rendered.
+    :param manifest_file: Manifest location.
+    :return: Dictionary, with file names as keys and fingerprints as values.
+    """
+    if not os.path.exists(manifest_file):
+        return {}
+
+    with open(manifest_file) as manifest:
+        return json.load(manifest)
+
+
+def render_charts(chart_jobs, processes=None, manifest_file=MANIFEST_FILE):
+    """
+    Renders a list of chart jobs on a process pool. Jobs identical to the ones already rendered are skipped.
+    :param chart_jobs: List of chart jobs.
+    :param processes: Number of processes. If None, the number of CPUs is used.
+    :param manifest_file: File that stores the fingerprint of every rendered chart.
+    :return: List of rendered files.
+    """
+    manifest = load_manifest(manifest_file)
+
+    pending_jobs = []
+    for chart_job in chart_jobs:
+        fingerprint = get_fingerprint(chart_job)
+        file_name = chart_job['file_name']
+
+        if manifest.get(file_name) == fingerprint and os.path.exists(file_name):
+            print "Chart is up to date: ", file_name
+        else:
+            pending_jobs.append((chart_job, fingerprint))
+
+    print "Rendering ", len(pending_jobs), " of ", len(chart_jobs), " charts..."
+    if not pending_jobs:
+        return []
+
+    pool = Pool(processes)
+    try:
+        rendered_files = pool.map(render_chart, [chart_job for chart_job, _ in pending_jobs])
+    finally:
+        pool.close()
+        pool.join()
+
+    for chart_job, fingerprint in pending_jobs:
+        manifest[chart_job['file_name']] = fingerprint
+
+    with open(manifest_file, "w") as manifest_output:
+        json.dump(manifest, manifest_output, indent=1, sort_keys=True)
+
+    return rendered_files
@@ -0,0 +1,199 @@
+"""
+Module for fast date conversions. Git dates in the %ai format and JIRA millisecond timestamps are parsed by specialized
+functions, memoized on a bounded LRU cache, falling back to dateutil for any other format.
+"""
+
+import datetime
+import re
+import threading
+import timeit
+
+from collections import OrderedDict
+
+import dateutil.parser
+import pandas as pd
+
+from dateutil.tz import tzlocal, tzoffset, tzutc
+
+CACHE_SIZE = 10000
+
+# Output of git log --format=%ai. For example: 2016-03-15 10:35:21 -0300
+GIT_DATE_REGEX = re.compile(r"^(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2}) ([+-])(\d{2})(\d{2})$")
+# The %z directive of pandas.to_datetime fails on older versions, so the offset is applied separately.
+GIT_LOCAL_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+LOCAL_TIMEZONE = tzlocal()
+UTC_TIMEZONE = tzutc()
+
+
+class LRUCache(object):
+    """
+    Dictionary-like cache that discards the least recently used item when it reaches its maximum size. It's safe to
+    use from several threads, e.g. pipeline stages running concurrently.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, function):
+        """
+        Returns the cached value for a key, calculating it with function when not present.
+        :param key: Cache key. Also the argument of function.
+        :param function: Function for calculating the value.
+        :return: Cached value.
+        """
+        with self.lock:
+            try:
+                value = self.items.pop(key)
+                self.hits += 1
+            except KeyError:
+                value = function(key)
+                self.misses += 1
+
+                if len(self.items) >= self.max_size:
+                    self.items.popitem(last=False)
+
+            self.items[key] = value
+            return value
+
+
+git_date_cache = LRUCache()
+timestamp_cache = LRUCache()
+timezone_cache = {}
+
+
+def get_timezone(offset_seconds):
+    """
+    Returns the timezone for an UTC offset, using the same instances dateutil would return.
+    :param offset_seconds: Offset in seconds.
+    :return: Timezone.
+    """
+    if offset_seconds == 0:
+        return UTC_TIMEZONE
+
+    if offset_seconds not in timezone_cache:
+        timezone_cache[offset_seconds] = tzoffset(None, offset_seconds)
+
+    return timezone_cache[offset_seconds]
+
+
+def parse_git_date_uncached(date_string):
+    """
+    Parses a date from Git. Dates in %ai format are parsed directly, and dateutil is used otherwise.
+    :param date_string: Date as string.
+    :return: Date as a datetime.
+    """
+    match = GIT_DATE_REGEX.match(date_string.strip())
+
+    if not match:
+        return dateutil.parser.parse(date_string)
+
+    year, month, day, hour, minute, second, sign, offset_hours, offset_minutes = match.groups()
+    offset_seconds = int(offset_hours) * 3600 + int(offset_minutes) * 60
+    if sign == "-":
+        offset_seconds = -offset_seconds
+
+    return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                             tzinfo=get_timezone(offset_seconds))
+
+
+def parse_git_date(date_string):
+    """
+    Memoized version of parse_git_date_uncached.
+    :param date_string: Date as string.
+    :return: Date as a datetime.
+    """
+    return git_date_cache.get(date_string, parse_git_date_uncached)
+
+
+def from_timestamp_uncached(timestamp):
+    """
+    Converts a timestamp in seconds to a datetime on the local timezone.
+    :param timestamp: Timestamp in seconds.
+    :return: Date as a datetime.
+    """
+    return datetime.datetime.fromtimestamp(timestamp, tz=LOCAL_TIMEZONE)
+
+
+def from_timestamp(timestamp):
+    """
+    Memoized version of from_timestamp_uncached.
+    :param timestamp: Timestamp in seconds.
+    :return: Date as a datetime.
+    """
+    return timestamp_cache.get(timestamp, from_timestamp_uncached)
+
+
+def from_timestamp_ms(timestamp):
+    """
+    Converts a JIRA timestamp, in milliseconds, to a datetime on the local timezone.
+    :param timestamp: Timestamp in milliseconds.
+    :return: Date as a datetime.
+    """
+    return from_timestamp(timestamp / 1000)
+
+
+def git_dates_to_datetime(date_series):
+    """
+    Vectorized conversion of a series of Git dates in %ai format. The local time and the UTC offset are parsed
+    apart, and the offset subtracted.
+    :param date_series: Series of strings.
+    :return: Series of datetimes in UTC.
+    """
+    date_series = date_series.str.strip()
+    local_dates = pd.to_datetime(date_series.str[:19], format=GIT_LOCAL_DATE_FORMAT)
+
+    offsets = date_series.str[-5:]
+    offset_seconds = offsets.str[1:3].astype(int) * 3600 + offsets.str[3:5].astype(int) * 60
+    offset_seconds = offset_seconds.where(offsets.str[0] != "-", -offset_seconds)
+
+    return (local_dates - pd.to_timedelta(offset_seconds, unit='s')).dt.tz_localize('UTC')
+
+
+def timestamps_ms_to_datetime(timestamp_series):
+    """
+    Vectorized conversion of a series of JIRA timestamps, in milliseconds.
+    :param timestamp_series: Series of timestamps.
+    :return: Series of datetimes in UTC.
+    """
+    return pd.to_datetime(timestamp_series, unit='ms', utc=True)
+
+
+def benchmark(repetitions=100000):
+    """
+    Compares the conversions of this module against dateutil.parser.parse and datetime.fromtimestamp.
+    :param repetitions: Number of conversions per measurement.
+    :return: None.
+    """
+    date_strings = ["2016-03-%02d 10:35:21 %s" % (day % 28 + 1, ["-0300", "+0000", "+0530"][day % 3])
+                    for day in range(100)]
+    timestamps = [1458049000000 + day * 86400000 for day in range(100)]
+    calls = [date_strings[index % len(date_strings)] for index in range(repetitions)]
+    timestamp_calls = [timestamps[index % len(timestamps)] for index in range(repetitions)]
+
+    for date_string in date_strings:
+        assert parse_git_date(date_string) == dateutil.parser.parse(date_string)
+    assert git_dates_to_datetime(pd.Series(date_strings)).tolist() == [parse_git_date(date_string)
+                                                                       for date_string in date_strings]
+
+    measurements = [
+        ("dateutil.parser.parse", lambda: [dateutil.parser.parse(value) for value in calls]),
+        ("parse_git_date_uncached", lambda: [parse_git_date_uncached(value) for value in calls]),
+        ("parse_git_date", lambda: [parse_git_date(value) for value in calls]),
+        ("git_dates_to_datetime", lambda: git_dates_to_datetime(pd.Series(calls))),
+        ("datetime.fromtimestamp", lambda: [datetime.datetime.fromtimestamp(value / 1000, tz=tzlocal())
+                                            for value in timestamp_calls]),
+        ("from_timestamp_ms", lambda: [from_timestamp_ms(value) for value in timestamp_calls]),
+        ("timestamps_ms_to_datetime", lambda: timestamps_ms_to_datetime(pd.Series(timestamp_calls)))]
+
+    for name, function in measurements:
+        seconds = min(timeit.repeat(function, number=1, repeat=3))
+        print name, ": ", seconds, " seconds for ", repetitions, " conversions"
+
+
+if __name__ == "__main__":
+    benchmark()
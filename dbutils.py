@@ -2,23 +2,150 @@
 Module that contain utilities for dealing with sqlite databases..
 """
 
+import os
+import re
+import shutil
 import sqlite3
+import tempfile
+import threading
+import urllib
 
+import instrumentation
 
-def execute_query(sql_query, parameters, db_file):
+READ_ONLY_MMAP_SIZE = 1 << 30
+READ_ONLY_CACHE_SIZE_KB = 256 * 1024
+# Seconds a connection waits for the lock of a database written by another pipeline stage, instead of failing with
+# "database is locked".
+BUSY_TIMEOUT = 300
+
+INSERT_TABLE_REGEX = re.compile(r"^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+(\w+)", re.IGNORECASE)
+
+read_only_connections = threading.local()
+row_counters = threading.local()
+row_counter_lock = threading.Lock()
+uri_support = []
+
+
+def execute_query(sql_query, parameters, db_file, row_factory=None):
     """
     Executes a query on the database
     :param sql_query: SQL Query
     :param parameters: Parameters for the query
     :param db_file: File of the SQLite database
+    :param row_factory: Function mapping each row, e.g. records.Version.row_factory. By default, rows are tuples.
     :return: Query results as a List
     """
-    connection = sqlite3.connect(db_file)
+    start_time = instrumentation.start()
+    connection = connect(db_file)
     cursor = connection.cursor()
+    cursor.row_factory = row_factory
 
     cursor.execute(sql_query, parameters)
     results = cursor.fetchall()
     connection.close()
+    instrumentation.record(instrumentation.SQL_CATEGORY, sql_query, start_time, len(results))
+
+    return results
+
+
+def connect(db_file):
+    """
+    Opens a connection that waits up to BUSY_TIMEOUT seconds for the database lock.
+    :param db_file: File of the SQLite database.
+    :return: Connection.
+    """
+    return sqlite3.connect(db_file, timeout=BUSY_TIMEOUT)
+
+
+def is_uri_supported():
+    """
+    Checks, once per process, if the SQLite library interprets URI file names. If not, a URI would be used as a
+    plain file name.
+    :return: True if URI file names are supported.
+    """
+    if not uri_support:
+        directory = tempfile.mkdtemp()
+        try:
+            db_file = os.path.join(directory, "uri_check.db")
+            sqlite3.connect(db_file).close()
+
+            try:
+                connection = sqlite3.connect(get_read_only_uri(db_file))
+                database_files = [database[2] for database in connection.execute("PRAGMA database_list")]
+                connection.close()
+
+                uri_support.append(os.path.realpath(db_file) in [os.path.realpath(name) for name in database_files])
+            except sqlite3.OperationalError:
+                # Without URI support, the name is a file in a directory "file:..." that doesn't exist.
+                uri_support.append(False)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return uri_support[0]
+
+
+def get_read_only_uri(db_file):
+    return "file:" + urllib.pathname2url(os.path.abspath(db_file)) + "?mode=ro&immutable=1"
+
+
+def get_read_only_connection(db_file):
+    """
+    Returns a connection to a database that is never modified while the process runs. The database is opened in
+    read-only, immutable mode, so SQLite doesn't lock or check the file for changes, and it's read through
+    memory-mapped I/O, so processes reading the same file share the OS page cache. Connections are reused per
+    process and thread.
+    :param db_file: File of the SQLite database.
+    :return: Connection.
+    """
+    connections = getattr(read_only_connections, "connections", None)
+    if connections is None or read_only_connections.pid != os.getpid():
+        connections = read_only_connections.connections = {}
+        read_only_connections.pid = os.getpid()
+
+    if db_file not in connections:
+        if is_uri_supported():
+            connection = sqlite3.connect(get_read_only_uri(db_file))
+        else:
+            connection = connect(db_file)
+            connection.execute("PRAGMA query_only = ON")
+
+        connection.execute("PRAGMA mmap_size = %d" % READ_ONLY_MMAP_SIZE)
+        connection.execute("PRAGMA cache_size = -%d" % READ_ONLY_CACHE_SIZE_KB)
+        connections[db_file] = connection
+
+    return connections[db_file]
+
+
+def close_read_only_connections():
+    """
+    Closes the read-only connections of the current thread.
+    :return: None.
+    """
+    connections = getattr(read_only_connections, "connections", None)
+    if connections and read_only_connections.pid == os.getpid():
+        for connection in connections.values():
+            connection.close()
+    read_only_connections.connections = {}
+    read_only_connections.pid = os.getpid()
+
+
+def execute_read_only_query(sql_query, parameters, db_file, row_factory=None):
+    """
+    Executes a query on a read-only database, reusing its connection.
+    :param sql_query: SQL Query
+    :param parameters: Parameters for the query
+    :param db_file: File of the SQLite database
+    :param row_factory: Function mapping each row, e.g. records.Version.row_factory. By default, rows are tuples.
+    :return: Query results as a List
+    """
+    start_time = instrumentation.start()
+    cursor = get_read_only_connection(db_file).cursor()
+    cursor.row_factory = row_factory
+
+    cursor.execute(sql_query, parameters)
+    results = cursor.fetchall()
+    cursor.close()
+    instrumentation.record(instrumentation.SQL_CATEGORY, sql_query, start_time, len(results))
 
     return results
 
@@ -31,7 +158,7 @@ def create_schema(table_list, db_file):
     :return: None
     """
     print "Starting schema creation ..."
-    connection = sqlite3.connect(db_file)
+    connection = connect(db_file)
     cursor = connection.cursor()
 
     for table_ddl in table_list:
@@ -51,11 +178,44 @@ def load_list(sql_insert, row_list, db_file):
     :param row_list: List containing tuples with tag information.
     :return: None.
     """
-    connection = sqlite3.connect(db_file)
+    start_time = instrumentation.start()
+    connection = connect(db_file)
     cursor = connection.cursor()
 
     for row in row_list:
         cursor.execute(sql_insert, row)
 
     connection.commit()
+    count_written_rows(sql_insert, connection.total_changes)
     connection.close()
+    instrumentation.record(instrumentation.SQL_CATEGORY, sql_insert, start_time, len(row_list))
+
+
+def set_row_counter(row_counter):
+    """
+    Starts or stops counting the rows inserted by load_list on the current thread.
+    :param row_counter: collections.Counter of the rows written per table, or None to stop counting.
+    :return: None.
+    """
+    row_counters.counter = row_counter
+
+
+def get_row_counter():
+    return getattr(row_counters, 'counter', None)
+
+
+def count_written_rows(sql_insert, written_rows):
+    """
+    Adds the rows written by an insert statement to the row counter of the current thread, if any. Rows skipped by
+    INSERT OR IGNORE are not counted, while rows overwritten by INSERT OR REPLACE are.
+    :param sql_insert: SQL for inserting a row.
+    :param written_rows: Rows written.
+    :return: None.
+    """
+    row_counter = get_row_counter()
+    table_match = INSERT_TABLE_REGEX.match(sql_insert)
+    if row_counter is None or not table_match:
+        return
+
+    with row_counter_lock:
+        row_counter[table_match.group(1)] += written_rows
@@ -0,0 +1,170 @@
+"""
+Write stage for the miners and the loader: rows are handed to a writer thread through a bounded queue, so fetching
+(API pages, git subprocesses) doesn't wait for SQLite. The writer groups consecutive rows for the same load
+function into large transactions.
+"""
+
+import Queue
+import atexit
+import threading
+import time
+
+import dbutils
+
+MAX_QUEUE_SIZE = 1000
+BATCH_SIZE = 5000
+FLUSH_INTERVAL = 1.0
+PUT_TIMEOUT = 1.0
+
+STOP = None
+
+open_writers = set()
+
+
+class QueuedWriter(object):
+    """
+    Writer thread draining a bounded queue of (load function, rows) items, e.g. (gdata.load_commits, commit_list).
+    When the queue is full, write() blocks until the writer catches up. Pending rows are flushed on close(), which
+    is also called when leaving a with block and at exit. Written rows go to the row counter of the thread that
+    created the writer (dbutils.set_row_counter).
+    """
+
+    def __init__(self, max_queue_size=MAX_QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.queue = Queue.Queue(max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.error = None
+        self.thread = None
+        self.row_counter = dbutils.get_row_counter()
+
+        self.items = 0
+        self.rows = 0
+        self.transactions = 0
+        self.write_time = 0.0
+        self.max_write_time = 0.0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.blocked_time = 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        open_writers.add(self)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close(raise_error=exc_type is None)
+
+    def write(self, load_function, rows):
+        """
+        Queues rows for writing.
+        :param load_function: Function that inserts a list of rows, e.g. gjdata.insert_git_commits.
+        :param rows: List of row tuples.
+        :return: None.
+        """
+        if not rows:
+            return
+
+        depth = self.queue.qsize()
+        self.items += 1
+        self.max_depth = max(self.max_depth, depth)
+        self.total_depth += depth
+
+        start_time = time.time()
+        while True:
+            self.check_error()
+            try:
+                self.queue.put((load_function, list(rows)), timeout=PUT_TIMEOUT)
+                break
+            except Queue.Full:
+                pass
+        self.blocked_time += time.time() - start_time
+
+    def check_error(self):
+        if self.error:
+            raise RuntimeError("The writer thread failed: " + self.error)
+
+    def close(self, raise_error=True):
+        """
+        Writes the pending rows and stops the writer thread.
+        :param raise_error: If True, a failure of the writer thread is raised here.
+        :return: None.
+        """
+        if self.thread is None:
+            return
+
+        self.queue.put(STOP)
+        self.thread.join()
+        self.thread = None
+        open_writers.discard(self)
+
+        print "Writer closed. ", self
+        if raise_error:
+            self.check_error()
+        elif self.error:
+            print "The writer thread failed: ", self.error
+
+    def flush(self, load_function, rows):
+        if not rows or self.error:
+            return
+
+        start_time = time.time()
+        try:
+            load_function(rows)
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+            return
+
+        write_time = time.time() - start_time
+        self.rows += len(rows)
+        self.transactions += 1
+        self.write_time += write_time
+        self.max_write_time = max(self.max_write_time, write_time)
+
+    def run(self):
+        dbutils.set_row_counter(self.row_counter)
+        load_function, rows = None, []
+        deadline = None
+
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                item = self.queue.get(timeout=timeout)
+            except Queue.Empty:
+                self.flush(load_function, rows)
+                load_function, rows, deadline = None, [], None
+                continue
+
+            if item is STOP:
+                break
+
+            item_function, item_rows = item
+            if item_function is not load_function:
+                self.flush(load_function, rows)
+                load_function, rows, deadline = item_function, [], time.time() + self.flush_interval
+
+            rows.extend(item_rows)
+
+            # With a steady stream of items the get() above never times out, so the deadline is checked here too.
+            if len(rows) >= self.batch_size or time.time() >= deadline:
+                self.flush(load_function, rows)
+                load_function, rows, deadline = None, [], None
+
+        self.flush(load_function, rows)
+
+    def __str__(self):
+        return "%d rows in %d transactions. Write time: %.3f seconds (max %.3f). Queue depth: max %d, mean %.1f. " \
+               "Producer blocked %.3f seconds." % (self.rows, self.transactions, self.write_time,
+                                                    self.max_write_time, self.max_depth,
+                                                    self.total_depth / float(self.items or 1), self.blocked_time)
+
+
+@atexit.register
+def close_open_writers():
+    for writer in list(open_writers):
+        writer.close(raise_error=False)
@@ -5,16 +5,16 @@ Handles the storage of Github information on a database
 import dbutils
 
 DATABASE_FILE = "github.sqlite"
-TAG_DDL = "CREATE TABLE release_tag " \
+TAG_DDL = "CREATE TABLE IF NOT EXISTS release_tag " \
           "(repository TEXT, name TEXT, zipball_url TEXT, tarball_url TEXT, commit_sha TEXT ," \
           " commit_url TEXT, PRIMARY KEY (repository, name))"
-COMMIT_DLL = "CREATE TABLE github_commit " \
+COMMIT_DLL = "CREATE TABLE IF NOT EXISTS github_commit " \
              "(repository TEXT, sha TEXT, commit_author_name TEXT, commit_author_mail TEXT, commit_author_date TEXT, " \
              "commit_committer_name TEXT, commit_committer_mail TEXT, commit_committer_date TEXT, " \
              "commit_message TEXT, commit_tree_sha TEXT, commit_tree_url TEXT, commit_comment_count INTEGER," \
              "url TEXT PRIMARY KEY, html_url TEXT, comments_url TEXT, stats_total INTEGER, stats_additions INTEGER, " \
              "stats_deletions INTEGER)"
-COMPARE_DDL = "CREATE TABLE git_compare " \
+COMPARE_DDL = "CREATE TABLE IF NOT EXISTS git_compare " \
               "(repository TEXT, first_object TEXT, second_object TEXT, commit_url TEXT)"
 
 TABLE_LIST = [TAG_DDL,
@@ -22,6 +22,14 @@ TABLE_LIST = [TAG_DDL,
               COMPARE_DDL]
 
 
+def create_schema():
+    """
+    Creates the tables for storing the GitHub information, if they don't exist.
+    :return: None
+    """
+    dbutils.create_schema(TABLE_LIST, DATABASE_FILE)
+
+
 def load_compares(compare_list):
     """
     Inserts a list of comparisons into the database
@@ -88,6 +96,26 @@ def get_commits_by_repository(repository_name):
     return dbutils.execute_query(commit_sql, (repository_name,), DATABASE_FILE)
 
 
+def get_commit_urls(repository_name):
+    """
+    Returns the URLs of the commits stored for a repository.
+    :param repository_name: Repository name.
+    :return: Set of commit URLs.
+    """
+    commit_sql = "SELECT url FROM github_commit WHERE repository=?"
+    return set(row[0] for row in dbutils.execute_query(commit_sql, (repository_name,), DATABASE_FILE))
+
+
+def get_compares_by_repository(repository_name):
+    """
+    Returns the compares stored for a repository.
+    :param repository_name: Repository name.
+    :return: List of compare information.
+    """
+    compare_sql = "SELECT * FROM git_compare WHERE repository=?"
+    return dbutils.execute_query(compare_sql, (repository_name,), DATABASE_FILE)
+
+
 def get_commit_by_url(commit_url):
     """
     Returns a commit related to its URL
@@ -125,4 +153,4 @@ def get_repository_tags(repository_name):
 
 
 if __name__ == "__main__":
-    dbutils.create_schema(TABLE_LIST, DATABASE_FILE)
+    create_schema()
@@ -0,0 +1,153 @@
+"""
+Shared GitHub API budget for concurrent miners: a global cap on requests in flight, and a single view of the rate
+limit, so that workers wait for the reset instead of exhausting it.
+"""
+
+import os
+import threading
+import time
+
+RATE_LIMIT_RESERVE = 10
+MAX_CONCURRENT_REQUESTS = 8
+DEFAULT_RESET_WAIT = 60
+
+REMAINING_HEADER = "x-ratelimit-remaining"
+RESET_HEADER = "x-ratelimit-reset"
+
+TOKEN_VARIABLE = "GITHUB_TOKEN"
+
+
+def get_github_token():
+    """
+    Returns the GitHub token of the local config module. Without one, e.g. in tests against mockgithub, the token is
+    read from the GITHUB_TOKEN environment variable, and requests are anonymous if it's not set.
+    :return: Token, or None.
+    """
+    try:
+        import config
+    except ImportError:
+        return os.environ.get(TOKEN_VARIABLE)
+
+    return config.get_github_token()
+
+
+class RateLimitBudget(object):
+    """
+    Rate limit budget shared by every thread making GitHub requests. Each request calls acquire() before being sent
+    and release() with the response headers afterwards.
+    """
+
+    def __init__(self, reserve=RATE_LIMIT_RESERVE, max_concurrent_requests=MAX_CONCURRENT_REQUESTS):
+        self.reserve = reserve
+        self.semaphore = threading.BoundedSemaphore(max_concurrent_requests)
+        self.lock = threading.Lock()
+
+        self.remaining = None
+        self.reset_time = None
+
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def get_wait(self):
+        """
+        Seconds to wait before the next request. Requests in flight are already discounted from the remaining budget.
+        """
+        if self.remaining is None or self.remaining > self.reserve:
+            return 0.0
+        return max(0.0, (self.reset_time or 0) - time.time())
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait = self.get_wait()
+                if wait <= 0:
+                    if self.remaining is not None:
+                        if self.reset_time is not None and time.time() >= self.reset_time:
+                            self.remaining = None
+                        else:
+                            self.remaining -= 1
+                    self.requests += 1
+                    break
+
+                self.waits += 1
+                self.wait_time += wait
+
+            print "GitHub rate limit budget exhausted. Waiting ", int(wait), " seconds for the reset."
+            time.sleep(wait + 1)
+
+        self.semaphore.acquire()
+
+    def release(self, headers=None):
+        """
+        Ends a request, updating the budget with the rate limit headers of the response.
+        :param headers: Response headers, with lowercase names.
+        :return: None.
+        """
+        self.semaphore.release()
+        if not headers or REMAINING_HEADER not in headers:
+            return
+
+        remaining = int(headers[REMAINING_HEADER])
+        reset_time = int(headers.get(RESET_HEADER, 0)) or None
+
+        with self.lock:
+            if self.remaining is None or reset_time != self.reset_time:
+                self.remaining = remaining
+            else:
+                self.remaining = min(self.remaining, remaining)
+            self.reset_time = reset_time
+
+    def exhausted(self, reset_time=None):
+        """
+        Registers that GitHub rejected a request for exceeding the rate limit.
+        :param reset_time: Reset timestamp, if known.
+        :return: None.
+        """
+        with self.lock:
+            self.remaining = 0
+            self.reset_time = reset_time or self.reset_time or time.time() + DEFAULT_RESET_WAIT
+
+    def __str__(self):
+        return "%d requests, %d waits (%.1f seconds). Remaining: %s" % (self.requests, self.waits, self.wait_time,
+                                                                         self.remaining)
+
+
+budget = None
+
+
+def use_budget(rate_limit_budget):
+    """
+    Makes every PyGithub request go through a budget.
+    :param rate_limit_budget: RateLimitBudget instance, or None to stop using it.
+    :return: None.
+    """
+    global budget
+    budget = rate_limit_budget
+
+    from github.GithubException import RateLimitExceededException
+    from github.Requester import Requester
+
+    request_json = Requester.requestJsonAndCheck
+    if getattr(request_json, "budgeted", False):
+        return
+
+    def budgeted_request_json(self, *args, **kwargs):
+        while True:
+            current_budget = budget
+            if current_budget is None:
+                return request_json(self, *args, **kwargs)
+
+            current_budget.acquire()
+            headers = None
+            try:
+                result = request_json(self, *args, **kwargs)
+                headers = result[0]
+                return result
+            except RateLimitExceededException:
+                current_budget.exhausted(self.rate_limiting_resettime)
+            finally:
+                current_budget.release(headers)
+
+    budgeted_request_json.budgeted = True
+    Requester.requestJsonAndCheck = budgeted_request_json
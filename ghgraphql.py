@@ -0,0 +1,132 @@
+"""
+GraphQL commit hydration for the GitHub miners. Commit lists, compares and tags come from the REST API without
+stats, so ghraw fetches each commit on its own. Here the missing details of up to BATCH_SIZE commits are requested
+in a single GraphQL query, and mapped to the same github_commit tuples.
+"""
+
+import datetime
+
+import gminer
+import ghraw
+
+GRAPHQL_PATH = "/graphql"
+BATCH_SIZE = 100
+ALIAS_PREFIX = "c"
+
+COMMIT_SELECTION = ("... on Commit { oid message additions deletions url "
+                    "author { name email date } committer { name email date } tree { oid } }")
+
+def to_utc_date_string(git_timestamp):
+    """
+    Converts a GraphQL GitTimestamp, which keeps the offset of the committer (e.g. 2010-01-29T11:48:09-08:00), to
+    the UTC date string the REST backends store.
+    """
+    if git_timestamp is None:
+        return str(None)
+
+    date = datetime.datetime.strptime(git_timestamp[:19], "%Y-%m-%dT%H:%M:%S")
+    offset = git_timestamp[19:]
+    if offset and offset != "Z":
+        sign = -1 if offset[0] == "-" else 1
+        hours, minutes = offset[1:].split(":")
+        date -= sign * datetime.timedelta(hours=int(hours), minutes=int(minutes))
+
+    return date.strftime(gminer.DATE_FORMAT)
+
+
+# github_commit columns after the repository name, as paths in the GraphQL commit node. The REST URLs are added to
+# the node by add_rest_urls.
+GRAPHQL_COMMIT_FIELDS = [(("oid",), None),
+                         (("author", "name"), None),
+                         (("author", "email"), None),
+                         (("author", "date"), to_utc_date_string),
+                         (("committer", "name"), None),
+                         (("committer", "email"), None),
+                         (("committer", "date"), to_utc_date_string),
+                         (("message",), None),
+                         (("tree", "oid"), None),
+                         (("treeUrl",), None),
+                         (None, 0),
+                         (("apiUrl",), None),
+                         (("url",), None),
+                         (("commentsUrl",), None),
+                         (("total",), None),
+                         (("additions",), None),
+                         (("deletions",), None)]
+
+extract_commit = ghraw.compile_extractor(GRAPHQL_COMMIT_FIELDS)
+
+
+def get_commits_query(repository_name, commit_shas):
+    """
+    Builds a query for several commits of a repository, one aliased object lookup per SHA.
+    :param repository_name: Repository name.
+    :param commit_shas: Commit SHAs.
+    :return: GraphQL query.
+    """
+    lookups = " ".join('%s%d: object(oid: "%s") { %s }' % (ALIAS_PREFIX, index, sha, COMMIT_SELECTION)
+                       for index, sha in enumerate(commit_shas))
+    return 'query { repository(owner: "%s", name: "%s") { %s } }' % (gminer.APACHE_USER, repository_name, lookups)
+
+
+def add_rest_urls(client, repository_name, node):
+    """
+    Adds to a commit node the REST URLs and the stats total, which GraphQL doesn't provide. The API URL identifies
+    commits on the database, so it must be the one the REST backends store.
+    """
+    repository_url = client.get_url(client.get_repository_path(repository_name))
+    node['apiUrl'] = repository_url + "/commits/" + node['oid']
+    node['treeUrl'] = repository_url + "/git/trees/" + node['tree']['oid']
+    node['commentsUrl'] = node['apiUrl'] + "/comments"
+    node['total'] = node['additions'] + node['deletions']
+    return node
+
+
+def hydrate_commits(client, repository_name, commits):
+    """
+    Maps commits from lists, compares or tags to github_commit tuples, with one GraphQL request per BATCH_SIZE
+    commits. It can replace ghraw.get_commit_tuples on the ghraw mining stages.
+    :param client: RawGitHubClient instance.
+    :param repository_name: Repository name.
+    :param commits: Commit JSON objects. Only their sha is required.
+    :return: List of tuples, in the order of the commits.
+    """
+    commit_list = []
+    for start in range(0, len(commits), BATCH_SIZE):
+        batch_shas = [commit['sha'] for commit in commits[start:start + BATCH_SIZE]]
+        _, response = client.post(GRAPHQL_PATH, {'query': get_commits_query(repository_name, batch_shas)})
+
+        if response.get('errors'):
+            raise ValueError("GraphQL query failed for repository " + repository_name + ": " +
+                             "; ".join(error.get('message', "") for error in response['errors']))
+
+        nodes = response['data']['repository']
+        for index, sha in enumerate(batch_shas):
+            node = nodes.get(ALIAS_PREFIX + str(index))
+            if node is None:
+                raise ValueError("Commit " + sha + " not found on repository " + repository_name)
+            commit_list.append(extract_commit(repository_name, add_rest_urls(client, repository_name, node)))
+
+    return commit_list
+
+
+MINING_STAGES = [("tags", lambda client, repository_name, release_regex: ghraw.store_repository_tags(
+                      client, repository_name)),
+                 ("tag_commits", lambda client, repository_name, release_regex: ghraw.store_commits_per_tag(
+                     client, repository_name, hydrate_commits)),
+                 ("compares", lambda client, repository_name, release_regex: ghraw.store_commits_between_tags(
+                     client, repository_name, release_regex, hydrate_commits)),
+                 ("commits", lambda client, repository_name, release_regex: ghraw.store_repository_commits(
+                     client, repository_name, hydrate_commits))]
+
+
+def mine_repository(repository_name, release_regex, stage_names, base_url=gminer.GITHUB_API_URL):
+    """
+    Runs the mining stages on a repository, hydrating commits through GraphQL. Same contract as
+    gminer.mine_repository.
+    """
+    client = ghraw.get_client(base_url)
+    for stage_name, stage_function in MINING_STAGES:
+        if stage_name in stage_names:
+            print "Mining ", stage_name, " for repository ", repository_name
+            stage_function(client, repository_name, release_regex)
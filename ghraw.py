@@ -0,0 +1,315 @@
+"""
+Raw-JSON backend for the GitHub miners. Pages of the list, commit and compare endpoints are fetched as JSON and
+mapped straight to gdata tuples, without building PyGithub objects. Its output matches the one of gminer.
+"""
+
+import json
+import operator
+import time
+import urllib2
+
+import catalog
+import gdata
+import ghclient
+import gminer
+import instrumentation
+
+ACCEPT_HEADER = "application/vnd.github.v3+json"
+COMMIT_BUFFER_SIZE = 500
+
+
+def to_date_string(iso_date):
+    """
+    Converts an API date (e.g. 2010-01-29T11:48:09Z) to the format PyGithub dates have once converted to string.
+    """
+    if iso_date is None:
+        return str(None)
+    return iso_date[:10] + " " + iso_date[11:19]
+
+
+# github_commit columns after the repository name, as paths in the commit JSON and a conversion to apply.
+COMMIT_FIELDS = [(("sha",), None),
+                 (("commit", "author", "name"), None),
+                 (("commit", "author", "email"), None),
+                 (("commit", "author", "date"), to_date_string),
+                 (("commit", "committer", "name"), None),
+                 (("commit", "committer", "email"), None),
+                 (("commit", "committer", "date"), to_date_string),
+                 (("commit", "message"), None),
+                 (("commit", "tree", "sha"), None),
+                 (("commit", "tree", "url"), None),
+                 (None, 0),
+                 (("url",), None),
+                 (("html_url",), None),
+                 (("comments_url",), None),
+                 (("stats", "total"), None),
+                 (("stats", "additions"), None),
+                 (("stats", "deletions"), None)]
+
+
+def chain_getters(outer_getter, inner_getter):
+    return lambda item: inner_getter(outer_getter(item))
+
+
+def compile_field(path, conversion):
+    """
+    Builds, once, a function returning a field of a JSON object, from a chain of operator.itemgetter.
+    :param path: Tuple of keys, or None for a constant field.
+    :param conversion: Function applied to the value, None to keep it as it is, or the value of a constant field.
+    :return: Function receiving the JSON object.
+    """
+    if path is None:
+        return lambda item: conversion
+
+    getter = operator.itemgetter(path[0])
+    for key in path[1:]:
+        getter = chain_getters(getter, operator.itemgetter(key))
+
+    if conversion is None:
+        return getter
+    return lambda item: conversion(getter(item))
+
+
+def compile_extractor(fields):
+    """
+    Builds, once, a function that maps a JSON object to a tuple, with one field function per column.
+    :param fields: List of (key path, conversion) tuples. A None path means the conversion is a constant value.
+    :return: Function receiving the repository name and the JSON object.
+    """
+    field_functions = [compile_field(path, conversion) for path, conversion in fields]
+
+    def extract(repository_name, item):
+        return tuple([repository_name] + [field_function(item) for field_function in field_functions])
+
+    return extract
+
+
+extract_commit = compile_extractor(COMMIT_FIELDS)
+
+
+class RawGitHubClient(object):
+    """
+    Minimal GitHub API client returning decoded JSON. Requests go through the ghclient budget, if one is in use,
+    and are recorded by the instrumentation module.
+    """
+
+    def __init__(self, base_url=gminer.GITHUB_API_URL, token=None, per_page=gminer.PER_PAGE):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.per_page = per_page
+        self.requests = 0
+
+    def get_url(self, path):
+        return path if path.startswith("http") else self.base_url + path
+
+    def get(self, path):
+        """
+        Fetches an API URL.
+        :param path: Path, relative to the base URL, or absolute URL.
+        :return: Response headers, with lowercase names, and decoded JSON.
+        """
+        return self.request("GET", path)
+
+    def post(self, path, payload):
+        """
+        Sends a JSON payload to an API URL, e.g. a GraphQL query.
+        :param path: Path, relative to the base URL, or absolute URL.
+        :param payload: Object to send as JSON.
+        :return: Response headers, with lowercase names, and decoded JSON.
+        """
+        return self.request("POST", path, json.dumps(payload))
+
+    def request(self, verb, path, body=None):
+        request = urllib2.Request(self.get_url(path), body, headers={"Accept": ACCEPT_HEADER})
+        if body is not None:
+            request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("Authorization", "token " + self.token)
+
+        while True:
+            budget = ghclient.budget
+            if budget:
+                budget.acquire()
+
+            headers = None
+            start_time = instrumentation.start()
+            try:
+                self.requests += 1
+                response = urllib2.urlopen(request)
+                headers = dict((name.lower(), value) for name, value in response.info().items())
+                data = json.load(response)
+                instrumentation.record(instrumentation.GITHUB_CATEGORY,
+                                       instrumentation.get_github_label(verb, request.get_full_url()), start_time,
+                                       len(data) if isinstance(data, list) else 1)
+                return headers, data
+            except urllib2.HTTPError as error:
+                headers = dict((name.lower(), value) for name, value in error.info().items())
+                if not (budget and error.code == 403 and headers.get(ghclient.REMAINING_HEADER) == "0"):
+                    raise
+
+                budget.exhausted(int(headers.get(ghclient.RESET_HEADER, 0)) or None)
+                headers = None
+            finally:
+                if budget:
+                    budget.release(headers)
+
+    def get_pages(self, path):
+        """
+        Iterates over every item of a paginated list, following the Link headers.
+        :param path: Path of the list.
+        :return: Generator of JSON objects.
+        """
+        url = self.get_url(path) + ("&" if "?" in path else "?") + "per_page=%d" % self.per_page
+        while url:
+            headers, items = self.get(url)
+            for item in items:
+                yield item
+            url = get_next_page(headers.get("link"))
+
+    def get_repository_path(self, repository_name):
+        return "/repos/" + gminer.APACHE_USER + "/" + repository_name
+
+
+def get_next_page(link_header):
+    if not link_header:
+        return None
+
+    for link in link_header.split(","):
+        url, _, relation = link.partition(";")
+        if 'rel="next"' in relation:
+            return url.strip()[1:-1]
+
+    return None
+
+
+def get_client(base_url=gminer.GITHUB_API_URL):
+    return RawGitHubClient(base_url, ghclient.get_github_token())
+
+
+def get_commit_tuple(client, repository_name, commit):
+    """
+    Maps a commit to a github_commit tuple. Commits from lists and compares have no stats, so their details are
+    fetched first.
+    """
+    if "stats" not in commit:
+        _, commit = client.get(commit['url'])
+    return extract_commit(repository_name, commit)
+
+
+def get_commit_tuples(client, repository_name, commits):
+    """
+    Maps commits from lists, compares or tags to github_commit tuples, fetching their details one by one.
+    :param client: RawGitHubClient instance.
+    :param repository_name: Repository name.
+    :param commits: Commit JSON objects. Only their sha and url are required.
+    :return: List of tuples.
+    """
+    return [get_commit_tuple(client, repository_name, commit) for commit in commits]
+
+
+def store_repository_tags(client, repository_name):
+    print "Getting tags from GitHub for repository " + repository_name
+    tag_list = [(repository_name, tag['name'], tag['zipball_url'], tag['tarball_url'], tag['commit']['sha'],
+                 tag['commit']['url']) for tag in
+                client.get_pages(client.get_repository_path(repository_name) + "/tags")]
+
+    print "Writing tags into database for repository " + repository_name
+    gdata.load_tags(tag_list)
+
+
+def store_commits_per_tag(client, repository_name, hydrate_function=get_commit_tuples):
+    commit_sha_index = 4
+    commit_url_index = 5
+    stored_tags = gdata.get_repository_tags(repository_name)
+
+    print "Getting commits from GitHub for repository " + repository_name
+    commit_list = hydrate_function(client, repository_name, [{'sha': tag[commit_sha_index],
+                                                              'url': tag[commit_url_index]} for tag in stored_tags])
+
+    print "Writing commmits into database for repository " + repository_name
+    gdata.load_commits(commit_list)
+
+
+def store_commits_between_tags(client, repository_name, release_regex=gminer.RELEASE_REGEX,
+                               hydrate_function=get_commit_tuples):
+    tag_name_index = 0
+    release_matcher = catalog.get_release_matcher(release_regex)
+    tags_and_dates = release_matcher.filter_tags(gdata.get_tags_and_dates(repository_name), tag_name_index)
+    tags_and_dates = sorted(tags_and_dates, key=lambda tag: tag[tag_name_index], reverse=True)
+
+    for index, current_tag in enumerate(tags_and_dates):
+        tag_name = current_tag[tag_name_index]
+        if release_matcher.is_release(tag_name) and (index + 1) < len(tags_and_dates):
+            previous_tag = tags_and_dates[index + 1]
+
+            print "Getting commits between ", previous_tag[tag_name_index], " and ", tag_name
+            _, comparison = client.get(client.get_repository_path(repository_name) + "/compare/" +
+                                       previous_tag[tag_name_index] + "..." + tag_name)
+            commit_list = hydrate_function(client, repository_name, comparison['commits'])
+
+            url_index = 12
+            compare_list = [(repository_name, previous_tag[tag_name_index], tag_name, commit[url_index])
+                            for commit in commit_list]
+
+            gdata.load_commits(commit_list)
+            gdata.load_compares(compare_list)
+
+
+def store_repository_commits(client, repository_name, hydrate_function=get_commit_tuples):
+    print "Getting commits from GitHub from repository " + repository_name
+
+    pending_commits = []
+    for commit in client.get_pages(client.get_repository_path(repository_name) + "/commits"):
+        if len(gdata.get_commit_by_url(commit['url'])) > 0:
+            continue
+
+        pending_commits.append(commit)
+        if len(pending_commits) == COMMIT_BUFFER_SIZE:
+            gdata.load_commits(hydrate_function(client, repository_name, pending_commits))
+            pending_commits = []
+
+    gdata.load_commits(hydrate_function(client, repository_name, pending_commits))
+
+
+MINING_STAGES = [("tags", lambda client, repository_name, release_regex: store_repository_tags(
+                      client, repository_name)),
+                 ("tag_commits", lambda client, repository_name, release_regex: store_commits_per_tag(
+                     client, repository_name)),
+                 ("compares", lambda client, repository_name, release_regex: store_commits_between_tags(
+                     client, repository_name, release_regex)),
+                 ("commits", lambda client, repository_name, release_regex: store_repository_commits(
+                     client, repository_name))]
+
+
+def mine_repository(repository_name, release_regex, stage_names, base_url=gminer.GITHUB_API_URL):
+    """
+    Runs the mining stages on a repository using the raw-JSON client. Same contract as gminer.mine_repository.
+    """
+    client = get_client(base_url)
+    for stage_name, stage_function in MINING_STAGES:
+        if stage_name in stage_names:
+            print "Mining ", stage_name, " for repository ", repository_name
+            stage_function(client, repository_name, release_regex)
+
+
+def measure_commit_mining(repository_name, base_url, mine_function):
+    """
+    Runs the commit history stage and measures its cost per stored commit.
+    :param repository_name: Repository name.
+    :param base_url: API URL.
+    :param mine_function: Either gminer.mine_repository or ghraw.mine_repository.
+    :return: Commits stored, requests per commit and CPU seconds per commit.
+    """
+    budget = ghclient.RateLimitBudget()
+    ghclient.use_budget(budget)
+
+    commits_before = len(gdata.get_commits_by_repository(repository_name))
+    cpu_start = time.clock()
+    try:
+        mine_function(repository_name, gminer.RELEASE_REGEX, ["commits"], base_url)
+    finally:
+        ghclient.use_budget(None)
+    cpu_time = time.clock() - cpu_start
+
+    commits = len(gdata.get_commits_by_repository(repository_name)) - commits_before
+    return commits, budget.requests / float(commits or 1), cpu_time / (commits or 1)
@@ -0,0 +1,199 @@
+"""
+Local-clone backend for the GitHub miners. The tags, commits and compares gminer stores are read from the clones
+under loader.REPO_LOCATION, with a few streaming git log passes per repository, instead of one API request per
+commit. Rows are the ones the API backends store, URLs included, so both sources can be mixed on a database.
+"""
+
+import datetime
+import os
+
+import catalog
+import gdata
+import gitutils
+import gminer
+import loader
+
+COMMIT_BUFFER_SIZE = 500
+HTML_URL = "https://github.com"
+
+
+def get_repository_location(repository_name):
+    return loader.REPO_LOCATION + repository_name
+
+
+def has_local_clone(repository_name):
+    return os.path.isdir(get_repository_location(repository_name))
+
+
+def get_repository_url(repository_name, base_url=gminer.GITHUB_API_URL):
+    return base_url.rstrip("/") + "/repos/" + gminer.APACHE_USER + "/" + repository_name
+
+
+def to_commit_tuple(repository_name, repository_url, commit):
+    """
+    Maps a local commit to the github_commit tuple the API backends build for it.
+    """
+    url = repository_url + "/commits/" + commit['sha']
+    return (repository_name, commit['sha'], commit['author'], commit['author_mail'],
+            datetime.datetime.utcfromtimestamp(int(commit['author_date'])).strftime(gminer.DATE_FORMAT),
+            commit['committer'], commit['committer_mail'],
+            datetime.datetime.utcfromtimestamp(int(commit['committer_date'])).strftime(gminer.DATE_FORMAT),
+            commit['message'], commit['tree'], repository_url + "/git/trees/" + commit['tree'], 0, url,
+            HTML_URL + "/" + gminer.APACHE_USER + "/" + repository_name + "/commit/" + commit['sha'],
+            url + "/comments", commit['insertion'] + commit['deletion'], commit['insertion'], commit['deletion'])
+
+
+def load_commits(repository_name, repository_url, commits):
+    """
+    Writes commits into the database in buffers of COMMIT_BUFFER_SIZE, as they are streamed.
+    :return: github_commit URLs written, in order.
+    """
+    url_index = 12
+    commit_urls = []
+    commit_list = []
+    for commit in commits:
+        commit_list.append(to_commit_tuple(repository_name, repository_url, commit))
+        commit_urls.append(commit_list[-1][url_index])
+
+        if len(commit_list) == COMMIT_BUFFER_SIZE:
+            gdata.load_commits(commit_list)
+            commit_list = []
+
+    gdata.load_commits(commit_list)
+    return commit_urls
+
+
+def store_repository_tags(repository_name, base_url=gminer.GITHUB_API_URL):
+    print "Reading tags from the local clone of repository " + repository_name
+    repository_url = get_repository_url(repository_name, base_url)
+    tag_list = [(repository_name, tag_name, repository_url + "/zipball/" + tag_name,
+                 repository_url + "/tarball/" + tag_name, commit_sha, repository_url + "/commits/" + commit_sha)
+                for tag_name, commit_sha in gitutils.get_tags(get_repository_location(repository_name))]
+
+    print "Writing tags into database for repository " + repository_name
+    gdata.load_tags(tag_list)
+
+
+def store_commits_per_tag(repository_name, base_url=gminer.GITHUB_API_URL):
+    commit_sha_index = 4
+    commit_shas = sorted(set(tag[commit_sha_index] for tag in gdata.get_repository_tags(repository_name)))
+    if not commit_shas:
+        return
+
+    print "Reading tag commits from the local clone of repository " + repository_name
+    load_commits(repository_name, get_repository_url(repository_name, base_url),
+                 gitutils.stream_commits(get_repository_location(repository_name), ["--no-walk"] + commit_shas))
+
+
+def assign_release_intervals(commit_graph, releases):
+    """
+    Walks the commit graph once, in release order, assigning each commit to the first release that contains it.
+    Commits already assigned are not walked again, so every commit is visited once.
+    :param commit_graph: Dictionary from commit sha to its parents, as returned by gitutils.get_commit_graph.
+    :param releases: List of (tag name, commit sha) tuples, oldest release first.
+    :return: Dictionary from commit sha to the tag name of the release that introduced it.
+    """
+    introduced_by = {}
+    for tag_name, release_sha in releases:
+        pending = [release_sha]
+        while pending:
+            commit_sha = pending.pop()
+            if commit_sha in introduced_by or commit_sha not in commit_graph:
+                continue
+
+            introduced_by[commit_sha] = tag_name
+            pending.extend(commit_graph[commit_sha])
+
+    return introduced_by
+
+
+def store_commits_between_tags(repository_name, release_regex=gminer.RELEASE_REGEX,
+                               base_url=gminer.GITHUB_API_URL):
+    """
+    Stores the commits of each release interval, i.e. the ones a release introduced since the previous one. The
+    commit graph is read and walked once for all the intervals, instead of a compare per pair of releases. For
+    releases that contain the previous one, the usual case, intervals are the same a compare returns, without the
+    API limit of 250 commits. Commits and compare rows already stored are not written again.
+    :param repository_name: Repository name.
+    :param release_regex: Regular expression for valid releases, or its ReleaseMatcher.
+    :param base_url: API URL, to build the URLs that are stored.
+    :return: None.
+    """
+    tag_name_index = 0
+    release_matcher = catalog.get_release_matcher(release_regex)
+    tags_and_dates = release_matcher.filter_tags(gdata.get_tags_and_dates(repository_name), tag_name_index)
+    tag_names = sorted(set(tag[tag_name_index] for tag in tags_and_dates))
+    if len(tag_names) < 2:
+        return
+
+    name_index, commit_sha_index = 1, 4
+    tag_commits = dict((tag[name_index], tag[commit_sha_index]) for tag in gdata.get_repository_tags(repository_name))
+    releases = [(tag_name, tag_commits[tag_name]) for tag_name in tag_names]
+    previous_tags = dict((tag_name, previous_name) for previous_name, tag_name in zip(tag_names, tag_names[1:]))
+
+    print "Walking the commit graph of ", len(releases), " releases of repository ", repository_name
+    repository_location = get_repository_location(repository_name)
+    commit_graph = gitutils.get_commit_graph(repository_location, [release_sha for _, release_sha in releases])
+    introduced_by = dict((commit_sha, tag_name) for commit_sha, tag_name in
+                         assign_release_intervals(commit_graph, releases).iteritems() if tag_name in previous_tags)
+
+    repository_url = get_repository_url(repository_name, base_url)
+    stored_urls = gdata.get_commit_urls(repository_name)
+    missing_shas = [commit_sha for commit_sha in introduced_by if
+                    repository_url + "/commits/" + commit_sha not in stored_urls]
+    if missing_shas:
+        print "Reading ", len(missing_shas), " commits not stored yet"
+        load_commits(repository_name, repository_url,
+                     gitutils.stream_commits(repository_location, ["--no-walk"], missing_shas))
+
+    first_object_index, second_object_index, commit_url_index = 1, 2, 3
+    stored_compares = set((compare[first_object_index], compare[second_object_index], compare[commit_url_index])
+                          for compare in gdata.get_compares_by_repository(repository_name))
+    compare_list = []
+    for commit_sha, tag_name in introduced_by.iteritems():
+        compare = (previous_tags[tag_name], tag_name, repository_url + "/commits/" + commit_sha)
+        if compare not in stored_compares:
+            compare_list.append((repository_name,) + compare)
+
+    print "Writing ", len(compare_list), " compare rows for ", len(previous_tags), " release intervals"
+    gdata.load_compares(compare_list)
+
+
+def store_repository_commits(repository_name, base_url=gminer.GITHUB_API_URL):
+    print "Reading commits from the local clone of repository " + repository_name
+    load_commits(repository_name, get_repository_url(repository_name, base_url),
+                 gitutils.stream_commits(get_repository_location(repository_name), ["HEAD"]))
+
+
+MINING_STAGES = [("tags", lambda repository_name, release_regex, base_url: store_repository_tags(
+                      repository_name, base_url)),
+                 ("tag_commits", lambda repository_name, release_regex, base_url: store_commits_per_tag(
+                     repository_name, base_url)),
+                 ("compares", lambda repository_name, release_regex, base_url: store_commits_between_tags(
+                     repository_name, release_regex, base_url)),
+                 ("commits", lambda repository_name, release_regex, base_url: store_repository_commits(
+                     repository_name, base_url))]
+
+
+def mine_repository(repository_name, release_regex, stage_names, base_url=gminer.GITHUB_API_URL):
+    """
+    Runs the mining stages on the local clone of a repository. Same contract as gminer.mine_repository, with no API
+    calls: base_url is only used to build the URLs that are stored.
+    """
+    for stage_name, stage_function in MINING_STAGES:
+        if stage_name in stage_names:
+            print "Mining ", stage_name, " for repository ", repository_name, " from its local clone"
+            stage_function(repository_name, release_regex, base_url)
+
+
+def select_source(api_mine_function):
+    """
+    Returns a mining function that uses the local clone of a repository when there is one, and the API otherwise.
+    :param api_mine_function: Mining function for repositories without a clone, e.g. gminer.mine_repository.
+    :return: Function with the contract of gminer.mine_repository.
+    """
+    def mine(repository_name, release_regex, stage_names, base_url=gminer.GITHUB_API_URL):
+        mine_function = mine_repository if has_local_clone(repository_name) else api_mine_function
+        mine_function(repository_name, release_regex, stage_names, base_url)
+
+    return mine
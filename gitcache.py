@@ -0,0 +1,155 @@
+"""
+Persistent cache for the parsed output of git commands. Entries are addressed by a digest of the state of the
+references of the repository, the command arguments and the parser, so they are only reused while no reference
+moves. The cache is bounded in size, evicting the least recently used entries.
+"""
+
+import cPickle as pickle
+import hashlib
+import sqlite3
+import threading
+import time
+
+import dbutils
+import gitutils
+
+DATABASE_FILE = "git_cache.sqlite"
+MAX_CACHE_SIZE = 256 * 1024 * 1024
+# Part of every key. Increase it when the parsed results change, so entries of previous versions are not reused.
+FORMAT_VERSION = "2"
+
+RESULTS_DDL = "CREATE TABLE IF NOT EXISTS git_results " \
+              "(result_key TEXT PRIMARY KEY, repository_location TEXT, refs_fingerprint TEXT, result BLOB, " \
+              "size INTEGER, last_used REAL)"
+FINGERPRINT_INDEX_DDL = "CREATE INDEX IF NOT EXISTS git_results_fingerprint ON git_results (refs_fingerprint)"
+
+
+def get_result_key(refs_fingerprint, arguments, parse):
+    """
+    Digest identifying the result of a command. Clones on the same state share their entries.
+    :param refs_fingerprint: Fingerprint of the repository, from gitutils.get_refs_fingerprint.
+    :param arguments: List of git arguments.
+    :param parse: Function that parsed the output.
+    :return: Digest as string.
+    """
+    digest = hashlib.sha1()
+    for part in [FORMAT_VERSION, refs_fingerprint, parse.__module__ + "." + parse.__name__] + list(arguments):
+        # Unicode arguments, like tag names read from the database, would be encoded as ASCII otherwise.
+        digest.update(part.encode("utf-8") if isinstance(part, unicode) else part)
+        digest.update("\0")
+
+    return digest.hexdigest()
+
+
+class GitResultCache(object):
+    """
+    Cache of git command results for a run. The entries of a repository are read the first time one of its commands
+    is looked up, and new entries are written on close(), when entries of previous reference states are deleted and
+    the least recently used ones are evicted. Parsed results must be picklable.
+    """
+
+    def __init__(self, database_file=None, max_size=MAX_CACHE_SIZE):
+        self.database_file = database_file or DATABASE_FILE
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+        self.fingerprints = {}
+        self.entries = {}
+        self.new_entries = {}
+        self.used_keys = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.evicted = 0
+
+        dbutils.create_schema([RESULTS_DDL, FINGERPRINT_INDEX_DDL], self.database_file)
+
+    def get_fingerprint(self, repository_location):
+        """
+        Returns the reference state of a repository, reading its cached entries the first time.
+        """
+        with self.lock:
+            if repository_location not in self.fingerprints:
+                refs_fingerprint = gitutils.get_refs_fingerprint(repository_location)
+                entries_sql = "SELECT result_key, result FROM git_results WHERE refs_fingerprint=?"
+                self.entries.update(dbutils.execute_query(entries_sql, (refs_fingerprint,), self.database_file))
+                self.fingerprints[repository_location] = refs_fingerprint
+
+            return self.fingerprints[repository_location]
+
+    def get_key(self, repository_location, arguments, parse):
+        return get_result_key(self.get_fingerprint(repository_location), arguments, parse)
+
+    def get(self, result_key):
+        """
+        Looks up a result.
+        :param result_key: Key, from get_key.
+        :return: True and the result on a hit, False and None on a miss.
+        """
+        with self.lock:
+            if result_key in self.new_entries:
+                self.hits += 1
+                return True, pickle.loads(self.new_entries[result_key][1])
+
+            if result_key in self.entries:
+                self.hits += 1
+                self.used_keys.add(result_key)
+                return True, pickle.loads(str(self.entries[result_key]))
+
+            self.misses += 1
+            return False, None
+
+    def put(self, result_key, repository_location, result):
+        with self.lock:
+            self.new_entries[result_key] = repository_location, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        """
+        Writes the new entries, deletes the ones of previous reference states of the repositories used and evicts
+        the least recently used entries over the maximum size.
+        :return: None.
+        """
+        with self.lock:
+            last_used = time.time()
+
+            results_insert = "INSERT OR REPLACE INTO git_results VALUES (?, ?, ?, ?, ?, ?)"
+            dbutils.load_list(results_insert,
+                              [(result_key, repository_location, self.fingerprints[repository_location],
+                                sqlite3.Binary(result), len(result), last_used)
+                               for result_key, (repository_location, result) in self.new_entries.iteritems()],
+                              self.database_file)
+
+            dbutils.load_list("UPDATE git_results SET last_used=? WHERE result_key=?",
+                              [(last_used, result_key) for result_key in self.used_keys], self.database_file)
+
+            stale_sql = "SELECT result_key FROM git_results WHERE repository_location=? AND refs_fingerprint!=?"
+            stale_keys = [row for repository_location, refs_fingerprint in self.fingerprints.iteritems()
+                          for row in dbutils.execute_query(stale_sql, (repository_location, refs_fingerprint),
+                                                           self.database_file)]
+
+            cache_size = 0
+            evicted_keys = []
+            for result_key, size in dbutils.execute_query(
+                    "SELECT result_key, size FROM git_results ORDER BY last_used DESC", (), self.database_file):
+                cache_size += size
+                if cache_size > self.max_size:
+                    evicted_keys.append((result_key,))
+
+            dbutils.load_list("DELETE FROM git_results WHERE result_key=?", stale_keys + evicted_keys,
+                              self.database_file)
+
+            self.invalidated += len(stale_keys)
+            self.evicted += len(evicted_keys)
+            self.entries.update((result_key, result) for result_key, (_, result) in self.new_entries.iteritems())
+            self.new_entries = {}
+            self.used_keys = set()
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        return "Git cache: %d hits, %d misses (%.1f%% hit rate). %d entries invalidated, %d evicted." % (
+            self.hits, self.misses, 100.0 * self.hits / (lookups or 1), self.invalidated, self.evicted)
+
+
+if __name__ == "__main__":
+    dbutils.create_schema([RESULTS_DDL, FINGERPRINT_INDEX_DDL], DATABASE_FILE)
@@ -4,28 +4,58 @@ This module makes priority and inflation calculations based on Git data
 
 import re
 
-import datetime
-
-from dateutil.tz import tzlocal
 from collections import namedtuple
 
+import catalog
+import dateconv
 import gjdata
 import gminer
-import dateutil.parser
 
 from bisect import bisect
 
-TAG_NAME_INDEX = 3
 SHA_INDEX = 3
-TAG_DATE_INDEX = 3
 
-COMMIT_DATE_INDEX = 8
-COMMIT_DELETIONS = 3
-COMMIT_LINES = 4
-COMMIT_INSERTIONS = 5
-COMMIT_FILES = 6
-COMMITER_INDEX = 7
-REPOSITORY_INDEX = 1
+GitMetrics = namedtuple("GitMetrics", ['earliest_tag', 'distance', 'distance_releases', 'commits_len',
+                                       'tags_per_commit_len',
+                                       'closest_tag', 'commiter', 'commit_date', 'avg_lines', 'resolution_time',
+                                       'repository',
+                                       'total_deletions', 'total_insertions', 'avg_files'])
+
+
+release_tags_cache = {}
+
+
+def get_release_tags(project_id, release_regex):
+    """
+    Returns the release tags of a project sorted by date, with their parsed dates. The result is calculated once per
+    project and release regular expression.
+    :param project_id: JIRA project identifier
+    :param release_regex: Regular expression for valid release names, or its ReleaseMatcher.
+    :return: List of release tags and list of their dates, both sorted by date.
+    """
+    release_matcher = catalog.get_release_matcher(release_regex)
+    cache_key = (project_id, release_matcher.release_regex)
+
+    if cache_key not in release_tags_cache:
+        all_tags = gjdata.get_tags_by_project(project_id)
+        release_tags = sorted([tag for tag in all_tags if release_matcher.is_release(tag.name)],
+                              key=lambda tag: dateconv.parse_git_date(tag.date))
+        tag_dates = [dateconv.parse_git_date(tag.date) for tag in release_tags]
+
+        release_tags_cache[cache_key] = release_tags, tag_dates
+
+    return release_tags_cache[cache_key]
+
+
+def clear_release_tags(project_id):
+    """
+    Discards the release tags calculated for a project, e.g. after the loader writes its git_tag rows again.
+    :param project_id: JIRA project identifier
+    :return: None.
+    """
+    for cache_key in release_tags_cache.keys():
+        if cache_key[0] == project_id:
+            release_tags_cache.pop(cache_key, None)
 
 
 def get_version_position_git(project_id, tag_date, release_regex):
@@ -33,17 +63,11 @@ def get_version_position_git(project_id, tag_date, release_regex):
     Returns the position of the tag in the list of sorted tags.
     :param project_id: JIRA project identifier
     :param tag_date:  Date of the tag.
-    :param release_regex:  Regular expression for valid release names.
+    :param release_regex:  Regular expression for valid release names, or its ReleaseMatcher.
     :return: Tag position.
     """
     if tag_date:
-        all_tags = gjdata.get_tags_by_project(project_id)
-        tag_name_index = 2
-        tag_date_index = 3
-
-        tag_dates = sorted([dateutil.parser.parse(tag[tag_date_index]) for tag in all_tags if
-                            re.match(release_regex, tag[tag_name_index])])
-
+        _, tag_dates = get_release_tags(project_id, release_regex)
         return bisect(tag_dates, tag_date)
     else:
         return None
@@ -83,16 +107,16 @@ def get_tags_for_commits(project_id, commits, release_regex=gminer.RELEASE_REGEX
     Returns a list of tags for a list of commits, according to a version regular expression.
     :param project_id: JIRA Project identifier.
     :param commits: List of commits.
-    :param release_regex: Regex to identify valid release names.
+    :param release_regex: Regex to identify valid release names, or its ReleaseMatcher.
     :return: List of tag information.
     """
+    release_matcher = catalog.get_release_matcher(release_regex)
     tags_per_comit = []
 
     for commit in commits:
         tags = gjdata.get_tags_by_commit_sha(project_id, commit[SHA_INDEX])
         # Only including tags in release format
-        release_tags = [tag for tag in tags if
-                        re.match(release_regex, tag[TAG_NAME_INDEX])]
+        release_tags = [tag for tag in tags if release_matcher.is_release(tag.name)]
 
         if release_tags:
             tags_per_comit.append(release_tags)
@@ -111,7 +135,7 @@ def get_earliest_tag(tags_per_comit):
     if tags_per_comit:
         tag_names = []
         for tag_list in tags_per_comit:
-            tag_names.append([tag[TAG_NAME_INDEX] for tag in tag_list])
+            tag_names.append([tag.name for tag in tag_list])
 
         # When no common tags found, select the minimum from all the available tags.
         tag_name_bag = set(tag_names[0]).union(*tag_names)
@@ -122,15 +146,13 @@ def get_earliest_tag(tags_per_comit):
 
         for tag_name in tag_name_bag:
             for tag in flat_list:
-                if tag[TAG_NAME_INDEX] == tag_name:
+                if tag.name == tag_name:
                     tag_bag.append(tag)
                     break
 
-        tag_date_index = 4
-        sorted_tags = sorted(tag_bag, key=lambda tag: dateutil.parser.parse(tag[tag_date_index]))
+        sorted_tags = sorted(tag_bag, key=lambda tag: dateconv.parse_git_date(tag.date))
 
-    tag_name_index = 3
-    earliest_tag = sorted_tags[0][tag_name_index] if len(sorted_tags) > 0 else ""
+    earliest_tag = sorted_tags[0].name if len(sorted_tags) > 0 else ""
 
     return earliest_tag
 
@@ -146,8 +168,8 @@ def get_release_date_git(project_id, release_name):
     date_from_git = gjdata.get_tag_information(project_id, release_name)
 
     if date_from_git and len(date_from_git) == 1:
-        date_as_string = date_from_git[0][TAG_DATE_INDEX]
-        result = dateutil.parser.parse(date_as_string)
+        date_as_string = date_from_git[0].date
+        result = dateconv.parse_git_date(date_as_string)
         return result
 
     return None
@@ -174,18 +196,14 @@ def get_closest_tag(created_date_parsed, project_id, release_regex):
     Returns the closest release to an specific date.
     :param created_date_parsed: Specific date.
     :param project_id: Project identifier.
-    :param release_regex: Valid release regular expression.
+    :param release_regex: Valid release regular expression, or its ReleaseMatcher.
     :return: Closest tag.
     """
-    all_tags = gjdata.get_tags_by_project(project_id)
-    all_tags_sorted = sorted(all_tags, key=lambda tag: dateutil.parser.parse(tag[TAG_DATE_INDEX]))
+    release_tags, tag_dates = get_release_tags(project_id, release_regex)
 
-    tag_name_index = 2
-    all_tags_filtered = [tag for tag in all_tags_sorted if re.match(release_regex, tag[tag_name_index])]
-
-    for tag in all_tags_filtered:
-        if dateutil.parser.parse(tag[TAG_DATE_INDEX]) > created_date_parsed:
-            return tag[tag_name_index]
+    position = bisect(tag_dates, created_date_parsed)
+    if position < len(release_tags):
+        return release_tags[position].name
 
     return None
 
@@ -200,17 +218,15 @@ def get_earliest_commit(project_id, key):
     commit_info, avg_lines, total_deletions, total_insertions, avg_files = None, None, None, None, None
 
     commits_per_issue = gjdata.get_commit_information(project_id, key)
-    commits_sorted = sorted(commits_per_issue, key=lambda commit: commit[COMMIT_DATE_INDEX])
+    commits_sorted = sorted(commits_per_issue, key=lambda commit: commit.date)
 
     if len(commits_sorted) > 0:
         commit_info = commits_sorted[0]
 
-        avg_lines = sum([int(commit_info[COMMIT_LINES]) for commit_info in commits_per_issue]) / float(
-            len(commits_per_issue))
-        total_deletions = sum([int(commit_info[COMMIT_DELETIONS]) for commit_info in commits_per_issue])
-        total_insertions = sum([int(commit_info[COMMIT_INSERTIONS]) for commit_info in commits_per_issue])
-        avg_files = sum([int(commit_info[COMMIT_FILES]) for commit_info in commits_per_issue]) / float(
-            len(commits_per_issue))
+        avg_lines = sum([int(commit_info.lines) for commit_info in commits_per_issue]) / float(len(commits_per_issue))
+        total_deletions = sum([int(commit_info.deletions) for commit_info in commits_per_issue])
+        total_insertions = sum([int(commit_info.insertions) for commit_info in commits_per_issue])
+        avg_files = sum([int(commit_info.files) for commit_info in commits_per_issue]) / float(len(commits_per_issue))
 
     return commit_info, avg_lines, total_deletions, total_insertions, avg_files
 
@@ -220,24 +236,18 @@ def get_github_metrics(project_id, key, release_regex, created_date):
     Return the information extracted from GitHub
     :param project_id: JIRA's project identifier.
     :param key: JIRA's Issue Key.
-    :param release_regex: Regex for valid release names,
+    :param release_regex: Regex for valid release names, or its ReleaseMatcher.
     :param created_date: Creation date of the issue in a timestamp,
     :return: Earliest release tag, days between affected and fix tag, releases between affected and fix tag, number of commits for the issue,
     commits with release tags.
     """
 
-    GitMetrics = namedtuple("GitMetrics", ['earliest_tag', 'distance', 'distance_releases', 'commits_len',
-                                           'tags_per_commit_len',
-                                           'closest_tag', 'commiter', 'commit_date', 'avg_lines', 'resolution_time',
-                                           'repository',
-                                           'total_deletions', 'total_insertions', 'avg_files'])
-
     commits = gjdata.get_commits_by_issue(project_id, key)
     tags_per_comit = get_tags_for_commits(project_id, commits, release_regex=release_regex)
 
     earliest_tag = get_earliest_tag(tags_per_comit)
 
-    created_date_parsed = datetime.datetime.fromtimestamp(created_date / 1000, tz=tzlocal())
+    created_date_parsed = dateconv.from_timestamp_ms(created_date)
     closest_tag = get_closest_tag(created_date_parsed, project_id, release_regex)
 
     github_time_distance = get_release_distance_git(project_id, closest_tag,
@@ -256,12 +266,11 @@ def get_github_metrics(project_id, key, release_regex, created_date):
     resolution_time = None
 
     if earliest_commit:
-        commiter = earliest_commit[COMMITER_INDEX]
-        repository = earliest_commit[REPOSITORY_INDEX]
-        if earliest_commit[COMMIT_DATE_INDEX]:
-            commit_date = datetime.datetime.fromtimestamp(int(earliest_commit[COMMIT_DATE_INDEX]),
-                                                          tz=tzlocal())
-            resolution_time = (int(earliest_commit[COMMIT_DATE_INDEX]) - created_date / 1000) / (60 * 60)
+        commiter = earliest_commit.author
+        repository = earliest_commit.repository
+        if earliest_commit.date:
+            commit_date = dateconv.from_timestamp(int(earliest_commit.date))
+            resolution_time = (int(earliest_commit.date) - created_date / 1000) / (60 * 60)
 
     commits_len = len(commits)
     tags_per_commit_len = len(tags_per_comit)
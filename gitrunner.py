@@ -0,0 +1,158 @@
+"""
+Concurrent runner for git subprocesses. The loader stages run one short git command per commit or tag, so running
+them one after the other leaves cores and disk idle. Commands are run by a pool of threads, with a global limit and a
+limit per repository on the processes alive, and a timeout per command.
+"""
+
+import subprocess
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+import gitutils
+import instrumentation
+
+MAX_PROCESSES = 8
+MAX_PROCESSES_PER_REPOSITORY = 4
+COMMAND_TIMEOUT = 300
+
+
+def read_output(lines):
+    """
+    Output parser returning the whole output as a unicode string, without the trailing line break, like GitPython
+    does.
+    """
+    return "\n".join(lines)
+
+
+class GitRunner(object):
+    """
+    Runs git commands concurrently. At most max_processes commands are alive at any time, so queuing tens of
+    thousands of them doesn't exhaust file descriptors. With a gitcache.GitResultCache, results of repositories whose
+    references haven't moved are not computed again. The cache is written when leaving a with block, or on close().
+    """
+
+    def __init__(self, max_processes=MAX_PROCESSES, max_processes_per_repository=MAX_PROCESSES_PER_REPOSITORY,
+                 timeout=COMMAND_TIMEOUT, cache=None):
+        self.max_processes = max_processes
+        self.max_processes_per_repository = max_processes_per_repository
+        self.timeout = timeout
+        self.cache = cache
+
+        self.lock = threading.Lock()
+        self.repository_semaphores = {}
+
+        self.commands = 0
+        self.timeouts = 0
+        self.command_time = 0.0
+
+    def get_repository_semaphore(self, repository_location):
+        with self.lock:
+            if repository_location not in self.repository_semaphores:
+                self.repository_semaphores[repository_location] = threading.BoundedSemaphore(
+                    self.max_processes_per_repository)
+            return self.repository_semaphores[repository_location]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def run(self, repository_location, arguments, parse=read_output):
+        """
+        Runs a git command, streaming its output to a parser.
+        :param repository_location: Location of the local repository.
+        :param arguments: List of git arguments, e.g. ["tag", "--contains", sha].
+        :param parse: Function receiving an iterator of output lines, decoded as UTF-8 and without line terminators.
+        :return: Value returned by parse.
+        """
+        if self.cache is not None:
+            result_key = self.cache.get_key(repository_location, arguments, parse)
+            hit, result = self.cache.get(result_key)
+            if hit:
+                return result
+
+        command = [gitutils.GIT_COMMAND] + list(arguments)
+        semaphore = self.get_repository_semaphore(repository_location)
+
+        with semaphore:
+            start_time = instrumentation.start()
+            wall_start = time.time()
+            # A process started by another thread meanwhile can inherit this pipe, delaying its end of file until
+            # that process exits. Commands are short, and close_fds costs a close() per possible descriptor on every
+            # start, so it is not used.
+            process = subprocess.Popen(command, cwd=repository_location, stdout=subprocess.PIPE)
+
+            timed_out = threading.Event()
+            timer = threading.Timer(self.timeout, self.kill, (process, timed_out))
+            timer.start()
+
+            line_count = [0]
+
+            def stream_output():
+                for line in iter(process.stdout.readline, b''):
+                    line_count[0] += 1
+                    yield gitutils.decode_output(line.rstrip("\r\n"))
+
+            try:
+                result = parse(stream_output())
+                # Whatever the parser didn't read is discarded, so the process never blocks on a full pipe.
+                process.stdout.read()
+            finally:
+                timer.cancel()
+                process.stdout.close()
+                return_code = process.wait()
+
+        with self.lock:
+            self.commands += 1
+            self.command_time += time.time() - wall_start
+            if timed_out.is_set():
+                self.timeouts += 1
+
+        instrumentation.record(instrumentation.GIT_CATEGORY, instrumentation.get_git_label(arguments[0],
+                                                                                          arguments[1:]),
+                               start_time, line_count[0])
+
+        if timed_out.is_set():
+            raise RuntimeError("Git command timed out after %d seconds: %s" % (self.timeout, " ".join(command)))
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, command)
+
+        if self.cache is not None:
+            self.cache.put(result_key, repository_location, result)
+        return result
+
+    @staticmethod
+    def kill(process, timed_out):
+        timed_out.set()
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    def map(self, commands):
+        """
+        Runs several git commands concurrently.
+        :param commands: Iterable of (repository location, arguments, parse function) tuples.
+        :return: Generator of the parsed outputs, in the order of the commands.
+        """
+        pool = ThreadPool(self.max_processes)
+        try:
+            for result in pool.imap(lambda command: self.run(*command), commands):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __str__(self):
+        summary = "%d git commands, %.3f seconds of command time. %d timed out." % (self.commands, self.command_time,
+                                                                                    self.timeouts)
+        if self.cache is not None:
+            summary += " " + str(self.cache)
+        return summary
@@ -0,0 +1,233 @@
+"""
+Module that contain utilities for running git commands on local repositories. Commit stats need git 2.31 or later,
+for --diff-merges.
+"""
+
+import hashlib
+import re
+import subprocess
+
+import instrumentation
+
+GIT_COMMAND = "git"
+MIN_GIT_VERSION = (2, 31)
+
+# git log output is UTF-8 unless i18n.logOutputEncoding says otherwise. Invalid bytes are replaced, so a badly encoded
+# commit doesn't stop the mining.
+OUTPUT_ENCODING = "utf-8"
+
+COMMIT_START = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+COMMIT_END = "\x1d"
+
+# The message goes last since it can span several lines. Merge commits are diffed against their first parent, as
+# GitHub does for their stats.
+LOG_FORMAT = "--format=" + COMMIT_START + FIELD_SEPARATOR.join(["%H", "%an", "%ae", "%at", "%aI", "%cn", "%ce",
+                                                                "%ct", "%cI", "%T", "%P", "%B"]) + COMMIT_END
+LOG_OPTIONS = [LOG_FORMAT, "--shortstat", "--diff-merges=first-parent"]
+SHORTSTAT_REGEX = re.compile(r"(\d+) (file|insertion|deletion)")
+VERSION_REGEX = re.compile(r"(\d+)\.(\d+)")
+
+git_version = []
+
+
+def decode_output(text):
+    return text.decode(OUTPUT_ENCODING, "replace")
+
+
+def get_git_version():
+    """
+    Returns the version of the git executable, read once per process.
+    :return: (major, minor) tuple.
+    """
+    if not git_version:
+        output = subprocess.check_output([GIT_COMMAND, "--version"])
+        git_version.append(tuple(int(number) for number in VERSION_REGEX.search(output).groups()))
+
+    return git_version[0]
+
+
+def check_git_version(minimum_version=MIN_GIT_VERSION):
+    """
+    Fails with a clear error when git is too old for the options used, instead of an unknown option error.
+    :param minimum_version: (major, minor) tuple.
+    :return: None.
+    """
+    version = get_git_version()
+    if version < minimum_version:
+        raise RuntimeError("git %d.%d or later is required, found %d.%d" % (minimum_version + version))
+
+
+def stream_lines(repository_location, arguments, input_lines=None):
+    """
+    Runs a git command and yields its output line by line, as it is produced, so the full output is never held in
+    memory.
+    :param repository_location: Location of the local repository.
+    :param arguments: List of git arguments, e.g. ["log", "--all"].
+    :param input_lines: Lines to write on the standard input, e.g. revisions for --stdin. They are written before
+    reading the output, so the command must consume its whole input first, as --stdin does.
+    :return: Generator of output lines, without the line terminator. The command is recorded by the instrumentation
+    once its output is consumed.
+    """
+    start_time = instrumentation.start()
+    process = subprocess.Popen([GIT_COMMAND] + list(arguments), cwd=repository_location, stdout=subprocess.PIPE,
+                               stdin=subprocess.PIPE if input_lines is not None else None)
+    if input_lines is not None:
+        for line in input_lines:
+            process.stdin.write(line + "\n")
+        process.stdin.close()
+
+    line_count = 0
+    try:
+        for line in iter(process.stdout.readline, b''):
+            line_count += 1
+            yield line.rstrip("\r\n")
+    finally:
+        process.stdout.close()
+        return_code = process.wait()
+        instrumentation.record(instrumentation.GIT_CATEGORY, instrumentation.get_git_label(arguments[0],
+                                                                                          arguments[1:]),
+                               start_time, line_count)
+
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, [GIT_COMMAND] + list(arguments))
+
+
+def get_refs_fingerprint(repository_location):
+    """
+    Digest of the state of the references of a repository (branches, tags, HEAD). It changes every time a reference
+    moves.
+    :param repository_location: Location of the local repository.
+    :return: Digest as string.
+    """
+    digest = hashlib.md5()
+    for line in stream_lines(repository_location, ["show-ref", "--head"]):
+        digest.update(line)
+        digest.update("\n")
+
+    return digest.hexdigest()
+
+
+def parse_commit(header):
+    """
+    Maps the LOG_FORMAT header of a commit to a dictionary. Text is decoded, as the API backends store unicode.
+    """
+    sha, author, author_mail, author_date, author_timestamp, committer, committer_mail, committer_date, \
+        committer_timestamp, tree, parents, message = decode_output(header).split(FIELD_SEPARATOR)
+    return {'sha': sha, 'author': author, 'author_mail': author_mail, 'author_date': author_date,
+            'author_timestamp': author_timestamp, 'committer': committer, 'committer_mail': committer_mail,
+            'committer_date': committer_date, 'committer_timestamp': committer_timestamp, 'tree': tree,
+            'parents': parents.split(), 'message': message.rstrip("\n"), 'files': 0, 'insertion': 0,
+            'deletion': 0}
+
+
+def stream_commits(repository_location, revisions, input_revisions=None):
+    """
+    Streams the commits of a git log pass, with their stats.
+    :param repository_location: Location of the local repository.
+    :param revisions: git log revision arguments, e.g. ["--all"] or ["v1.0..v1.1"].
+    :param input_revisions: Revisions passed through --stdin, for lists too long for a command line.
+    :return: Generator of commit dictionaries, in git log order.
+    """
+    check_git_version()
+    arguments = ["log"] + LOG_OPTIONS + list(revisions)
+    if input_revisions is not None:
+        arguments.append("--stdin")
+
+    commit = None
+    header_lines = None
+    for line in stream_lines(repository_location, arguments, input_revisions):
+        if header_lines is None and line.startswith(COMMIT_START):
+            if commit:
+                yield commit
+            commit = None
+            header_lines = []
+            line = line[len(COMMIT_START):]
+
+        if header_lines is not None:
+            if COMMIT_END in line:
+                header_lines.append(line.partition(COMMIT_END)[0])
+                commit = parse_commit("\n".join(header_lines))
+                header_lines = None
+            else:
+                header_lines.append(line)
+        elif line.strip() and commit:
+            for value, kind in SHORTSTAT_REGEX.findall(line):
+                commit[kind] = int(value)
+
+    if commit:
+        yield commit
+
+
+def get_tags(repository_location):
+    """
+    Returns the tags of a repository, with the commit they point to. Annotated tags are peeled.
+    :param repository_location: Location of the local repository.
+    :return: List of (tag name, commit sha) tuples.
+    """
+    tags = []
+    for line in stream_lines(repository_location, ["for-each-ref", "refs/tags",
+                                                   "--format=%(refname:short)\t%(objectname)\t%(*objectname)"]):
+        tag_name, object_sha, peeled_sha = decode_output(line).split("\t")
+        tags.append((tag_name, peeled_sha or object_sha))
+
+    return tags
+
+
+def get_commit_graph(repository_location, revisions):
+    """
+    Reads, in a single rev-list pass, the parents of every commit reachable from some revisions.
+    :param repository_location: Location of the local repository.
+    :param revisions: Revisions to start from, e.g. tag commits. They are passed through --stdin.
+    :return: Dictionary from commit sha to the list of its parent shas.
+    """
+    commit_graph = {}
+    for line in stream_lines(repository_location, ["rev-list", "--parents", "--stdin"], revisions):
+        shas = line.split()
+        commit_graph[shas[0]] = shas[1:]
+
+    return commit_graph
+
+
+def get_reference_tips(repository_location):
+    """
+    Returns the commits every reference and HEAD point to, i.e. the starting points of git log --all.
+    :param repository_location: Location of the local repository.
+    :return: Sorted list of commit SHAs, without duplicates.
+    """
+    tips = set()
+    for line in stream_lines(repository_location, ["for-each-ref", "--format=%(objectname) %(*objectname)"]):
+        object_sha, _, peeled_sha = line.partition(" ")
+        tips.add(peeled_sha or object_sha)
+
+    tips.update(stream_lines(repository_location, ["rev-parse", "HEAD"]))
+    return sorted(tips)
+
+
+def stream_messages(repository_location, revisions, input_revisions=None):
+    """
+    Streams the SHA and full message of the commits of a git log pass.
+    :param repository_location: Location of the local repository.
+    :param revisions: git log revision arguments, e.g. ["--all"].
+    :param input_revisions: Revisions passed through --stdin, e.g. ^<sha> lines to exclude commits already seen.
+    :return: Generator of (sha, message) tuples.
+    """
+    arguments = ["log", "--format=" + COMMIT_START + "%H" + FIELD_SEPARATOR + "%B" + COMMIT_END] + list(revisions)
+    if input_revisions is not None:
+        arguments.append("--stdin")
+
+    message_lines = None
+    for line in stream_lines(repository_location, arguments, input_revisions):
+        if message_lines is None:
+            if not line.startswith(COMMIT_START):
+                continue
+            message_lines = []
+            line = line[len(COMMIT_START):]
+
+        if COMMIT_END in line:
+            message_lines.append(line.partition(COMMIT_END)[0])
+            sha, _, message = "\n".join(message_lines).partition(FIELD_SEPARATOR)
+            yield sha, message
+            message_lines = None
+        else:
+            message_lines.append(line)
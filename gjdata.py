@@ -3,6 +3,7 @@ Module for storing the relationships between JIRA issues and GitHub commits.
 """
 
 import dbutils
+import records
 
 DATABASE_FILE = "jira_github.sqlite"
 
@@ -19,6 +20,16 @@ COMMIT_TABLE_DDL = "CREATE TABLE git_commit (project_id TEXT, repository TEXT ,
                    "deletions INTEGER, lines INTEGER, insertions INTEGER, files INTEGER, author TEXT, commit_date TEXT," \
                    " PRIMARY KEY(project_id, repository, commit_sha))"
 
+# State of the incremental issue-commit linking: the reference tips scanned per repository, and the latest issue
+# change seen per project.
+REPOSITORY_LINK_STATE_DDL = "CREATE TABLE IF NOT EXISTS repository_link_state (project_id TEXT, repository TEXT, " \
+                            "scanned_tips TEXT, PRIMARY KEY(project_id, repository))"
+PROJECT_LINK_STATE_DDL = "CREATE TABLE IF NOT EXISTS project_link_state (project_id TEXT PRIMARY KEY, " \
+                         "last_issue_update)"
+REPOSITORY_HEALTH_DDL = "CREATE TABLE IF NOT EXISTS repository_health (repository TEXT, checked TEXT, " \
+                        "object_count INTEGER, loose_objects INTEGER, pack_count INTEGER, pack_size_kb INTEGER, " \
+                        "has_bitmap INTEGER, has_commit_graph INTEGER, refs_fingerprint TEXT, graph_fingerprint TEXT)"
+
 
 def create_schema():
     """
@@ -36,7 +47,7 @@ def insert_git_commits(db_records):
     :param db_records:  List of tuples.
     :return: None.
     """
-    insert_commit = "INSERT INTO git_commit VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    insert_commit = "INSERT OR REPLACE INTO git_commit VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
     dbutils.load_list(insert_commit, db_records, DATABASE_FILE)
 
 
@@ -46,7 +57,7 @@ def insert_git_tags(db_records):
     :param db_records:  List of tuples.
     :return: None.
     """
-    insert_tag = "INSERT INTO git_tag VALUES (?, ?, ?, ?)"
+    insert_tag = "INSERT OR REPLACE INTO git_tag VALUES (?, ?, ?, ?)"
     dbutils.load_list(insert_tag, db_records, DATABASE_FILE)
 
 
@@ -55,10 +66,10 @@ def get_tag_information(project_id, tag_name):
     Returns the information of stored for a tag.
     :param project_id: JIRA's project identifier.
     :param tag_name: Tag name.
-    :return:
+    :return: List of Tag records.
     """
     tags_sql = "SELECT * FROM git_tag WHERE project_id=? and tag_name=?"
-    tags = dbutils.execute_query(tags_sql, (project_id, tag_name), DATABASE_FILE)
+    tags = dbutils.execute_query(tags_sql, (project_id, tag_name), DATABASE_FILE, records.Tag.row_factory)
     return tags
 
 
@@ -66,10 +77,10 @@ def get_tags_by_project(project_id):
     """
     Returns all the tags for an specific project.
     :param project_id: JIRA's project identifier.
-    :return: List of tags
+    :return: List of Tag records.
     """
     tags_sql = "SELECT * FROM git_tag WHERE project_id=?"
-    tags = dbutils.execute_query(tags_sql, (project_id,), DATABASE_FILE)
+    tags = dbutils.execute_query(tags_sql, (project_id,), DATABASE_FILE, records.Tag.row_factory)
     return tags
 
 
@@ -79,7 +90,7 @@ def insert_stats_per_commit(db_records):
     :param db_records: List, containing tuples for commit stats.
     :return: None.
     """
-    insert_commit = "INSERT INTO commit_stats VALUES (?, ?, ?, ?, ?, ?, ?)"
+    insert_commit = "INSERT OR REPLACE INTO commit_stats VALUES (?, ?, ?, ?, ?, ?, ?)"
     dbutils.load_list(insert_commit, db_records, DATABASE_FILE)
 
 
@@ -89,7 +100,7 @@ def insert_commits_per_issue(db_records):
     :param db_records: List of tuples.
     :return: None
     """
-    insert_commit = "INSERT INTO issue_commit (project_id, repository, issue_key, commit_sha)" \
+    insert_commit = "INSERT OR IGNORE INTO issue_commit (project_id, repository, issue_key, commit_sha)" \
                     " VALUES (?, ?, ?, ?)"
     dbutils.load_list(insert_commit, db_records, DATABASE_FILE)
 
@@ -100,7 +111,7 @@ def insert_tags_per_commit(db_records):
     :param db_records: List of tuples.
     :return: None.
     """
-    insert_tag = "INSERT INTO commit_tag (project_id, repository, commit_sha, tag_name) VALUES (?, ?, ?, ?)"
+    insert_tag = "INSERT OR REPLACE INTO commit_tag (project_id, repository, commit_sha, tag_name) VALUES (?, ?, ?, ?)"
     dbutils.load_list(insert_tag, db_records, DATABASE_FILE)
 
 
@@ -131,24 +142,24 @@ def get_commit_information(project_id, key):
     Returns detailed commit information.
     :param project_id: JIRA Project identifier.
     :param key: JIRA key.
-    :return: Commits per Issue.
+    :return: List of Commit records.
     """
     commit_sql = "SELECT c.* FROM git_commit c, issue_commit  ic " \
                  "WHERE ic.project_id = c.project_id AND" \
                  " ic.repository = c.repository AND" \
                  " ic.commit_sha = c.commit_sha AND" \
                  " ic.issue_key = ? AND ic.project_id=?"
-    return dbutils.execute_query(commit_sql, (key, project_id), DATABASE_FILE)
+    return dbutils.execute_query(commit_sql, (key, project_id), DATABASE_FILE, records.Commit.row_factory)
 
 
 def get_tags_by_commit_sha(project_id, commit_sha):
-    tag_sql = "SELECT gt.project_id, gt.repository, ct.commit_sha, gt.tag_name, gt.tag_date " \
+    tag_sql = "SELECT gt.project_id, gt.repository, gt.tag_name, gt.tag_date, ct.commit_sha " \
               "FROM commit_tag ct, git_tag gt WHERE ct.project_id=? AND ct.commit_sha=? " \
               "AND ct.project_id = gt.project_id AND " \
               "ct.repository = gt.repository " \
               "AND ct.tag_name = gt.tag_name"
 
-    return dbutils.execute_query(tag_sql, (project_id, commit_sha), DATABASE_FILE)
+    return dbutils.execute_query(tag_sql, (project_id, commit_sha), DATABASE_FILE, records.Tag.row_factory)
 
 
 def get_tags_per_project(project_id):
@@ -163,5 +174,87 @@ def get_tags_per_project(project_id):
     return tags
 
 
+def get_commit_fingerprints(project_id):
+    """
+    Returns, per issue key of a project, the number of related commits, the latest commit date and the number of
+    tags containing those commits.
+    :param project_id: JIRA's project identifier.
+    :return: List of (issue key, commits, latest commit date, tags) tuples.
+    """
+    fingerprint_sql = "SELECT ic.issue_key, COUNT(DISTINCT ic.commit_sha), MAX(c.commit_date), COUNT(ct.tag_name) " \
+                      "FROM issue_commit ic " \
+                      "LEFT OUTER JOIN git_commit c ON ic.project_id = c.project_id AND " \
+                      "ic.repository = c.repository AND ic.commit_sha = c.commit_sha " \
+                      "LEFT OUTER JOIN commit_tag ct ON ic.project_id = ct.project_id AND " \
+                      "ic.repository = ct.repository AND ic.commit_sha = ct.commit_sha " \
+                      "WHERE ic.project_id=? GROUP BY ic.issue_key"
+    return dbutils.execute_query(fingerprint_sql, (project_id,), DATABASE_FILE)
+
+
+def create_link_state_schema():
+    dbutils.create_schema([REPOSITORY_LINK_STATE_DDL, PROJECT_LINK_STATE_DDL], DATABASE_FILE)
+
+
+def get_scanned_tips(project_id):
+    """
+    Returns the reference tips scanned on the last issue-commit linking of a project.
+    :param project_id: JIRA's project identifier.
+    :return: Dictionary from repository to the list of commit SHAs.
+    """
+    state_sql = "SELECT repository, scanned_tips FROM repository_link_state WHERE project_id=?"
+    return dict((repository, scanned_tips.split()) for repository, scanned_tips in
+                dbutils.execute_query(state_sql, (project_id,), DATABASE_FILE))
+
+
+def get_last_issue_update(project_id):
+    """
+    Returns the latest issue change seen on the last issue-commit linking of a project.
+    :param project_id: JIRA's project identifier.
+    :return: Timestamp, or None if the project was never linked.
+    """
+    state_sql = "SELECT last_issue_update FROM project_link_state WHERE project_id=?"
+    rows = dbutils.execute_query(state_sql, (project_id,), DATABASE_FILE)
+    return rows[0][0] if rows else None
+
+
+def update_link_state(project_id, scanned_tips, last_issue_update):
+    """
+    Records the state reached by an issue-commit linking.
+    :param project_id: JIRA's project identifier.
+    :param scanned_tips: Dictionary from repository to the list of reference tips scanned.
+    :param last_issue_update: Latest issue change considered.
+    :return: None.
+    """
+    dbutils.load_list("INSERT OR REPLACE INTO repository_link_state VALUES (?, ?, ?)",
+                      [(project_id, repository, " ".join(tips)) for repository, tips in scanned_tips.items()],
+                      DATABASE_FILE)
+    dbutils.load_list("INSERT OR REPLACE INTO project_link_state VALUES (?, ?)", [(project_id, last_issue_update)],
+                      DATABASE_FILE)
+
+
+def create_repository_health_schema():
+    dbutils.create_schema([REPOSITORY_HEALTH_DDL], DATABASE_FILE)
+
+
+def insert_repository_health(db_records):
+    """
+    Records the health of repositories, as checked by repomaint.
+    :param db_records: List of tuples.
+    :return: None.
+    """
+    dbutils.load_list("INSERT INTO repository_health VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", db_records, DATABASE_FILE)
+
+
+def get_graph_fingerprint(repository):
+    """
+    Returns the reference state a repository had when its commit-graph was last written.
+    :param repository: Repository name.
+    :return: Fingerprint, or None if the repository was never checked.
+    """
+    health_sql = "SELECT graph_fingerprint FROM repository_health WHERE repository=? ORDER BY checked DESC LIMIT 1"
+    rows = dbutils.execute_query(health_sql, (repository,), DATABASE_FILE)
+    return rows[0][0] if rows else None
+
+
 if __name__ == "__main__":
     create_schema()
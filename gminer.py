@@ -2,11 +2,21 @@
 Module for information retrieval from GitHub API.
 """
 from github import Github
-import re
+from multiprocessing.pool import ThreadPool
+import argparse
 import sys
+import time
+import traceback
 
-import config
+# On Python 2, the first call to datetime.strptime imports _strptime, and threads racing on that import can fail
+# with AttributeError. PyGithub and ghgraphql parse dates on the mining threads, so it's imported here.
+import _strptime
+
+import catalog
+import dbwriter
 import gdata
+import ghclient
+import instrumentation
 
 PER_PAGE = 100
 APACHE_USER = 'apache'
@@ -14,6 +24,17 @@ RELEASE_REGEX = r"^(\d+\.)?(\d+\.)?(\*|\d+)$"
 
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+GITHUB_API_URL = "https://api.github.com"
+WORKERS = 4
+
+PYGITHUB_BACKEND = "pygithub"
+RAW_BACKEND = "raw"
+GRAPHQL_BACKEND = "graphql"
+
+API_SOURCE = "api"
+LOCAL_SOURCE = "local"
+AUTO_SOURCE = "auto"
+
 
 def store_repository_tags(repository):
     """
@@ -97,40 +118,30 @@ def store_repository_commits(repository):
     repository_name = repository.name
     print "Getting commits from GitHub from repository " + repository_name
 
-    commit_list = []
     index = 0
 
-    try:
-        commits = repository.get_commits()
-
-        buffer_size = 500
-        for index, commit in enumerate(commits):
-            if len(gdata.get_commit_by_url(commit.url)) > 0:
-                print "Index ", index, ": Commit already stored: ", commit.url
-                continue
-
-            commit_as_tuple = from_commit_to_tuple(repository_name, commit)
-            commit_list.append(commit_as_tuple)
+    # Commits are written by a separate thread while the next pages are fetched.
+    with dbwriter.QueuedWriter() as writer:
+        try:
+            commits = repository.get_commits()
 
-            if len(commit_list) == buffer_size:
-                print "Commit ", index, ": Writing ", buffer_size, " commits into database"
-                gdata.load_commits(commit_list)
-                commit_list = []
+            for index, commit in enumerate(commits):
+                if len(gdata.get_commit_by_url(commit.url)) > 0:
+                    print "Index ", index, ": Commit already stored: ", commit.url
+                    continue
 
-        print "Writing last batch of commits into database for repository " + repository_name
-        gdata.load_commits(commit_list)
-    except Exception as e:
-        print >> sys.stderr, e
-        print "An exception was thrown on commit ", index, " from ", repository_name
-        print "Writing the commits stored so far ..."
-        gdata.load_commits(commit_list)
+                writer.write(gdata.load_commits, [from_commit_to_tuple(repository_name, commit)])
+        except Exception as e:
+            print >> sys.stderr, e
+            print "An exception was thrown on commit ", index, " from ", repository_name
+            print "Writing the commits fetched so far ..."
 
 
-def store_commits_between_tags(repository):
+def store_commits_between_tags(repository, release_regex=RELEASE_REGEX):
     tag_name_index = 0
     repository_name = repository.name
-    tags_and_dates = [tag_date for tag_date in gdata.get_tags_and_dates(repository_name) if
-                      re.match(RELEASE_REGEX, tag_date[tag_name_index])]
+    release_matcher = catalog.get_release_matcher(release_regex)
+    tags_and_dates = release_matcher.filter_tags(gdata.get_tags_and_dates(repository_name), tag_name_index)
 
     # I'm not interested in the changes between time
     # tags_and_dates = sorted(tags_and_dates, key=lambda tag: datetime.datetime.strptime(tag[1], DATE_FORMAT),
@@ -141,7 +152,7 @@ def store_commits_between_tags(repository):
 
     for index, current_tag in enumerate(tags_and_dates):
         tag_name = current_tag[tag_name_index]
-        if re.match(RELEASE_REGEX, tag_name) and (index + 1) < len(tags_and_dates):
+        if release_matcher.is_release(tag_name) and (index + 1) < len(tags_and_dates):
             previous_tag = tags_and_dates[index + 1]
 
             print "Getting commits between ", previous_tag[tag_name_index], " and ", current_tag[tag_name_index]
@@ -163,22 +174,155 @@ def store_commits_between_tags(repository):
             gdata.load_compares(compare_list)
 
 
-def main():
-    client = Github(config.get_github_token(), per_page=PER_PAGE)
-    user = client.get_user(APACHE_USER)
+def get_client(base_url=GITHUB_API_URL):
+    """
+    Returns an authenticated GitHub client. With instrumentation enabled, its API calls are recorded.
+    :param base_url: API URL, e.g. the one of a mockgithub server.
+    :return: Github instance.
+    """
+    if instrumentation.enabled:
+        instrumentation.instrument_github()
+
+    return Github(ghclient.get_github_token(), per_page=PER_PAGE, base_url=base_url)
+
+
+def get_repository(client, repository_name):
+    """
+    Returns a repository from the Apache account.
+    :param client: Github instance.
+    :param repository_name: Repository name.
+    :return: Repository instance.
+    """
+    return client.get_user(APACHE_USER).get_repo(repository_name)
+
+
+MINING_STAGES = [("tags", lambda repository, release_regex: store_repository_tags(repository)),
+                 ("tag_commits", lambda repository, release_regex: store_commits_per_tag(repository)),
+                 ("compares", lambda repository, release_regex: store_commits_between_tags(repository,
+                                                                                           release_regex)),
+                 ("commits", lambda repository, release_regex: store_repository_commits(repository))]
+
+
+def get_catalog_repositories(project_keys=None):
+    """
+    Returns the repositories of the catalog projects, each one with its release regular expression.
+    :param project_keys: Project keys to include. If None, every project is included.
+    :return: List of (repository name, ReleaseMatcher) tuples, without duplicates.
+    """
+    repositories = []
+    repository_names = set()
+    for project_config in catalog.get_project_catalog():
+        if not project_config or (project_keys and project_config['project_key'] not in project_keys):
+            continue
 
-    # TODO(cgavidia): Temporarly, we're only dealing with a single repository
-    # Repo URL: https://api.github.com/repos/apache/cloudstack
-    repository_name = 'cloudstack'
-    repository = user.get_repo(repository_name)
-    print 'client.rate_limiting ', client.rate_limiting
+        for repository_name in project_config['repositories']:
+            if repository_name not in repository_names:
+                repository_names.add(repository_name)
+                repositories.append((repository_name, project_config['release_matcher']))
 
-    # store_repository_tags(repository)
-    # store_commits_per_tag(repository)
-    # store_commits_between_tags(repository)
+    return repositories
 
-    store_repository_commits(repository)
+
+def mine_repository(repository_name, release_regex, stage_names, base_url=GITHUB_API_URL):
+    """
+    Runs the mining stages on a repository, in order. Each repository has its own client, so they can be mined on
+    different threads.
+    :param repository_name: Repository name.
+    :param release_regex: Regular expression for valid releases, or its ReleaseMatcher.
+    :param stage_names: Names of the stages to run, from MINING_STAGES.
+    :param base_url: API URL.
+    :return: None.
+    """
+    repository = get_repository(get_client(base_url), repository_name)
+    for stage_name, stage_function in MINING_STAGES:
+        if stage_name in stage_names:
+            print "Mining ", stage_name, " for repository ", repository_name
+            stage_function(repository, release_regex)
+
+
+def mine_catalog(repositories, stage_names, workers=WORKERS, base_url=GITHUB_API_URL,
+                 max_concurrent_requests=ghclient.MAX_CONCURRENT_REQUESTS, mine_function=mine_repository):
+    """
+    Mines several repositories concurrently, sharing a single rate limit budget.
+    :param repositories: List of (repository name, release regular expression) tuples.
+    :param stage_names: Names of the stages to run, from MINING_STAGES.
+    :param workers: Repositories mined at the same time.
+    :param base_url: API URL.
+    :param max_concurrent_requests: Maximum number of API requests in flight, over all repositories.
+    :param mine_function: Either mine_repository or ghraw.mine_repository.
+    :return: Dictionary from repository name to error message, or None if it was mined successfully.
+    """
+    gdata.create_schema()
+
+    def mine(repository):
+        repository_name, release_regex = repository
+        try:
+            mine_function(repository_name, release_regex, stage_names, base_url)
+            return repository_name, None
+        except Exception:
+            traceback.print_exc()
+            return repository_name, traceback.format_exc().splitlines()[-1]
+
+    budget = ghclient.RateLimitBudget(max_concurrent_requests=max_concurrent_requests)
+    ghclient.use_budget(budget)
+
+    start_time = time.time()
+    pool = ThreadPool(workers)
+    try:
+        results = dict(pool.map(mine, repositories, chunksize=1))
+    finally:
+        pool.close()
+        pool.join()
+        ghclient.use_budget(None)
+
+    print "Mined ", len(repositories), " repositories in ", time.time() - start_time, " seconds. ", budget
+    for repository_name, error in results.items():
+        if error:
+            print "Mining failed for repository ", repository_name, ": ", error
+
+    return results
+
+
+def main(arguments=None):
+    stage_names = [stage_name for stage_name, _ in MINING_STAGES]
+
+    parser = argparse.ArgumentParser(description="Mines the GitHub repositories of the catalog projects.")
+    parser.add_argument("--project", action="append", help="JIRA project key. By default, all catalog projects.")
+    parser.add_argument("--stage", action="append", choices=stage_names,
+                        help="Mining stage. It can be repeated. By default, all stages.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Repositories mined concurrently.")
+    parser.add_argument("--max-requests", type=int, default=ghclient.MAX_CONCURRENT_REQUESTS,
+                        help="Maximum number of GitHub requests in flight.")
+    parser.add_argument("--base-url", default=GITHUB_API_URL, help="GitHub API URL.")
+    parser.add_argument("--backend", choices=[PYGITHUB_BACKEND, RAW_BACKEND, GRAPHQL_BACKEND],
+                        default=PYGITHUB_BACKEND,
+                        help="Client for the API: PyGithub objects, raw JSON (ghraw) or raw JSON with commits "
+                             "hydrated in batches through GraphQL (ghgraphql).")
+    parser.add_argument("--source", choices=[API_SOURCE, LOCAL_SOURCE, AUTO_SOURCE], default=API_SOURCE,
+                        help="Where repositories are mined from: the API, their local clones (gitbackend) or, with "
+                             "auto, the local clone when there is one and the API otherwise.")
+    arguments = parser.parse_args(arguments)
+
+    mine_function = mine_repository
+    # The other backends and sources depend on this module, so they're only imported when requested.
+    if arguments.backend == RAW_BACKEND:
+        import ghraw
+        mine_function = ghraw.mine_repository
+    elif arguments.backend == GRAPHQL_BACKEND:
+        import ghgraphql
+        mine_function = ghgraphql.mine_repository
+
+    if arguments.source != API_SOURCE:
+        import gitbackend
+        mine_function = gitbackend.mine_repository if arguments.source == LOCAL_SOURCE else \
+            gitbackend.select_source(mine_function)
+
+    repositories = get_catalog_repositories(arguments.project)
+    results = mine_catalog(repositories, arguments.stage or stage_names, arguments.workers, arguments.base_url,
+                           arguments.max_requests, mine_function)
+
+    return 1 if any(results.values()) else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
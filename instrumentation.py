@@ -0,0 +1,195 @@
+"""
+Opt-in instrumentation of the data-access layer: SQLite queries, git subprocesses and GitHub API calls. It's enabled
+by setting the MINING_INSTRUMENTATION environment variable, and the aggregated report is printed when the process
+ends. Setting MINING_PROFILE_STAGE to a stage name runs that stage under cProfile.
+"""
+
+import atexit
+import cProfile
+import csv
+import os
+import pstats
+import re
+import threading
+import time
+import urlparse
+
+from contextlib import contextmanager
+
+ENABLED_VARIABLE = "MINING_INSTRUMENTATION"
+PROFILE_STAGE_VARIABLE = "MINING_PROFILE_STAGE"
+
+SQL_CATEGORY = "sqlite"
+GIT_CATEGORY = "git"
+GITHUB_CATEGORY = "github"
+
+REPORT_FILE = "instrumentation_report.csv"
+REPORT_HEADER = ["category", "label", "calls", "total_time", "mean_time", "max_time", "rows"]
+LABEL_LENGTH = 120
+PROFILE_LINES = 30
+
+HEX_ID_REGEX = re.compile(r"\b[0-9a-f]{7,40}\b")
+NUMBER_REGEX = re.compile(r"/\d+(?=/|$)")
+
+enabled = os.environ.get(ENABLED_VARIABLE, "").lower() in ("1", "true", "yes")
+profile_stage = os.environ.get(PROFILE_STAGE_VARIABLE)
+
+statistics_lock = threading.Lock()
+call_statistics = {}
+
+
+class CallStatistics(object):
+    """
+    Aggregated calls for a category and label.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+
+    def add(self, elapsed, rows):
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if rows is not None:
+            self.rows += rows
+
+
+def start():
+    """
+    Marks the start of an instrumented call.
+    :return: Start time, or None if instrumentation is disabled.
+    """
+    if not enabled:
+        return None
+    return time.time()
+
+
+def record(category, label, start_time, rows=None):
+    """
+    Records an instrumented call.
+    :param category: Call category, like SQL_CATEGORY.
+    :param label: Call label, like the SQL statement. Calls with the same label are aggregated.
+    :param start_time: Value returned by start().
+    :param rows: Rows returned or written by the call.
+    :return: None.
+    """
+    if start_time is None:
+        return
+
+    elapsed = time.time() - start_time
+    label = " ".join(label.split())[:LABEL_LENGTH]
+
+    with statistics_lock:
+        if (category, label) not in call_statistics:
+            call_statistics[(category, label)] = CallStatistics()
+        call_statistics[(category, label)].add(elapsed, rows)
+
+
+def get_git_label(command, arguments):
+    """
+    Label for a git call: the command and its options, without their values.
+    :param command: Git command, like log.
+    :param arguments: Command arguments.
+    :return: Label.
+    """
+    options = [argument.split("=")[0] for argument in arguments if argument.startswith("-")]
+    return " ".join(["git", command] + options)
+
+
+def get_github_label(verb, url):
+    """
+    Label for a GitHub API call: the verb and the URL path, with SHAs and numbers replaced.
+    :param verb: HTTP verb.
+    :param url: Requested URL.
+    :return: Label.
+    """
+    path = urlparse.urlparse(url).path
+    path = HEX_ID_REGEX.sub("{sha}", path)
+    path = NUMBER_REGEX.sub("/{number}", path)
+    return verb + " " + path
+
+
+def instrument_github():
+    """
+    Records every request of the PyGithub client, including the ones made lazily by paginated lists and objects.
+    :return: None.
+    """
+    from github.Requester import Requester
+
+    request_json = Requester.requestJsonAndCheck
+    if getattr(request_json, "instrumented", False):
+        return
+
+    def instrumented_request_json(self, verb, url, *args, **kwargs):
+        start_time = start()
+        result = request_json(self, verb, url, *args, **kwargs)
+        data = result[1] if isinstance(result, tuple) and len(result) > 1 else None
+        record(GITHUB_CATEGORY, get_github_label(verb, url), start_time,
+               len(data) if isinstance(data, list) else 1)
+        return result
+
+    instrumented_request_json.instrumented = True
+    Requester.requestJsonAndCheck = instrumented_request_json
+
+
+@contextmanager
+def profiled(stage_name, project_key=None):
+    """
+    Runs a block under cProfile if it belongs to the stage named in MINING_PROFILE_STAGE. The statistics are written
+    to profile_<stage>_<project>.prof, so projects running the stage concurrently don't overwrite each other, and
+    the top functions by cumulative time are printed. Only the calling thread is profiled.
+    :param stage_name: Stage name.
+    :param project_key: Project the block runs for. If None, the file is profile_<stage>.prof.
+    :return: None.
+    """
+    if stage_name != profile_stage:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_file = "profile_" + stage_name + ("_" + project_key if project_key else "") + ".prof"
+        profiler.dump_stats(profile_file)
+
+        print "Profile for stage ", stage_name, " and project ", project_key, " written to ", profile_file
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+
+def report(report_file=REPORT_FILE):
+    """
+    Prints the aggregated statistics per category, sorted by total time, and writes them to a CSV file.
+    :param report_file: CSV file name.
+    :return: None.
+    """
+    with statistics_lock:
+        statistics = sorted(call_statistics.items(), key=lambda item: (item[0][0], -item[1].total_time))
+
+    if not statistics:
+        return
+
+    rows = []
+    print "Instrumentation report"
+    for (category, label), call_stats in statistics:
+        mean_time = call_stats.total_time / call_stats.calls
+        print "%-8s %8d calls %10.3f s total %8.4f s mean %8.4f s max %10d rows  %s" % (
+            category, call_stats.calls, call_stats.total_time, mean_time, call_stats.max_time, call_stats.rows, label)
+        rows.append([category, label, call_stats.calls, call_stats.total_time, mean_time, call_stats.max_time,
+                     call_stats.rows])
+
+    with open(report_file, "wb") as report_output:
+        writer = csv.writer(report_output)
+        writer.writerow(REPORT_HEADER)
+        writer.writerows(rows)
+
+    print "Instrumentation report written to ", report_file
+
+
+if enabled:
+    atexit.register(report)
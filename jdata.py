@@ -2,14 +2,58 @@
 Module for accessing JIRA database information.
 """
 
-import dbutils
+import os
 
-DATABASE_FILE = "D:\OneDrive\phd2\jira_db\issue_repository.db"
+import dbutils
+import records
+
+# The JIRA dump is only read, so it's opened in read-only, immutable mode. Its location can be set on the
+# JIRA_DATABASE_FILE environment variable.
+DATABASE_FILE = os.environ.get("JIRA_DATABASE_FILE", "D:\OneDrive\phd2\jira_db\issue_repository.db")
+
+ISSUE_BY_KEY_SQL = "SELECT * FROM Issue WHERE key=?"
+ISSUE_COMMENTS_SQL = "SELECT * FROM Comment WHERE issueId = ?"
+CHANGE_LOG_SQL = "SELECT h.created, h.authorId, c.* FROM Issue i, History h, " \
+                 "ChangeLogItem c WHERE i.id = ? AND i.id  = h.issueId AND h.id = c.historyId"
+VERSIONS_BY_PROJECT_SQL = "SELECT * FROM Version WHERE projectId=?"
+VERSION_BY_NAME_SQL = "SELECT * FROM Version WHERE projectId=? AND name =?"
+VERSION_BY_ID_SQL = "SELECT * FROM Version WHERE id=?"
+AFFECTED_VERSIONS_SQL = "SELECT v.* FROM Version v, Issue i ,VersionPerIssue vi " \
+                        "WHERE i.id = vi.issueId AND vi.versionId = v.id AND i.id =?"
+FIX_VERSIONS_SQL = "SELECT v.* FROM Version v, Issue i , FixVersionPerIssue vi " \
+                   "WHERE i.id = vi.issueId AND vi.versionId = v.id AND i.id =?"
+PROJECT_ISSUES_SQL = "SELECT i.* , r.name resname, s.name statname, p.name priorname " \
+                     "FROM Issue i " \
+                     "LEFT OUTER JOIN Resolution r ON i.resolutionId = r.id " \
+                     "LEFT OUTER JOIN Status s ON i.statusId = s.id " \
+                     "LEFT OUTER JOIN Priority p on i.priorityId = p.id " \
+                     "WHERE i.projectId=?"
+COMMENT_COUNT_SQL = "SELECT COUNT(*) FROM Comment WHERE issueId = ?"
+PROJECT_COMMENT_COUNTS_SQL = "SELECT c.issueId, COUNT(*) FROM Issue i, Comment c " \
+                             "WHERE i.projectId = ? AND i.id = c.issueId GROUP BY c.issueId"
+CHANGE_LOG_SIZE_SQL = "SELECT COUNT(*) FROM History h, ChangeLogItem c WHERE h.issueId = ? AND h.id = c.historyId"
+PROJECT_CHANGE_LOG_SIZES_SQL = "SELECT h.issueId, COUNT(*) FROM Issue i, History h, ChangeLogItem c " \
+                               "WHERE i.projectId = ? AND i.id = h.issueId AND h.id = c.historyId " \
+                               "GROUP BY h.issueId"
+PROJECT_ISSUE_KEYS_SQL = "SELECT key FROM Issue WHERE projectId = ?"
+LATEST_ISSUE_UPDATE_SQL = "SELECT MAX(updated) FROM (SELECT created updated FROM Issue WHERE projectId = ? " \
+                          "UNION ALL SELECT h.created FROM Issue i, History h " \
+                          "WHERE i.projectId = ? AND i.id = h.issueId)"
+ISSUES_UPDATED_SINCE_SQL = "SELECT i.key FROM Issue i WHERE i.projectId = ? AND (i.created > ? OR EXISTS " \
+                           "(SELECT 1 FROM History h WHERE h.issueId = i.id AND h.created > ?))"
+CHANGE_LOG_FINGERPRINTS_SQL = "SELECT h.issueId, COUNT(*), MAX(h.created) FROM Issue i, History h, ChangeLogItem c " \
+                              "WHERE i.projectId = ? AND i.id = h.issueId AND h.id = c.historyId " \
+                              "GROUP BY h.issueId"
+AFFECTED_VERSION_FINGERPRINTS_SQL = "SELECT vi.issueId, COUNT(*), GROUP_CONCAT(vi.versionId) " \
+                                    "FROM Issue i, VersionPerIssue vi WHERE i.projectId = ? AND i.id = vi.issueId " \
+                                    "GROUP BY vi.issueId"
+FIX_VERSION_FINGERPRINTS_SQL = "SELECT vi.issueId, COUNT(*), GROUP_CONCAT(vi.versionId) " \
+                               "FROM Issue i, FixVersionPerIssue vi WHERE i.projectId = ? AND i.id = vi.issueId " \
+                               "GROUP BY vi.issueId"
 
 
 def get_issue_by_key(key):
-    issue_sql = "SELECT * FROM Issue WHERE key=?"
-    return dbutils.execute_query(issue_sql, (key,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(ISSUE_BY_KEY_SQL, (key,), DATABASE_FILE)
 
 
 def get_issue_comments(issue_id):
@@ -18,29 +62,63 @@ def get_issue_comments(issue_id):
     :param issue_id: JIRA Issue Identifier.
     :return: List of comments
     """
-    comment_sql = "SELECT * FROM Comment WHERE issueId = ?"
-    return dbutils.execute_query(comment_sql, (issue_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(ISSUE_COMMENTS_SQL, (issue_id,), DATABASE_FILE)
+
+
+def get_comment_count(issue_id):
+    """
+    Returns the number of comments of a JIRA issue, without loading them.
+    :param issue_id: JIRA Issue Identifier.
+    :return: Number of comments.
+    """
+    return dbutils.execute_read_only_query(COMMENT_COUNT_SQL, (issue_id,), DATABASE_FILE)[0][0]
+
+
+def get_comment_counts(project_id):
+    """
+    Returns the number of comments per issue of a project, in a single query.
+    :param project_id: JIRA project identifier.
+    :return: Dictionary from issue id to number of comments. Issues without comments are not included.
+    """
+    return dict(dbutils.execute_read_only_query(PROJECT_COMMENT_COUNTS_SQL, (project_id,), DATABASE_FILE))
 
 
 def get_change_log(issue_id):
     """
     Return all the change log items for a JIRA issue.
     :param issue_id: JIRA issue id.
-    :return: Log item list.
+    :return: List of ChangeLogItem records.
+    """
+    return dbutils.execute_read_only_query(CHANGE_LOG_SQL, (issue_id,), DATABASE_FILE,
+                                           records.ChangeLogItem.row_factory)
+
+
+def get_change_log_size(issue_id):
+    """
+    Returns the number of change log items of a JIRA issue, without loading them.
+    :param issue_id: JIRA issue id.
+    :return: Number of change log items.
     """
-    log_sql = "SELECT h.created, h.authorId, c.* FROM Issue i, History h, " \
-              "ChangeLogItem c WHERE i.id = ? AND i.id  = h.issueId AND h.id = c.historyId"
-    return dbutils.execute_query(log_sql, (issue_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(CHANGE_LOG_SIZE_SQL, (issue_id,), DATABASE_FILE)[0][0]
+
+
+def get_change_log_sizes(project_id):
+    """
+    Returns the number of change log items per issue of a project, in a single query.
+    :param project_id: JIRA project identifier.
+    :return: Dictionary from issue id to number of change log items. Issues without changes are not included.
+    """
+    return dict(dbutils.execute_read_only_query(PROJECT_CHANGE_LOG_SIZES_SQL, (project_id,), DATABASE_FILE))
 
 
 def get_versions_by_project(project_id):
     """
     Return version information by project id.
     :param project_id: JIRA project identifier.
-    :return: Tuple with version information.
+    :return: List of Version records.
     """
-    version_sql = "SELECT * FROM Version WHERE projectId=?"
-    return dbutils.execute_query(version_sql, (project_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(VERSIONS_BY_PROJECT_SQL, (project_id,), DATABASE_FILE,
+                                           records.Version.row_factory)
 
 
 def get_version_by_name(project_id, version_name):
@@ -48,42 +126,81 @@ def get_version_by_name(project_id, version_name):
     Return version information by version name.
     :param project_id: JIRA project identifier.
     :param version_name: Version name.
-    :return: Tuple with version information.
+    :return: List of Version records.
     """
-    version_sql = "SELECT * FROM Version WHERE projectId=? AND name =?"
-    return dbutils.execute_query(version_sql, (project_id, version_name), DATABASE_FILE)
+    return dbutils.execute_read_only_query(VERSION_BY_NAME_SQL, (project_id, version_name), DATABASE_FILE,
+                                           records.Version.row_factory)
 
 
 def get_version_by_id(version_id):
     """
     Return version information by version id.
     :param version_id: JIRA version identifier.
-    :return: Tuple with version information.
+    :return: List of Version records.
     """
-    version_sql = "SELECT * FROM Version WHERE id=?"
-    return dbutils.execute_query(version_sql, (version_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(VERSION_BY_ID_SQL, (version_id,), DATABASE_FILE, records.Version.row_factory)
 
 
 def get_affected_versions(issue_id):
-    version_sql = "SELECT v.* FROM Version v, Issue i ,VersionPerIssue vi " \
-                  "WHERE i.id = vi.issueId AND vi.versionId = v.id AND i.id =?"
-
-    return dbutils.execute_query(version_sql, (issue_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(AFFECTED_VERSIONS_SQL, (issue_id,), DATABASE_FILE,
+                                           records.Version.row_factory)
 
 
 def get_fix_versions(issue_id):
-    version_sql = "SELECT v.* FROM Version v, Issue i , FixVersionPerIssue vi " \
-                  "WHERE i.id = vi.issueId AND vi.versionId = v.id AND i.id =?"
-
-    return dbutils.execute_query(version_sql, (issue_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(FIX_VERSIONS_SQL, (issue_id,), DATABASE_FILE, records.Version.row_factory)
 
 
 def get_project_issues(project_id):
-    issue_sql = "SELECT i.* , r.name resname, s.name statname, p.name priorname " \
-                "FROM Issue i " \
-                "LEFT OUTER JOIN Resolution r ON i.resolutionId = r.id " \
-                "LEFT OUTER JOIN Status s ON i.statusId = s.id " \
-                "LEFT OUTER JOIN Priority p on i.priorityId = p.id " \
-                "WHERE i.projectId=?"
-
-    return dbutils.execute_query(issue_sql, (project_id,), DATABASE_FILE)
+    return dbutils.execute_read_only_query(PROJECT_ISSUES_SQL, (project_id,), DATABASE_FILE, records.Issue.row_factory)
+
+
+def get_project_issue_keys(project_id):
+    return set(row[0] for row in dbutils.execute_read_only_query(PROJECT_ISSUE_KEYS_SQL, (project_id,), DATABASE_FILE))
+
+
+def get_latest_issue_update(project_id):
+    """
+    Returns the latest change on the issues of a project: an issue creation or a change log entry.
+    :param project_id: JIRA project identifier.
+    :return: Timestamp, as stored on the database, or None if the project has no issues.
+    """
+    return dbutils.execute_read_only_query(LATEST_ISSUE_UPDATE_SQL, (project_id, project_id), DATABASE_FILE)[0][0]
+
+
+def get_issues_updated_since(project_id, timestamp):
+    """
+    Returns the keys of the issues of a project created or changed after a timestamp.
+    :param project_id: JIRA project identifier.
+    :param timestamp: Timestamp, as returned by get_latest_issue_update.
+    :return: Set of issue keys.
+    """
+    return set(row[0] for row in dbutils.execute_read_only_query(ISSUES_UPDATED_SINCE_SQL,
+                                                                 (project_id, timestamp, timestamp),
+                                                                 DATABASE_FILE))
+
+
+def get_change_log_fingerprints(project_id):
+    """
+    Returns, per issue of a project, the number of change log items and the latest change timestamp.
+    :param project_id: JIRA project identifier.
+    :return: List of (issue id, change log items, latest change) tuples.
+    """
+    return dbutils.execute_read_only_query(CHANGE_LOG_FINGERPRINTS_SQL, (project_id,), DATABASE_FILE)
+
+
+def get_affected_version_fingerprints(project_id):
+    """
+    Returns, per issue of a project, the number of affected versions and their identifiers.
+    :param project_id: JIRA project identifier.
+    :return: List of (issue id, affected versions, comma-separated version ids) tuples.
+    """
+    return dbutils.execute_read_only_query(AFFECTED_VERSION_FINGERPRINTS_SQL, (project_id,), DATABASE_FILE)
+
+
+def get_fix_version_fingerprints(project_id):
+    """
+    Returns, per issue of a project, the number of fix versions and their identifiers.
+    :param project_id: JIRA project identifier.
+    :return: List of (issue id, fix versions, comma-separated version ids) tuples.
+    """
+    return dbutils.execute_read_only_query(FIX_VERSION_FINGERPRINTS_SQL, (project_id,), DATABASE_FILE)
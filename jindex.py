@@ -0,0 +1,170 @@
+"""
+Builds the indexes jdata queries need on a copy of the JIRA database. The original dump is never modified: it's
+copied to a sidecar file, the missing indexes are created there and the query plans of each jdata function are
+reported before and after. jdata uses the indexed copy when JIRA_DATABASE_FILE points to it.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+
+import dbutils
+import jdata
+
+# (table, column) pairs jdata filters or joins on.
+REQUIRED_INDEXES = [("Issue", "id"),
+                    ("Issue", "key"),
+                    ("Issue", "projectId"),
+                    ("Comment", "issueId"),
+                    ("History", "issueId"),
+                    ("ChangeLogItem", "historyId"),
+                    ("Version", "id"),
+                    ("Version", "projectId"),
+                    ("VersionPerIssue", "issueId"),
+                    ("FixVersionPerIssue", "issueId")]
+
+JDATA_QUERIES = [("get_issue_by_key", jdata.ISSUE_BY_KEY_SQL),
+                 ("get_issue_comments", jdata.ISSUE_COMMENTS_SQL),
+                 ("get_comment_count", jdata.COMMENT_COUNT_SQL),
+                 ("get_comment_counts", jdata.PROJECT_COMMENT_COUNTS_SQL),
+                 ("get_change_log", jdata.CHANGE_LOG_SQL),
+                 ("get_change_log_size", jdata.CHANGE_LOG_SIZE_SQL),
+                 ("get_change_log_sizes", jdata.PROJECT_CHANGE_LOG_SIZES_SQL),
+                 ("get_versions_by_project", jdata.VERSIONS_BY_PROJECT_SQL),
+                 ("get_version_by_name", jdata.VERSION_BY_NAME_SQL),
+                 ("get_version_by_id", jdata.VERSION_BY_ID_SQL),
+                 ("get_affected_versions", jdata.AFFECTED_VERSIONS_SQL),
+                 ("get_fix_versions", jdata.FIX_VERSIONS_SQL),
+                 ("get_project_issues", jdata.PROJECT_ISSUES_SQL),
+                 ("get_project_issue_keys", jdata.PROJECT_ISSUE_KEYS_SQL),
+                 ("get_latest_issue_update", jdata.LATEST_ISSUE_UPDATE_SQL),
+                 ("get_issues_updated_since", jdata.ISSUES_UPDATED_SINCE_SQL),
+                 ("get_change_log_fingerprints", jdata.CHANGE_LOG_FINGERPRINTS_SQL),
+                 ("get_affected_version_fingerprints", jdata.AFFECTED_VERSION_FINGERPRINTS_SQL),
+                 ("get_fix_version_fingerprints", jdata.FIX_VERSION_FINGERPRINTS_SQL)]
+
+INDEXED_SUFFIX = "_indexed"
+INDEX_PREFIX = "jindex_"
+
+
+def get_indexed_file_name(db_file):
+    base_name, extension = os.path.splitext(db_file)
+    return base_name + INDEXED_SUFFIX + extension
+
+
+def is_indexed(connection, table, column):
+    """
+    Checks if a column can be searched without a full scan: it's the rowid of the table, or the first column of an
+    index.
+    :param connection: Database connection.
+    :param table: Table name.
+    :param column: Column name.
+    :return: True if the column is indexed.
+    """
+    table_columns = connection.execute("PRAGMA table_info(%s)" % table).fetchall()
+    name_index, type_index, primary_key_index = 1, 2, 5
+
+    primary_key = [table_column for table_column in table_columns if table_column[primary_key_index]]
+    if len(primary_key) == 1 and primary_key[0][name_index] == column and \
+            primary_key[0][type_index].upper() == "INTEGER":
+        return True
+
+    for index in connection.execute("PRAGMA index_list(%s)" % table).fetchall():
+        index_columns = connection.execute("PRAGMA index_info(\"%s\")" % index[name_index]).fetchall()
+        first_columns = [index_column[2] for index_column in index_columns if index_column[0] == 0]
+        if column in first_columns:
+            return True
+
+    return False
+
+
+def get_missing_indexes(connection):
+    """
+    Returns the required indexes that don't exist on a database. Tables not present on the database are ignored.
+    :param connection: Database connection.
+    :return: List of (table, column) pairs.
+    """
+    tables = set(row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    return [(table, column) for table, column in REQUIRED_INDEXES
+            if table in tables and not is_indexed(connection, table, column)]
+
+
+def get_query_plans(connection):
+    """
+    Returns the query plan of each jdata query.
+    :param connection: Database connection.
+    :return: Dictionary from jdata function name to its query plan lines.
+    """
+    detail_index = 3
+    query_plans = {}
+    for function_name, sql_query in JDATA_QUERIES:
+        parameters = (None,) * sql_query.count("?")
+        plan = connection.execute("EXPLAIN QUERY PLAN " + sql_query, parameters).fetchall()
+        query_plans[function_name] = [row[detail_index] for row in plan]
+
+    return query_plans
+
+
+def create_indexed_copy(db_file, indexed_file):
+    """
+    Copies the JIRA database and creates the missing indexes on the copy.
+    :param db_file: Original JIRA database. It's not modified.
+    :param indexed_file: Destination file. It's replaced if it exists.
+    :return: Created indexes, and query plans before and after.
+    """
+    original_connection = sqlite3.connect(dbutils.get_read_only_uri(db_file) if dbutils.is_uri_supported()
+                                          else db_file)
+    missing_indexes = get_missing_indexes(original_connection)
+    plans_before = get_query_plans(original_connection)
+    original_connection.close()
+
+    print "Copying ", db_file, " to ", indexed_file
+    shutil.copyfile(db_file, indexed_file)
+
+    connection = sqlite3.connect(indexed_file)
+    for table, column in missing_indexes:
+        print "Creating index on ", table, ".", column
+        connection.execute("CREATE INDEX IF NOT EXISTS %s%s_%s ON %s (%s)" % (INDEX_PREFIX, table, column, table,
+                                                                             column))
+    connection.execute("ANALYZE")
+    connection.commit()
+
+    plans_after = get_query_plans(connection)
+    connection.close()
+
+    return missing_indexes, plans_before, plans_after
+
+
+def print_plan_differences(plans_before, plans_after):
+    for function_name, _ in JDATA_QUERIES:
+        before = plans_before[function_name]
+        after = plans_after[function_name]
+
+        print "jdata.", function_name, ": ", "unchanged" if before == after else "changed"
+        if before != after:
+            for detail in before:
+                print "    before: ", detail
+            for detail in after:
+                print "    after:  ", detail
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Creates an indexed copy of the JIRA database.")
+    parser.add_argument("--database", default=jdata.DATABASE_FILE, help="JIRA database to index.")
+    parser.add_argument("--output", help="Indexed copy. By default, <database>" + INDEXED_SUFFIX + ".")
+    arguments = parser.parse_args(arguments)
+
+    indexed_file = arguments.output or get_indexed_file_name(arguments.database)
+    if os.path.abspath(indexed_file) == os.path.abspath(arguments.database):
+        raise ValueError("The indexed copy can't replace the original database.")
+
+    missing_indexes, plans_before, plans_after = create_indexed_copy(arguments.database, indexed_file)
+
+    print len(missing_indexes), " indexes created on ", indexed_file
+    print_plan_differences(plans_before, plans_after)
+    print "To use it, set JIRA_DATABASE_FILE=" + indexed_file
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,24 @@
 """
 This module makes priority and inflation calculations based on JIRA data
 """
+import dateconv
 import jdata
 
 from bisect import bisect
-from dateutil.tz import tzlocal
 from collections import namedtuple
 
-import datetime
-
-VERSION_NAME_INDEX = 6
-VERSION_ID_INDEX = 4
-VERSION_DATE_INDEX = 3
-
-AUTHOR_INDEX = 1
-CREATED_INDEX = 0
-
-TO_INDEX = 7
-TO_STRING_INDEX = 8
-FROM_STRING_INDEX = 6
-CHANGE_FIELD_INDEX = 3
-
 VALID_RESOLUTION_VALUES = ['Done', 'Implemented', 'Fixed']
 
+JiraMetrics = namedtuple("JiraMetrics",
+                         ['earliest_affected', 'latest_affected_name', 'earliest_fix_name', 'latest_fix_name',
+                          'distance',
+                          'distance_releases', 'closest_release_name', 'resolved_by', 'start_date_parsed',
+                          'assignment_date_parsed', 'progress_date_parsed',
+                          'resolution_date_parsed',
+                          'resolution_time',
+                          'issue_comments_len', 'priority_changed_by', 'priority_changed_to',
+                          'priority_change_from', 'change_log_len', 'reopen_len', 'priority_change_date'])
+
 
 def get_version_position_jira(project_id, version_date):
     """
@@ -32,7 +28,7 @@ def get_version_position_jira(project_id, version_date):
     :return: Version position.
     """
     all_versions = jdata.get_versions_by_project(project_id)
-    version_timestamps = sorted([version[VERSION_DATE_INDEX] for version in all_versions])
+    version_timestamps = sorted([version.release_date for version in all_versions])
 
     return bisect(version_timestamps, version_date)
 
@@ -49,12 +45,12 @@ def get_release_distance_jira(project_id, one_release, other_release, unit="days
         return None
 
     if unit == "days":
-        one_release_value = get_release_date_jira(one_release[VERSION_ID_INDEX])
-        other_release_value = get_release_date_jira(other_release[VERSION_ID_INDEX])
+        one_release_value = get_release_date_jira(one_release.version_id)
+        other_release_value = get_release_date_jira(other_release.version_id)
 
     if unit == "releases":
-        one_release_value = get_version_position_jira(project_id, one_release[VERSION_DATE_INDEX])
-        other_release_value = get_version_position_jira(project_id, other_release[VERSION_DATE_INDEX])
+        one_release_value = get_version_position_jira(project_id, one_release.release_date)
+        other_release_value = get_version_position_jira(project_id, other_release.release_date)
 
     if other_release_value and one_release_value:
         difference = other_release_value - one_release_value
@@ -71,9 +67,8 @@ def get_release_date_jira(version_id):
     """
 
     date_from_jira = jdata.get_version_by_id(version_id)
-    if date_from_jira and date_from_jira[0][VERSION_DATE_INDEX]:
-        date_as_timestamp = date_from_jira[0][VERSION_DATE_INDEX] / 1000
-        result = datetime.datetime.fromtimestamp(date_as_timestamp, tz=tzlocal())
+    if date_from_jira and date_from_jira[0].release_date:
+        result = dateconv.from_timestamp_ms(date_from_jira[0].release_date)
         return result
 
     return None
@@ -83,9 +78,9 @@ def get_first_last_version(versions):
     """
     Returns the first and last items from a list of versions after sorting.
     :param versions: List of versions.
-    :return: First and last versions as tuples.
+    :return: First and last Version records.
     """
-    sorted_versions = sorted(versions, key=lambda version: version[VERSION_DATE_INDEX])
+    sorted_versions = sorted(versions, key=lambda version: version.release_date)
     earliest_version = sorted_versions[0] if len(sorted_versions) > 0 else None
     latest_version = sorted_versions[-1] if len(sorted_versions) > 0 else None
     return earliest_version, latest_version
@@ -96,13 +91,13 @@ def get_closest_release(created_date, project_id):
     Returns the release that is closer to a specific point in time.
     :param created_date: Date as timestamp.
     :param project_id: JIRA's Project Identifier.
-    :return: Version tuple
+    :return: Version record.
     """
     all_versions = jdata.get_versions_by_project(project_id)
-    all_versions_sorted = sorted(all_versions, reverse=True, key=lambda version: version[VERSION_DATE_INDEX])
+    all_versions_sorted = sorted(all_versions, reverse=True, key=lambda version: version.release_date)
 
     for version in all_versions_sorted:
-        if version[VERSION_DATE_INDEX] > created_date:
+        if version.release_date > created_date:
             return version
 
     return None
@@ -112,14 +107,14 @@ def get_resolution_log(log_items):
     """
     Returns Resolution Log information. That is, the latest resolution log item to a valid resolution value.
     :param log_items: List of change log items.
-    :return: Tuple with log information.
+    :return: ChangeLogItem record.
     """
     log = None
 
-    sorted_log_items = sorted(log_items, reverse=True, key=lambda item: item[CREATED_INDEX])
+    sorted_log_items = sorted(log_items, reverse=True, key=lambda item: item.created)
 
     for log_item in sorted_log_items:
-        if log_item[CHANGE_FIELD_INDEX] == "resolution" and log_item[TO_STRING_INDEX] in VALID_RESOLUTION_VALUES:
+        if log_item.field == "resolution" and log_item.to_string in VALID_RESOLUTION_VALUES:
             return log_item
 
     return None
@@ -132,10 +127,10 @@ def get_last_priority_log(log_items):
     :return: Last priority change log item.
     """
 
-    sorted_log_items = sorted(log_items, reverse=True, key=lambda item: item[CREATED_INDEX])
+    sorted_log_items = sorted(log_items, reverse=True, key=lambda item: item.created)
 
     for log_item in sorted_log_items:
-        if log_item[CHANGE_FIELD_INDEX] == "priority":
+        if log_item.field == "priority":
             return log_item
 
     return None
@@ -149,7 +144,7 @@ def get_reopen_logs(log_items):
     """
 
     return [log_item for log_item in log_items if
-            log_item[CHANGE_FIELD_INDEX] == "status" and log_item[TO_STRING_INDEX] == "Reopened"]
+            log_item.field == "status" and log_item.to_string == "Reopened"]
 
 
 def get_first_log(log_items, author_id):
@@ -159,10 +154,10 @@ def get_first_log(log_items, author_id):
     :param log_items: List of change log items.
     :return: The first change log item made by a user.
     """
-    sorted_log_items = sorted(log_items, reverse=False, key=lambda item: item[CREATED_INDEX])
+    sorted_log_items = sorted(log_items, reverse=False, key=lambda item: item.created)
 
     for log_item in sorted_log_items:
-        if log_item[AUTHOR_INDEX] == author_id:
+        if log_item.author_id == author_id:
             return log_item
 
     return None
@@ -175,10 +170,10 @@ def get_assignment_log(log_items, author_id):
     :param author_id: Person that is responsible of the bug report.
     :return: First assignment where this happened.
     """
-    sorted_log_items = sorted(log_items, reverse=False, key=lambda item: item[CREATED_INDEX])
+    sorted_log_items = sorted(log_items, reverse=False, key=lambda item: item.created)
 
     for log_item in sorted_log_items:
-        if log_item[CHANGE_FIELD_INDEX] == "assignee" and log_item[TO_INDEX] == author_id:
+        if log_item.field == "assignee" and log_item.to == author_id:
             return log_item
 
     return None
@@ -192,10 +187,10 @@ def get_inprogress_log(log_items, author_id):
     :return: First occurrence of this event.
     """
 
-    sorted_log_items = sorted(log_items, reverse=False, key=lambda item: item[CREATED_INDEX])
+    sorted_log_items = sorted(log_items, reverse=False, key=lambda item: item.created)
 
     for log_item in sorted_log_items:
-        if log_item[AUTHOR_INDEX] == author_id and log_item[TO_STRING_INDEX] == "In Progress":
+        if log_item.author_id == author_id and log_item.to_string == "In Progress":
             return log_item
 
     return None
@@ -204,53 +199,44 @@ def get_inprogress_log(log_items, author_id):
 def get_log_create_date(log_item):
     """
     Returns the creation date of a log item as a String.
-    :param log_item: Log item as a tuple.
+    :param log_item: ChangeLogItem record.
     :return: The creation date. Parsed.
     """
 
     if log_item:
-        timestamp = log_item[CREATED_INDEX]
-        date_parsed = datetime.datetime.fromtimestamp(timestamp / 1000, tz=tzlocal())
+        timestamp = log_item.created
+        date_parsed = dateconv.from_timestamp_ms(timestamp)
         return date_parsed
 
     return None
 
 
-def get_JIRA_metrics(issue_id, project_id, created_date):
+def get_JIRA_metrics(issue_id, project_id, created_date, comment_count=None):
     """
     Gathers issue inflation information from the JIRA database.
     :param issue_id: JIRA issue identifier.
     :param project_id: JIRA project identifier.
     :param created_date: Timestamp were the JIRA issue was created..
+    :param comment_count: Number of comments of the issue, if already known (e.g. from jdata.get_comment_counts).
     :return: Earliest and latest affected versions, Earliest and latest fix versions, distance between earliest and
     latest affected versions in days, distance between earliest and latest affected versions in releases.
     """
 
-    JiraMetrics = namedtuple("JiraMetrics",
-                             ['earliest_affected', 'latest_affected_name', 'earliest_fix_name', 'latest_fix_name',
-                              'distance',
-                              'distance_releases', 'closest_release_name', 'resolved_by', 'start_date_parsed',
-                              'assignment_date_parsed', 'progress_date_parsed',
-                              'resolution_date_parsed',
-                              'resolution_time',
-                              'issue_comments_len', 'priority_changed_by', 'priority_changed_to',
-                              'priority_change_from', 'change_log_len', 'reopen_len', 'priority_change_date'])
-
     fix_versions = jdata.get_fix_versions(issue_id)
     earliest_fix, latest_fix = get_first_last_version(fix_versions)
-    earliest_fix_name = earliest_fix[VERSION_NAME_INDEX] if earliest_fix else None
-    latest_fix_name = latest_fix[VERSION_NAME_INDEX] if latest_fix else None
+    earliest_fix_name = earliest_fix.name if earliest_fix else None
+    latest_fix_name = latest_fix.name if latest_fix else None
 
     affected_versions = jdata.get_affected_versions(issue_id)
     earliest_affected, latest_affected = get_first_last_version(affected_versions)
-    latest_affected_name = latest_affected[VERSION_NAME_INDEX] if latest_affected else None
+    latest_affected_name = latest_affected.name if latest_affected else None
 
     closest_release = get_closest_release(created_date, project_id)
 
     jira_time_distance = get_release_distance_jira(project_id, closest_release, earliest_fix, unit="days")
     jira_distance = jira_time_distance.days if jira_time_distance else None
     jira_distance_releases = get_release_distance_jira(project_id, closest_release, earliest_fix, unit="releases")
-    closest_release_name = closest_release[VERSION_NAME_INDEX] if closest_release else None
+    closest_release_name = closest_release.name if closest_release else None
 
     resolved_by = None
     resolution_date_parsed = None
@@ -260,8 +246,8 @@ def get_JIRA_metrics(issue_id, project_id, created_date):
     resolution_log = get_resolution_log(log_items)
 
     if resolution_log:
-        resolved_by = resolution_log[AUTHOR_INDEX]
-        resol_timestamp = resolution_log[CREATED_INDEX]
+        resolved_by = resolution_log.author_id
+        resol_timestamp = resolution_log.created
         resolution_date_parsed = get_log_create_date(resolution_log)
         resolution_time = (resol_timestamp - created_date) / (1000 * 60 * 60)  # In hours
 
@@ -286,14 +272,15 @@ def get_JIRA_metrics(issue_id, project_id, created_date):
 
     priority_log = get_last_priority_log(log_items)
     if priority_log:
-        priority_changed_by = priority_log[AUTHOR_INDEX]
-        priority_changed_to = priority_log[TO_STRING_INDEX]
-        priority_change_from = priority_log[FROM_STRING_INDEX]
+        priority_changed_by = priority_log.author_id
+        priority_changed_to = priority_log.to_string
+        priority_change_from = priority_log.from_string
         priority_change_date = get_log_create_date(priority_log)
 
     reopen_logs = get_reopen_logs(log_items)
 
-    issue_comments = jdata.get_issue_comments(issue_id)
+    if comment_count is None:
+        comment_count = jdata.get_comment_count(issue_id)
 
     jira_metrics = JiraMetrics(earliest_affected=earliest_affected, latest_affected_name=latest_affected_name,
                                earliest_fix_name=earliest_fix_name, latest_fix_name=latest_fix_name,
@@ -303,7 +290,7 @@ def get_JIRA_metrics(issue_id, project_id, created_date):
                                assignment_date_parsed=assignment_date_parsed,
                                progress_date_parsed=progress_date_parsed,
                                resolution_date_parsed=resolution_date_parsed,
-                               resolution_time=resolution_time, issue_comments_len=len(issue_comments),
+                               resolution_time=resolution_time, issue_comments_len=comment_count,
                                priority_changed_by=priority_changed_by, priority_changed_to=priority_changed_to,
                                priority_change_from=priority_change_from, change_log_len=len(log_items),
                                reopen_len=len(reopen_logs), priority_change_date=priority_change_date)
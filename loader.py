@@ -3,12 +3,18 @@ Module reads information from Git and JIRA and moves it to the Database
 """
 
 import git
-import winsound
 import re
+import subprocess
 
 import catalog
+import dbwriter
+import gitcache
+import gitcounter
+import gitrunner
+import gitutils
 import jdata
 import gjdata
+import instrumentation
 import platform
 
 import jiracounter
@@ -24,40 +30,162 @@ CONTAINS_OPTION = "--contains"
 HEAD_OPTION = "-1"
 DATE_FORMAT_OPTION = "--format=%ai"
 SHORTSTAT_OPTION = "--shortstat"
-
-# TODO(cgavidia): Move to JDATA module
-KEY_INDEX = 31
+NUMSTAT_OPTIONS = ["--format=", "--numstat", "--no-renames", "--diff-merges=first-parent"]
+# Before git 2.31 there's no --diff-merges. For a single commit, as here, -m --first-parent diffs a merge against its
+# first parent too.
+LEGACY_NUMSTAT_OPTIONS = ["--format=", "--numstat", "--no-renames", "-m", "--first-parent"]
 
 REPO_LOCATION = 'C:\\Users\\Carlos G. Gavidia\\git\\'
 
+# If true, git results are reused across runs while the references of a repository don't move. See gitcache.
+USE_GIT_CACHE = True
+
+
+def notify_finished():
+    """
+    Beeps when a long-running process finishes. Only available on Windows.
+    :return: None.
+    """
+    if platform.system() == 'Windows':
+        import winsound
+        winsound.Beep(2500, 1000)
+
+
+def get_key_pattern(project_key):
+    """
+    Returns the compiled expression for finding JIRA issue keys of a project on commit messages.
+    :param project_key: JIRA's project key.
+    :return: Compiled regular expression.
+    """
+    return re.compile(WORD_BOUNDARY + re.escape(project_key) + r"-\d+" + WORD_BOUNDARY)
+
 
-def get_issues_and_commits(repositories, project_id):
+def get_git_runner():
+    """
+    Returns the runner for the git commands of a stage, with the persistent result cache if USE_GIT_CACHE is set.
+    :return: GitRunner instance.
     """
-    Per each of the repositories, it searches commits containing JIRA's project key.
+    return gitrunner.GitRunner(cache=gitcache.GitResultCache() if USE_GIT_CACHE else None)
+
+
+def run_git(git_client, command, *arguments):
+    """
+    Executes a git command through GitPython, recording it when instrumentation is enabled.
+    :param git_client: git.Git instance.
+    :param command: Git command, like log.
+    :param arguments: Command arguments.
+    :return: Command output.
+    """
+    start_time = instrumentation.start()
+    output = getattr(git_client, command)(*arguments)
+    instrumentation.record(instrumentation.GIT_CATEGORY, instrumentation.get_git_label(command, arguments), start_time,
+                           output.count("\n") + 1 if output else 0)
+    return output
+
+
+def link_commits(writer, project_id, repository, key_patterns, issue_keys, messages):
+    """
+    Links commits to the issue keys their messages contain.
+    :param writer: QueuedWriter for the issue_commit rows.
+    :param project_id: JIRA's Project Identifier.
+    :param repository: Repository name.
+    :param key_patterns: Compiled issue key expressions, from get_key_pattern.
+    :param issue_keys: Set of keys to link. Other keys found on messages are ignored.
+    :param messages: Iterable of (commit sha, message) tuples, like the ones of gitutils.stream_messages.
+    :return: Number of commits linked.
+    """
+    linked_commits = 0
+    for commit_sha, message in messages:
+        linked_keys = set(key for key_pattern in key_patterns for key in key_pattern.findall(message)) & issue_keys
+        if linked_keys:
+            linked_commits += 1
+            writer.write(gjdata.insert_commits_per_issue,
+                         [(project_id, repository, key, commit_sha) for key in sorted(linked_keys)])
+
+    return linked_commits
+
+
+def link_new_commits_and_issues(repositories, project_id, last_issue_update):
+    """
+    Incremental version of get_issues_and_commits. Issues already linked are only searched on the commits added since
+    the last scan, and new or changed issues on the whole history. Each repository is read in a single git log pass
+    per group of issues, instead of one per issue.
+    :param repositories: List of repository names.
+    :param project_id: JIRA's Project Identifier.
+    :param last_issue_update: Latest issue change seen on the last run.
+    :return: None
+    """
+    latest_issue_update = jdata.get_latest_issue_update(project_id)
+    issue_keys = jdata.get_project_issue_keys(project_id)
+    updated_keys = jdata.get_issues_updated_since(project_id, last_issue_update)
+    previous_tips = gjdata.get_scanned_tips(project_id)
+    key_patterns = [get_key_pattern(project_key) for project_key in set(key.rsplit("-", 1)[0] for key in issue_keys)]
+    print "Issues in project: ", len(issue_keys), ". Created or changed since the last run: ", len(updated_keys)
+
+    scanned_tips = {}
+    with dbwriter.QueuedWriter() as writer:
+        for repository in repositories:
+            repository_location = REPO_LOCATION + repository
+            scanned_tips[repository] = gitutils.get_reference_tips(repository_location)
+
+            full_scan_keys = issue_keys
+            if repository in previous_tips:
+                try:
+                    new_commits = gitutils.stream_messages(repository_location, ["--all"],
+                                                           ["^" + tip for tip in previous_tips[repository]])
+                    linked_commits = link_commits(writer, project_id, repository, key_patterns,
+                                                  issue_keys - updated_keys, new_commits)
+                    print linked_commits, " new commits linked on repository ", repository
+                    full_scan_keys = updated_keys
+                except subprocess.CalledProcessError:
+                    print "The last scan of repository ", repository, " is no longer valid. Scanning all commits"
+
+            if full_scan_keys:
+                linked_commits = link_commits(writer, project_id, repository, key_patterns, full_scan_keys,
+                                              gitutils.stream_messages(repository_location, ["--all"]))
+                print linked_commits, " commits linked to ", len(full_scan_keys), " issues on repository ", repository
+
+    gjdata.update_link_state(project_id, scanned_tips, latest_issue_update)
+
+
+def get_issues_and_commits(repositories, project_id, incremental=False):
+    """
+    Per each of the repositories, it searches commits containing JIRA's project key. Links already stored are kept,
+    and the state reached is recorded for incremental runs.
     :param repositories: List of repository locations.
     :param project_id: JIRA's Project Identifier.
+    :param incremental: If True and the project was linked before, only new commits and new or changed issues are
+    linked.
     :return: None
     """
+    gjdata.create_link_state_schema()
+    last_issue_update = gjdata.get_last_issue_update(project_id)
+    if incremental and last_issue_update is not None:
+        link_new_commits_and_issues(repositories, project_id, last_issue_update)
+        return
+
+    latest_issue_update = jdata.get_latest_issue_update(project_id)
+    scanned_tips = dict((repository, gitutils.get_reference_tips(REPO_LOCATION + repository))
+                        for repository in repositories)
 
     project_issues = jdata.get_project_issues(project_id)
     print "Issues in project: ", len(project_issues)
 
-    for issue in project_issues:
+    searches = [(issue.key, repository) for issue in project_issues for repository in repositories]
+    commands = [(REPO_LOCATION + repository, ["log", ALL_BRANCHES_OPTION,
+                                              PATTERN_OPTION + WORD_BOUNDARY + key + WORD_BOUNDARY,
+                                              FORMAT_SHA_OPTION], list) for key, repository in searches]
 
-        key = issue[KEY_INDEX]
-
-        for repository in repositories:
-            repository_location = REPO_LOCATION + repository
-            git_client = git.Git(repository_location)
-
-            commit_shas = git_client.log(ALL_BRANCHES_OPTION, PATTERN_OPTION + WORD_BOUNDARY + key + WORD_BOUNDARY,
-                                         FORMAT_SHA_OPTION).split("\n")
+    with get_git_runner() as runner, dbwriter.QueuedWriter() as writer:
+        for (key, repository), commit_shas in zip(searches, runner.map(commands)):
             db_records = [(project_id, repository, key, sha) for sha in commit_shas if sha]
             if db_records:
                 print "Writing ", len(db_records), " commits for Issue ", key, " found on repo ", repository
-                gjdata.insert_commits_per_issue(db_records)
+                writer.write(gjdata.insert_commits_per_issue, db_records)
             else:
-                print "No commits found for Issue ", key, " in repository ", repository_location
+                print "No commits found for Issue ", key, " in repository ", REPO_LOCATION + repository
+
+    gjdata.update_link_state(project_id, scanned_tips, latest_issue_update)
 
 
 def get_tags_per_commit(project_id):
@@ -67,19 +195,18 @@ def get_tags_per_commit(project_id):
     :return: None.
     """
     commits = gjdata.get_commits_per_project(project_id)
+    commands = [(REPO_LOCATION + repository, ["tag", CONTAINS_OPTION, commit_sha], list)
+                for commit_sha, repository in commits]
 
-    for commit_sha, repository in commits:
-        repository_location = REPO_LOCATION + repository
-        git_client = git.Git(repository_location)
-
-        tags = git_client.tag(CONTAINS_OPTION, commit_sha).split("\n")
-        db_records = [(project_id, repository, commit_sha, tag) for tag in tags if tag]
+    with get_git_runner() as runner, dbwriter.QueuedWriter() as writer:
+        for (commit_sha, repository), tags in zip(commits, runner.map(commands)):
+            db_records = [(project_id, repository, commit_sha, tag) for tag in tags if tag]
 
-        if db_records:
-            print "Writing ", len(db_records), " tags for commit ", commit_sha
-            gjdata.insert_tags_per_commit(db_records)
-        else:
-            print "No tags found for commit: ", commit_sha
+            if db_records:
+                print "Writing ", len(db_records), " tags for commit ", commit_sha
+                writer.write(gjdata.insert_tags_per_commit, db_records)
+            else:
+                print "No tags found for commit: ", commit_sha
 
 
 def get_tags(project_id, repositories):
@@ -89,62 +216,72 @@ def get_tags(project_id, repositories):
     :param repositories: List of repositories.
     :return: None.
     """
-    db_records = []
-
+    repository_tags = []
     for repository in repositories:
-        repository_location = REPO_LOCATION + repository
+        git_client = git.Git(REPO_LOCATION + repository)
+        repository_tags.extend((repository, tag_name) for tag_name in run_git(git_client, "tag").split("\n"))
+
+    commands = [(REPO_LOCATION + repository, ["log", HEAD_OPTION, DATE_FORMAT_OPTION, tag_name],
+                 gitrunner.read_output) for repository, tag_name in repository_tags]
+
+    with get_git_runner() as runner, dbwriter.QueuedWriter() as writer:
+        for (repository, tag_name), tag_date in zip(repository_tags, runner.map(commands)):
+            print "Date for tag ", tag_name, " in repository ", repository, " is ", tag_date
+            writer.write(gjdata.insert_git_tags, [(project_id, repository, tag_name, tag_date)])
 
-        git_client = git.Git(repository_location)
-        all_tags = git_client.tag().split("\n")
+    gitcounter.clear_release_tags(project_id)
+    print "Updated ", writer.rows, " tag dates for project ", project_id, ". ", runner
+
+
+def get_numstat_totals(lines):
+    """
+    Adds up the output of git log --numstat, like GitPython's Stats do: binary files count as changed files, with no
+    line changes.
+    :param lines: Output lines.
+    :return: Dictionary with insertions, deletions, lines and files.
+    """
+    total_stats = {'insertions': 0, 'deletions': 0, 'lines': 0, 'files': 0}
+    for line in lines:
+        if not line:
+            continue
 
-        for tag_name in all_tags:
-            print "tag_name ", tag_name, " repository ", repository
-            tag_date = git_client.log(HEAD_OPTION, DATE_FORMAT_OPTION, tag_name)
+        insertions, deletions, _ = line.split("\t", 2)
+        insertions = int(insertions) if insertions != "-" else 0
+        deletions = int(deletions) if deletions != "-" else 0
 
-            print "Date for tag ", tag_name, " is ", tag_date
-            db_records.append((project_id, repository, tag_name, tag_date))
+        total_stats['insertions'] += insertions
+        total_stats['deletions'] += deletions
+        total_stats['lines'] += insertions + deletions
+        total_stats['files'] += 1
 
-    print "Updating ", len(db_records), " tag dates for project ", project_id
-    gjdata.insert_git_tags(db_records)
+    return total_stats
 
 
 def get_stats_per_commit(project_id):
     """
-    Retrieves and stores commit stats in the database.
+    Retrieves and stores commit stats in the database. Commits are diffed against their first parent, like
+    GitPython's Commit.stats. Only a few git processes are alive at any time, so there's no need to raise the limit
+    of open files.
     :param project_id: JIRA project identifier.
     :return: None.
     """
-
-    # To avoid the "too many open files" error
-    # TODO The error persists. Waiting for a response from the community.
-    if platform.system() == 'Windows':
-        print "Changing the max files parameter..."
-        import win32file
-        win32file._setmaxstdio(2048)
-
     print "Retrieving stat information for commits on project " + project_id
 
     commits = gjdata.get_commits_per_project(project_id)
-    db_records = []
+    numstat_options = NUMSTAT_OPTIONS if gitutils.get_git_version() >= gitutils.MIN_GIT_VERSION else \
+        LEGACY_NUMSTAT_OPTIONS
+    commands = [(REPO_LOCATION + repository, ["log", HEAD_OPTION] + numstat_options + [commit_sha],
+                 get_numstat_totals) for commit_sha, repository in commits]
 
     print "Reviewing ", len(commits), " commits..."
-    for commit_sha, repository in commits:
-        repository_location = REPO_LOCATION + repository
-        repository = git.Repo(repository_location)
-        commit = repository.rev_parse(commit_sha)
-
-        print "Stats obtained for commit ", commit_sha
-        total_stats = commit.stats.total
-        db_records.append(
-            (project_id, repository, commit_sha, total_stats['deletions'], total_stats['lines'],
-             total_stats['insertions'],
-             total_stats['files']))
+    with get_git_runner() as runner, dbwriter.QueuedWriter() as writer:
+        for (commit_sha, repository), total_stats in zip(commits, runner.map(commands)):
+            print "Stats obtained for commit ", commit_sha
+            writer.write(gjdata.insert_stats_per_commit,
+                         [(project_id, repository, commit_sha, total_stats['deletions'], total_stats['lines'],
+                           total_stats['insertions'], total_stats['files'])])
 
-        del total_stats
-        del repository
-
-    print "Storing ", len(db_records), " records in the database."
-    gjdata.insert_stats_per_commit(db_records)
+    print "Stored ", writer.rows, " records in the database. ", runner
 
 
 def get_commit_information(project_id):
@@ -152,38 +289,36 @@ def get_commit_information(project_id):
 
     commits = gjdata.get_commits_per_project(project_id)
 
+    commands = [(REPO_LOCATION + repository, ["log", HEAD_OPTION, FORMAT_AUTHOR_DATE, SHORTSTAT_OPTION, commit_sha],
+                 list) for commit_sha, repository in commits]
+
     print "Reviewing ", len(commits), " commits..."
-    commit_list = []
-    for commit_sha, repository in commits:
-        repository_location = REPO_LOCATION + repository
-        git_client = git.Git(repository_location)
-        commit_info = git_client.log(HEAD_OPTION, FORMAT_AUTHOR_DATE, SHORTSTAT_OPTION,
-                                     commit_sha).splitlines()
-
-        author = commit_info[0].split()[0]
-        commit_date = commit_info[0].split()[1]
-
-        lines = 0
-        insertions = 0
-        files = 0
-        deletions = 0
-        if len(commit_info) == 3:
-            for token in commit_info[2].split(','):
-                if "file" in token:
-                    files = int(re.findall('\d+', token)[0])
-                elif "insertion" in token:
-                    insertions = int(re.findall('\d+', token)[0])
-                    lines += insertions
-                elif "deletion" in token:
-                    deletions = int(re.findall('\d+', token)[0])
-                    lines += deletions
-
-        commit_tuple = (
-            project_id, repository, commit_sha, deletions, lines, insertions, files, author[1:], commit_date[:-1])
-        commit_list.append(commit_tuple)
-
-    print "Storing ", len(commit_list), " records in the database."
-    gjdata.insert_git_commits(commit_list)
+    with get_git_runner() as runner, dbwriter.QueuedWriter() as writer:
+        for (commit_sha, repository), commit_info in zip(commits, runner.map(commands)):
+
+            author = commit_info[0].split()[0]
+            commit_date = commit_info[0].split()[1]
+
+            lines = 0
+            insertions = 0
+            files = 0
+            deletions = 0
+            if len(commit_info) == 3:
+                for token in commit_info[2].split(','):
+                    if "file" in token:
+                        files = int(re.findall('\d+', token)[0])
+                    elif "insertion" in token:
+                        insertions = int(re.findall('\d+', token)[0])
+                        lines += insertions
+                    elif "deletion" in token:
+                        deletions = int(re.findall('\d+', token)[0])
+                        lines += deletions
+
+            commit_tuple = (
+                project_id, repository, commit_sha, deletions, lines, insertions, files, author[1:], commit_date[:-1])
+            writer.write(gjdata.insert_git_commits, [commit_tuple])
+
+    print "Stored ", writer.rows, " records in the database. ", runner
 
 
 def main():
@@ -199,7 +334,7 @@ def main():
                 # get_stats_per_commit(project_id)
                 get_commit_information(project_id)
     finally:
-        winsound.Beep(2500, 1000)
+        notify_finished()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+"""
+Persistent cache for the per-issue metrics calculated from JIRA and Git. Entries are keyed by project, release regex
+and issue, and are only reused when the fingerprint of the inputs used to calculate them has not changed.
+"""
+
+import cPickle as pickle
+import hashlib
+import sqlite3
+
+import dbutils
+import gjdata
+import jdata
+
+DATABASE_FILE = "metrics_cache.sqlite"
+
+# Part of every fingerprint. It changes when the cached metrics change their format, e.g. from version tuples to
+# records.Version, so entries in the previous format are calculated again.
+FORMAT_VERSION = 2
+
+METRICS_DDL = "CREATE TABLE IF NOT EXISTS issue_metrics " \
+              "(project_id TEXT, release_regex TEXT, issue_key TEXT, fingerprint TEXT, jira_metrics BLOB, " \
+              "git_metrics BLOB, PRIMARY KEY (project_id, release_regex, issue_key))"
+
+
+def create_schema():
+    """
+    Creates the cache table, if it doesn't exist.
+    :return: None
+    """
+    dbutils.create_schema([METRICS_DDL], DATABASE_FILE)
+
+
+def get_project_fingerprint(project_id):
+    """
+    Fingerprint of the project-wide information used by the metrics: JIRA versions and Git tags. Every version and
+    tag is part of it, so renaming one or changing an older date also changes the fingerprint.
+    :param project_id: JIRA project identifier.
+    :return: Fingerprint as a string.
+    """
+    versions = sorted((version.name, version.release_date) for version in jdata.get_versions_by_project(project_id))
+    tags = sorted((tag.repository, tag.name, tag.date) for tag in gjdata.get_tags_by_project(project_id))
+
+    return "%s:%s" % (FORMAT_VERSION, hashlib.sha1(repr((versions, tags))).hexdigest())
+
+
+def get_issue_fingerprints(project_id):
+    """
+    Fingerprints of the per-issue information of a project: change log, affected and fix versions, and commits.
+    :param project_id: JIRA project identifier.
+    :return: A dictionary with JIRA fingerprints per issue id, and another with commit fingerprints per key.
+    """
+    change_log_fingerprints = dict((row[0], row[1:]) for row in jdata.get_change_log_fingerprints(project_id))
+    affected_version_fingerprints = dict((row[0], row[1:]) for row in
+                                         jdata.get_affected_version_fingerprints(project_id))
+    fix_version_fingerprints = dict((row[0], row[1:]) for row in jdata.get_fix_version_fingerprints(project_id))
+
+    issue_ids = set(change_log_fingerprints) | set(affected_version_fingerprints) | set(fix_version_fingerprints)
+    jira_fingerprints = dict((issue_id, (change_log_fingerprints.get(issue_id),
+                                         affected_version_fingerprints.get(issue_id),
+                                         fix_version_fingerprints.get(issue_id))) for issue_id in issue_ids)
+    commit_fingerprints = dict((row[0], row[1:]) for row in gjdata.get_commit_fingerprints(project_id))
+
+    return jira_fingerprints, commit_fingerprints
+
+
+def get_cached_metrics(project_id, release_regex):
+    """
+    Returns the cached metrics of a project.
+    :param project_id: JIRA project identifier.
+    :param release_regex: Regular expression for valid releases.
+    :return: Dictionary, with the issue key as key and a (fingerprint, JIRA metrics, Git metrics) tuple as value.
+    """
+    cache_sql = "SELECT issue_key, fingerprint, jira_metrics, git_metrics FROM issue_metrics " \
+                "WHERE project_id=? AND release_regex=?"
+    rows = dbutils.execute_query(cache_sql, (project_id, release_regex), DATABASE_FILE)
+
+    return dict((key, (fingerprint, pickle.loads(str(jira_metrics)), pickle.loads(str(git_metrics))))
+                for key, fingerprint, jira_metrics, git_metrics in rows)
+
+
+def store_metrics(project_id, release_regex, metric_list):
+    """
+    Stores calculated metrics in the cache.
+    :param project_id: JIRA project identifier.
+    :param release_regex: Regular expression for valid releases.
+    :param metric_list: List of (issue key, fingerprint, JIRA metrics, Git metrics) tuples.
+    :return: None
+    """
+    metrics_insert = "INSERT OR REPLACE INTO issue_metrics VALUES (?, ?, ?, ?, ?, ?)"
+    db_records = [(project_id, release_regex, key, fingerprint,
+                   sqlite3.Binary(pickle.dumps(jira_metrics, pickle.HIGHEST_PROTOCOL)),
+                   sqlite3.Binary(pickle.dumps(git_metrics, pickle.HIGHEST_PROTOCOL)))
+                  for key, fingerprint, jira_metrics, git_metrics in metric_list]
+    dbutils.load_list(metrics_insert, db_records, DATABASE_FILE)
+
+
+if __name__ == "__main__":
+    create_schema()
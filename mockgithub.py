@@ -0,0 +1,403 @@
+"""
+Local stand-in for the GitHub REST API, serving the tags, commits and compares of local Git repositories (e.g. the
+ones of a synthetic fixture), and the GraphQL commit lookups of ghgraphql. It enforces a rate limit like GitHub's, so
+the miners can be exercised without network access or tokens.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import datetime
+import json
+import multiprocessing
+import re
+import threading
+import time
+import urllib
+import urlparse
+
+from collections import Counter
+
+import gitutils
+
+OWNER = "apache"
+RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW = 3600
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+
+ROUTES = [("rate_limit", re.compile(r"^/rate_limit$")),
+          ("user", re.compile(r"^/users/(?P<owner>[^/]+)$")),
+          ("repository", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)$")),
+          ("tags", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)/tags$")),
+          ("commits", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)/commits$")),
+          ("commit", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)/commits/(?P<reference>[^/]+)$")),
+          ("compare", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)/compare/(?P<base>.+)\.\.\.(?P<head>.+)$")),
+          ("graphql", re.compile(r"^/graphql$"))]
+
+GRAPHQL_REPOSITORY_REGEX = re.compile(r'repository\(owner: "(?P<owner>[^"]+)", name: "(?P<name>[^"]+)"\)')
+GRAPHQL_OBJECT_REGEX = re.compile(r'(?P<alias>\w+): object\(oid: "(?P<oid>[0-9a-f]+)"\)')
+
+
+def get_iso_date(timestamp):
+    return datetime.datetime.utcfromtimestamp(int(timestamp)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def read_repository(repository_location):
+    """
+    Reads the commits and tags of a local repository.
+    :param repository_location: Location of the local repository.
+    :return: Commit dictionaries, newest first, and (tag name, commit sha) tuples.
+    """
+    return list(gitutils.stream_commits(repository_location, ["--all"])), gitutils.get_tags(repository_location)
+
+
+class MockGitHubServer(object):
+    """
+    HTTP server answering the GitHub API requests made by the miners: users, repositories, tags, commit lists,
+    single commits and compares. Repositories are read from repositories_directory/<name>.
+    """
+
+    def __init__(self, repositories_directory, rate_limit=RATE_LIMIT, rate_limit_window=RATE_LIMIT_WINDOW,
+                 latency=0.0):
+        self.repositories_directory = repositories_directory
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.latency = latency
+
+        self.lock = threading.Lock()
+        self.repositories = {}
+        self.requests = Counter()
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.remaining = rate_limit
+        self.reset_time = int(time.time()) + rate_limit_window
+
+        self.http_server = None
+        self.thread = None
+        self.base_url = None
+
+    def start(self):
+        """
+        Starts serving on a free local port, on a background thread.
+        :return: Base URL of the API.
+        """
+        self.http_server = ThreadingHTTPServer(("127.0.0.1", 0), MockGitHubRequestHandler)
+        self.http_server.mock = self
+        self.base_url = "http://127.0.0.1:%d" % self.http_server.server_address[1]
+
+        self.thread = threading.Thread(target=self.http_server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.thread.join()
+
+    def get_repository(self, name):
+        with self.lock:
+            if name not in self.repositories:
+                commits, tags = read_repository(self.repositories_directory.rstrip("/\\") + "/" + name)
+                self.repositories[name] = {'commits': commits, 'tags': tags,
+                                           'by_sha': dict((commit['sha'], commit) for commit in commits)}
+            return self.repositories[name]
+
+    def consume_request(self, route):
+        """
+        Counts a request against the rate limit. Every call must be followed by one to finish_request.
+        :param route: Route name, for the request statistics.
+        :return: True if the request is within the rate limit, and the rate limit headers.
+        """
+        with self.lock:
+            if time.time() >= self.reset_time:
+                self.remaining = self.rate_limit
+                self.reset_time = int(time.time()) + self.rate_limit_window
+
+            self.requests[route] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            allowed = self.remaining > 0
+            if allowed:
+                self.remaining -= 1
+            else:
+                self.rejected += 1
+
+            headers = {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": str(self.remaining),
+                       "X-RateLimit-Reset": str(self.reset_time)}
+        return allowed, headers
+
+    def finish_request(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def get_repository_url(self, name):
+        return self.base_url + "/repos/" + OWNER + "/" + name
+
+    def get_commit_json(self, name, commit, detailed):
+        """
+        Commit as returned by the API. Commits in lists and compares have no stats, like GitHub's.
+        """
+        repository_url = self.get_repository_url(name)
+        url = repository_url + "/commits/" + commit['sha']
+        commit_json = {
+            'sha': commit['sha'],
+            'url': url,
+            'html_url': "https://github.com/" + OWNER + "/" + name + "/commit/" + commit['sha'],
+            'comments_url': url + "/comments",
+            'commit': {'author': {'name': commit['author'], 'email': commit['author_mail'],
+                                  'date': get_iso_date(commit['author_date'])},
+                       'committer': {'name': commit['committer'], 'email': commit['committer_mail'],
+                                     'date': get_iso_date(commit['committer_date'])},
+                       'message': commit['message'],
+                       'tree': {'sha': commit['tree'], 'url': repository_url + "/git/trees/" + commit['tree']},
+                       'url': repository_url + "/git/commits/" + commit['sha'],
+                       'comment_count': 0},
+            'author': None,
+            'committer': None,
+            'parents': [{'sha': parent, 'url': repository_url + "/commits/" + parent} for parent in
+                        commit['parents']]}
+
+        if detailed:
+            commit_json['stats'] = {'total': commit['insertion'] + commit['deletion'],
+                                    'additions': commit['insertion'], 'deletions': commit['deletion']}
+            commit_json['files'] = []
+
+        return commit_json
+
+    def get_commit_node(self, name, commit):
+        """
+        Commit as returned by a GraphQL lookup. Dates keep the offset of the author and the committer, like GitHub's
+        GitTimestamp.
+        """
+        return {'oid': commit['sha'],
+                'message': commit['message'],
+                'additions': commit['insertion'],
+                'deletions': commit['deletion'],
+                'url': "https://github.com/" + OWNER + "/" + name + "/commit/" + commit['sha'],
+                'author': {'name': commit['author'], 'email': commit['author_mail'],
+                           'date': commit['author_timestamp']},
+                'committer': {'name': commit['committer'], 'email': commit['committer_mail'],
+                              'date': commit['committer_timestamp']},
+                'tree': {'oid': commit['tree']}}
+
+    def handle_graphql(self, query):
+        """
+        Answers the queries of ghgraphql: aliased object lookups by oid inside a repository. Other queries are
+        rejected.
+        :param query: GraphQL query.
+        :return: HTTP status and payload.
+        """
+        repository_match = GRAPHQL_REPOSITORY_REGEX.search(query)
+        if repository_match is None:
+            return 200, {'data': None, 'errors': [{'message': "Only repository object lookups are supported."}]}
+
+        name = repository_match.group("name")
+        try:
+            repository = self.get_repository(name)
+        except (OSError, ValueError):
+            return 200, {'data': {'repository': None},
+                         'errors': [{'type': "NOT_FOUND",
+                                     'message': "Could not resolve to a Repository with the name '" + name + "'."}]}
+
+        nodes = {}
+        for alias, oid in GRAPHQL_OBJECT_REGEX.findall(query):
+            commit = repository['by_sha'].get(oid)
+            nodes[alias] = self.get_commit_node(name, commit) if commit else None
+
+        return 200, {'data': {'repository': nodes}}
+
+    def resolve(self, repository, reference):
+        if reference in repository['by_sha']:
+            return repository['by_sha'][reference]
+
+        for tag_name, commit_sha in repository['tags']:
+            if tag_name == reference:
+                return repository['by_sha'][commit_sha]
+
+        return None
+
+    def get_ancestors(self, repository, commit):
+        ancestors = set()
+        pending = [commit['sha']]
+        while pending:
+            sha = pending.pop()
+            if sha not in ancestors and sha in repository['by_sha']:
+                ancestors.add(sha)
+                pending.extend(repository['by_sha'][sha]['parents'])
+        return ancestors
+
+    def handle(self, route, arguments, query):
+        """
+        Builds the response to a request.
+        :param route: Route name.
+        :param arguments: Arguments captured from the path.
+        :param query: Query string parameters.
+        :return: HTTP status and payload, and the items to paginate if the payload is a list.
+        """
+        if route == "rate_limit":
+            core = {'limit': self.rate_limit, 'remaining': self.remaining, 'reset': self.reset_time}
+            return 200, {'resources': {'core': core}, 'rate': core}
+
+        if route == "user":
+            return 200, {'login': arguments['owner'], 'type': "Organization",
+                         'url': self.base_url + "/users/" + arguments['owner']}
+
+        try:
+            repository = self.get_repository(arguments['name'])
+        except (OSError, ValueError):
+            return 404, {'message': "Not Found"}
+
+        name = arguments['name']
+        repository_url = self.get_repository_url(name)
+
+        if route == "repository":
+            return 200, {'name': name, 'full_name': OWNER + "/" + name, 'url': repository_url,
+                         'owner': {'login': OWNER, 'url': self.base_url + "/users/" + OWNER}}
+
+        if route == "tags":
+            return 200, [{'name': tag_name,
+                          'zipball_url': repository_url + "/zipball/" + tag_name,
+                          'tarball_url': repository_url + "/tarball/" + tag_name,
+                          'commit': {'sha': commit_sha, 'url': repository_url + "/commits/" + commit_sha}}
+                         for tag_name, commit_sha in repository['tags']]
+
+        if route == "commits":
+            return 200, [self.get_commit_json(name, commit, False) for commit in repository['commits']]
+
+        if route == "commit":
+            commit = self.resolve(repository, arguments['reference'])
+            if commit is None:
+                return 404, {'message': "Not Found"}
+            return 200, self.get_commit_json(name, commit, True)
+
+        if route == "compare":
+            base = self.resolve(repository, urllib.unquote(arguments['base']))
+            head = self.resolve(repository, urllib.unquote(arguments['head']))
+            if base is None or head is None:
+                return 404, {'message': "Not Found"}
+
+            base_ancestors = self.get_ancestors(repository, base)
+            head_ancestors = self.get_ancestors(repository, head)
+            commits = [self.get_commit_json(name, commit, False) for commit in reversed(repository['commits'])
+                       if commit['sha'] in head_ancestors and commit['sha'] not in base_ancestors]
+
+            return 200, {'url': repository_url + "/compare/" + arguments['base'] + "..." + arguments['head'],
+                         'status': "ahead", 'ahead_by': len(commits),
+                         'behind_by': len(base_ancestors - head_ancestors), 'total_commits': len(commits),
+                         'commits': commits, 'files': []}
+
+        return 404, {'message': "Not Found"}
+
+
+def run_server_process(repositories_directory, connection, rate_limit, rate_limit_window, latency):
+    server = MockGitHubServer(repositories_directory, rate_limit, rate_limit_window, latency)
+    connection.send(server.start())
+    connection.recv()
+    server.stop()
+
+
+def start_server_process(repositories_directory, rate_limit=RATE_LIMIT, rate_limit_window=RATE_LIMIT_WINDOW,
+                         latency=0.0):
+    """
+    Starts a mock server on a child process, so its CPU time is not charged to the client being measured.
+    :param repositories_directory: Directory of the repositories to serve.
+    :return: Base URL of the API, and a function that stops the server.
+    """
+    connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=run_server_process, args=(repositories_directory, child_connection,
+                                                                       rate_limit, rate_limit_window, latency))
+    process.daemon = True
+    process.start()
+    base_url = connection.recv()
+
+    def stop():
+        connection.send(None)
+        process.join()
+
+    return base_url, stop
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class MockGitHubRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def respond(self, verb):
+        mock = self.server.mock
+        parsed_url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(parsed_url.query))
+
+        route, arguments = None, {}
+        for route_name, route_regex in ROUTES:
+            match = route_regex.match(parsed_url.path)
+            if match:
+                route, arguments = route_name, match.groupdict()
+                break
+
+        if (route == "graphql") != (verb == "POST"):
+            route = None
+
+        body = None
+        if verb == "POST":
+            body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+
+        allowed, headers = mock.consume_request(route)
+        try:
+            if mock.latency:
+                time.sleep(mock.latency)
+
+            if route is None:
+                status, payload = 404, {'message': "Not Found"}
+            elif not allowed:
+                status, payload = 403, {'message': "API rate limit exceeded for 127.0.0.1.",
+                                        'documentation_url': "https://developer.github.com/v3/#rate-limiting"}
+            elif route == "graphql":
+                try:
+                    status, payload = mock.handle_graphql(json.loads(body)['query'])
+                except (ValueError, KeyError, TypeError):
+                    status, payload = 400, {'message': "Problems parsing JSON"}
+            else:
+                status, payload = mock.handle(route, arguments, query)
+        finally:
+            mock.finish_request()
+
+        if isinstance(payload, list):
+            payload = self.paginate(payload, parsed_url.path, query, headers)
+
+        self.send_json(status, payload, headers)
+
+    def paginate(self, items, path, query, headers):
+        per_page = min(int(query.get('per_page', DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+        page = int(query.get('page', 1))
+        last_page = max(1, (len(items) + per_page - 1) // per_page)
+
+        if page < last_page:
+            page_url = self.server.mock.base_url + path + "?"
+            next_query = dict(query, page=page + 1, per_page=per_page)
+            last_query = dict(query, page=last_page, per_page=per_page)
+            headers["Link"] = '<%s>; rel="next", <%s>; rel="last"' % (page_url + urllib.urlencode(next_query),
+                                                                      page_url + urllib.urlencode(last_query))
+
+        return items[(page - 1) * per_page:page * per_page]
+
+    def send_json(self, status, payload, headers):
+        body = json.dumps(payload)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
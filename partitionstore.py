@@ -0,0 +1,117 @@
+"""
+Module for the merged dataset of all projects. It is stored as one partition per JIRA project, and a partition is only
+rewritten when the consolidated file of its project changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+STORE_LOCATION = os.path.join(".", "UNFILTERED", "partitions")
+MANIFEST_FILE = os.path.join(STORE_LOCATION, "manifest.json")
+PARTITION_PREFIX = "project_id="
+
+
+def get_partition_file_name(project_id, extension):
+    """
+    Returns the location of the partition of a project.
+    :param project_id: JIRA project identifier.
+    :param extension: File extension, like ".csv".
+    :return: File name.
+    """
+    return os.path.join(STORE_LOCATION, PARTITION_PREFIX + project_id + extension)
+
+
+def get_file_fingerprint(file_name, chunk_size=1024 * 1024):
+    """
+    Fingerprint of a file, based on its contents. The consolidated files are rewritten on every run, so modification
+    times can't be used.
+    :param file_name: File name.
+    :param chunk_size: Bytes read at a time.
+    :return: Fingerprint as string.
+    """
+    digest = hashlib.md5()
+    with open(file_name, "rb") as file_input:
+        for chunk in iter(lambda: file_input.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_manifest():
+    """
+    Returns the partitions stored.
+    :return: Dictionary, with project identifiers as keys and dictionaries with file name and fingerprint as values.
+    """
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+
+    with open(MANIFEST_FILE) as manifest:
+        return json.load(manifest)
+
+
+def write_manifest(manifest):
+    with open(MANIFEST_FILE, "w") as manifest_output:
+        json.dump(manifest, manifest_output, indent=1, sort_keys=True)
+
+
+def update_partition(project_id, source_file, manifest=None):
+    """
+    Copies the consolidated file of a project into the store, if it changed since the last update.
+    :param project_id: JIRA project identifier.
+    :param source_file: Consolidated file of the project.
+    :param manifest: Current manifest. If None, it's read from disk and written back after the update.
+    :return: True if the partition was updated, False if it was up to date.
+    """
+    write_back = manifest is None
+    if manifest is None:
+        manifest = load_manifest()
+
+    fingerprint = get_file_fingerprint(source_file)
+    partition_file = get_partition_file_name(project_id, os.path.splitext(source_file)[1])
+    partition = manifest.get(project_id)
+
+    if partition and partition['fingerprint'] == fingerprint and partition['file_name'] == partition_file and \
+            os.path.exists(partition_file):
+        return False
+
+    if not os.path.exists(STORE_LOCATION):
+        os.makedirs(STORE_LOCATION)
+
+    if partition and partition['file_name'] != partition_file and os.path.exists(partition['file_name']):
+        os.remove(partition['file_name'])
+
+    shutil.copyfile(source_file, partition_file)
+    manifest[project_id] = {'file_name': partition_file, 'fingerprint': fingerprint}
+
+    if write_back:
+        write_manifest(manifest)
+
+    return True
+
+
+def update_partitions(source_files):
+    """
+    Updates the partitions of several projects.
+    :param source_files: Dictionary, with project identifiers as keys and consolidated files as values.
+    :return: List of the project identifiers whose partition was updated.
+    """
+    manifest = load_manifest()
+    updated_projects = [project_id for project_id, source_file in sorted(source_files.items()) if
+                        update_partition(project_id, source_file, manifest)]
+    write_manifest(manifest)
+
+    print "Merged store: ", len(updated_projects), " of ", len(source_files), " partitions updated."
+    return updated_projects
+
+
+def get_partition_files(project_ids=None):
+    """
+    Returns the partition files of the store.
+    :param project_ids: Project identifiers to include. If None, all the partitions are returned.
+    :return: List of (project identifier, file name) tuples.
+    """
+    manifest = load_manifest()
+    return [(project_id, partition['file_name']) for project_id, partition in sorted(manifest.items()) if
+            project_ids is None or project_id in project_ids]
@@ -0,0 +1,406 @@
+"""
+Declarative runner for the mining pipeline. Each stage declares the stages it depends on and the resources it reads
+and writes, so stages whose outputs are up to date are skipped, and independent stages run concurrently.
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+from collections import Counter, namedtuple
+from multiprocessing.pool import ThreadPool
+
+import catalog
+import dbutils
+import gdata
+import gitutils
+import gjdata
+import gminer
+import instrumentation
+import jdata
+import loader
+import prioritysummary
+import relcounter
+import repomaint
+
+STATE_FILE = "pipeline_state.json"
+RUN_LOG_FILE = "pipeline_run_log.csv"
+# rows: rows the stage wrote on its output tables, including the ones it replaced.
+RUN_LOG_HEADER = ["run_id", "stage", "project_key", "status", "wall_time", "rows"]
+
+WORKERS = 4
+
+CACHED_STATUS = "cached"
+EXECUTED_STATUS = "executed"
+FAILED_STATUS = "failed"
+SKIPPED_STATUS = "skipped"
+
+
+class FileResource(object):
+    """
+    A file produced or consumed by a stage.
+    """
+
+    def __init__(self, file_name_function):
+        self.file_name_function = file_name_function
+
+    def get_file_name(self, config):
+        return self.file_name_function(config)
+
+    def exists(self, config):
+        return os.path.exists(self.get_file_name(config))
+
+    def get_fingerprint(self, config):
+        file_name = self.get_file_name(config)
+        if not os.path.exists(file_name):
+            return None
+
+        file_stats = os.stat(file_name)
+        return "%s:%s" % (file_stats.st_size, file_stats.st_mtime)
+
+    def get_row_count(self, config):
+        return None
+
+    def get_written_rows(self, row_counter):
+        return None
+
+
+class TableResource(object):
+    """
+    The rows of a project, or of its repositories, on a database table.
+    """
+
+    def __init__(self, data_module, table, key_column="project_id"):
+        self.data_module = data_module
+        self.table = table
+        self.key_column = key_column
+
+    def get_keys(self, config):
+        if self.key_column == "repository":
+            return config['repositories']
+
+        return [config['project_id']]
+
+    def get_row_count(self, config):
+        keys = self.get_keys(config)
+        count_sql = "SELECT COUNT(*) FROM " + self.table + " WHERE " + self.key_column + " IN (" + \
+                    ", ".join("?" * len(keys)) + ")"
+
+        try:
+            return dbutils.execute_query(count_sql, keys, self.data_module.DATABASE_FILE)[0][0]
+        except sqlite3.OperationalError:
+            return 0
+
+    def get_written_rows(self, row_counter):
+        return row_counter[self.table]
+
+    def exists(self, config):
+        return self.get_row_count(config) > 0
+
+    def get_fingerprint(self, config):
+        return str(self.get_row_count(config))
+
+
+class RepositoryResource(object):
+    """
+    The local clones of the project repositories.
+    """
+
+    def exists(self, config):
+        return all(os.path.exists(loader.REPO_LOCATION + repository) for repository in config['repositories'])
+
+    def get_fingerprint(self, config):
+        return ",".join(gitutils.get_refs_fingerprint(loader.REPO_LOCATION + repository) for repository in
+                        config['repositories'])
+
+    def get_row_count(self, config):
+        return None
+
+    def get_written_rows(self, row_counter):
+        return None
+
+
+Stage = namedtuple("Stage", ['name', 'function', 'depends_on', 'inputs', 'outputs'])
+
+JIRA_DATABASE = FileResource(lambda config: jdata.DATABASE_FILE)
+REPOSITORIES = RepositoryResource()
+
+
+def run_github_stage(config, store_function):
+    client = gminer.get_client()
+    for repository_name in config['repositories']:
+        store_function(gminer.get_repository(client, repository_name))
+
+
+def write_summaries(config):
+    project_dataframe = relcounter.get_project_dataframe(config['project_id'], filter=False)
+    training_dataframe = relcounter.get_validated_dataframe(project_dataframe)
+    relcounter.get_analysis_summaries(config['project_id'], project_dataframe, training_dataframe)
+
+
+STAGES = [
+    # Clones are not fetched here, since fetching moves the references the loader stages take as input.
+    Stage(name="prepare_repositories",
+          function=lambda config: repomaint.prepare_repositories(config['repositories'], fetch=False),
+          depends_on=[], inputs=[REPOSITORIES],
+          outputs=[TableResource(gjdata, "repository_health", key_column="repository")]),
+    Stage(name="issues_and_commits",
+          function=lambda config: loader.get_issues_and_commits(config['repositories'], config['project_id'],
+                                                                incremental=True),
+          depends_on=["prepare_repositories"], inputs=[JIRA_DATABASE, REPOSITORIES],
+          outputs=[TableResource(gjdata, "issue_commit")]),
+    Stage(name="tags_per_commit",
+          function=lambda config: loader.get_tags_per_commit(config['project_id']),
+          depends_on=["issues_and_commits"], inputs=[REPOSITORIES],
+          outputs=[TableResource(gjdata, "commit_tag")]),
+    Stage(name="tags",
+          function=lambda config: loader.get_tags(config['project_id'], config['repositories']),
+          depends_on=["prepare_repositories"], inputs=[REPOSITORIES],
+          outputs=[TableResource(gjdata, "git_tag")]),
+    Stage(name="commit_information",
+          function=lambda config: loader.get_commit_information(config['project_id']),
+          depends_on=["issues_and_commits"], inputs=[REPOSITORIES],
+          outputs=[TableResource(gjdata, "git_commit")]),
+    Stage(name="consolidate_information",
+          function=lambda config: relcounter.consolidate_information(config['project_id'],
+                                                                     config['release_matcher'],
+                                                                     config['project_key']),
+          depends_on=["tags_per_commit", "tags", "commit_information"], inputs=[JIRA_DATABASE],
+          outputs=[FileResource(lambda config: relcounter.get_consolidated_file_name(config['project_id']))]),
+    Stage(name="priority_summaries",
+          function=write_summaries,
+          depends_on=["consolidate_information"], inputs=[],
+          outputs=[FileResource(lambda config: prioritysummary.get_summary_file_name(
+              config['project_id']))])
+]
+
+GITHUB_STAGES = [
+    Stage(name="github_tags",
+          function=lambda config: run_github_stage(config, gminer.store_repository_tags),
+          depends_on=[], inputs=[],
+          outputs=[TableResource(gdata, "release_tag", key_column="repository")]),
+    Stage(name="github_tag_commits",
+          function=lambda config: run_github_stage(config, gminer.store_commits_per_tag),
+          depends_on=["github_tags"], inputs=[],
+          outputs=[TableResource(gdata, "github_commit", key_column="repository")]),
+    Stage(name="github_compares",
+          function=lambda config: run_github_stage(
+              config, lambda repository: gminer.store_commits_between_tags(repository, config['release_matcher'])),
+          depends_on=["github_tag_commits"], inputs=[],
+          outputs=[TableResource(gdata, "git_compare", key_column="repository")])
+]
+
+
+def get_input_fingerprint(stage, config, state):
+    """
+    Fingerprint of everything a stage reads: its input resources and the completion of the stages it depends on.
+    :param stage: Stage.
+    :param config: Project configuration.
+    :param state: Pipeline state.
+    :return: Fingerprint as string.
+    """
+    input_fingerprints = [resource.get_fingerprint(config) for resource in stage.inputs]
+    upstream_fingerprints = [state.get(get_state_key(upstream, config), {}).get('completed') for upstream in
+                             stage.depends_on]
+
+    return json.dumps([input_fingerprints, upstream_fingerprints])
+
+
+def get_state_key(stage_name, config):
+    return stage_name + ":" + config['project_key']
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+
+    with open(STATE_FILE) as state_file:
+        return json.load(state_file)
+
+
+def write_state(state):
+    with open(STATE_FILE, "w") as state_file:
+        json.dump(state, state_file, indent=1, sort_keys=True)
+
+
+def is_up_to_date(stage, config, state, input_fingerprint):
+    """
+    A stage is up to date if it completed with the same inputs, and all of its outputs are still there.
+    :param stage: Stage.
+    :param config: Project configuration.
+    :param state: Pipeline state.
+    :param input_fingerprint: Current fingerprint of the stage inputs.
+    :return: True if the stage can be skipped.
+    """
+    stage_state = state.get(get_state_key(stage.name, config))
+    if not stage_state or stage_state.get('input_fingerprint') != input_fingerprint:
+        return False
+
+    return all(resource.exists(config) for resource in stage.outputs)
+
+
+def get_written_rows(stage, row_counter):
+    row_counts = [resource.get_written_rows(row_counter) for resource in stage.outputs]
+    row_counts = [row_count for row_count in row_counts if row_count is not None]
+    return sum(row_counts) if row_counts else None
+
+
+class PipelineRun(object):
+    """
+    A run of a set of stages over a set of projects.
+    """
+
+    def __init__(self, stages, configs, force=False, workers=WORKERS):
+        self.stages = stages
+        self.configs = configs
+        self.force = force
+        self.workers = workers
+
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.state = load_state()
+        self.lock = threading.Lock()
+        self.log_records = []
+
+    def run_stage(self, stage, config):
+        """
+        Runs a stage for a project, unless it is up to date.
+        :param stage: Stage.
+        :param config: Project configuration.
+        :return: Stage status.
+        """
+        input_fingerprint = get_input_fingerprint(stage, config, self.state)
+        up_to_date = not self.force and is_up_to_date(stage, config, self.state, input_fingerprint)
+
+        if up_to_date:
+            self.log(stage, config, CACHED_STATUS, 0.0, None)
+            return CACHED_STATUS
+
+        # Rows are counted as they are written, since a forced run replacing its previous rows doesn't change the
+        # table sizes.
+        row_counter = Counter()
+        dbutils.set_row_counter(row_counter)
+        start_time = time.time()
+        try:
+            print "Stage ", stage.name, " started for project ", config['project_key']
+            with instrumentation.profiled(stage.name, config['project_key']):
+                stage.function(config)
+        except Exception:
+            traceback.print_exc()
+            self.log(stage, config, FAILED_STATUS, time.time() - start_time, None)
+            return FAILED_STATUS
+        finally:
+            dbutils.set_row_counter(None)
+
+        wall_time = time.time() - start_time
+        rows = get_written_rows(stage, row_counter)
+
+        with self.lock:
+            self.state[get_state_key(stage.name, config)] = {'input_fingerprint': input_fingerprint,
+                                                             'completed': self.run_id + ":" + str(time.time())}
+            write_state(self.state)
+
+        self.log(stage, config, EXECUTED_STATUS, wall_time, rows)
+        return EXECUTED_STATUS
+
+    def log(self, stage, config, status, wall_time, rows):
+        print "Stage ", stage.name, " for project ", config['project_key'], ": ", status, " in ", wall_time, \
+            " seconds. Rows: ", rows
+        with self.lock:
+            self.log_records.append([self.run_id, stage.name, config['project_key'], status, wall_time, rows])
+
+    def execute(self):
+        """
+        Runs every stage for every project. A stage starts as soon as the stages it depends on have finished, and
+        it's skipped if one of them failed.
+        :return: Dictionary with the status per (stage name, project key).
+        """
+        stage_names = set(stage.name for stage in self.stages)
+        pending = [(stage, config) for config in self.configs for stage in self.stages]
+        statuses = {}
+        running = {}
+
+        # Stages of different projects write the same databases concurrently: connections wait for the database lock
+        # (dbutils.BUSY_TIMEOUT), loader inserts replace the rows of a previous run, and shared caches are locked.
+        pool = ThreadPool(self.workers)
+        try:
+            while pending or running:
+                for stage, config in list(pending):
+                    dependencies = [(name, config['project_key']) for name in stage.depends_on if
+                                    name in stage_names]
+
+                    if any(statuses.get(dependency) in (FAILED_STATUS, SKIPPED_STATUS) for dependency in
+                           dependencies):
+                        pending.remove((stage, config))
+                        statuses[(stage.name, config['project_key'])] = SKIPPED_STATUS
+                        self.log(stage, config, SKIPPED_STATUS, 0.0, None)
+                    elif all(dependency in statuses for dependency in dependencies):
+                        pending.remove((stage, config))
+                        running[(stage.name, config['project_key'])] = pool.apply_async(self.run_stage,
+                                                                                        (stage, config))
+
+                for key, result in list(running.items()):
+                    if result.ready():
+                        statuses[key] = result.get()
+                        del running[key]
+
+                time.sleep(0.1)
+        finally:
+            pool.close()
+            pool.join()
+            self.write_run_log()
+
+        return statuses
+
+    def write_run_log(self):
+        write_header = not os.path.exists(RUN_LOG_FILE)
+        with open(RUN_LOG_FILE, "ab") as run_log:
+            writer = csv.writer(run_log)
+            if write_header:
+                writer.writerow(RUN_LOG_HEADER)
+            writer.writerows(self.log_records)
+
+
+def get_configs(project_keys=None):
+    """
+    Returns the catalog configurations, optionally restricted to some projects.
+    :param project_keys: List of JIRA project keys. If None, all the catalog projects are returned.
+    :return: List of project configurations.
+    """
+    return [config for config in catalog.get_project_catalog() if
+            config and (project_keys is None or config['project_key'] in project_keys)]
+
+
+def main(arguments=None):
+    all_stages = STAGES + GITHUB_STAGES
+
+    parser = argparse.ArgumentParser(description="Runs the mining pipeline.")
+    parser.add_argument("--stage", action="append", choices=[stage.name for stage in all_stages],
+                        help="Stage to run. It can be repeated. By default, all stages except GitHub ones.")
+    parser.add_argument("--project", action="append", help="JIRA project key. By default, all catalog projects.")
+    parser.add_argument("--github", action="store_true", help="Also run the GitHub mining stages.")
+    parser.add_argument("--force", action="store_true", help="Run the stages even if they are up to date.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Stages running concurrently.")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.stage:
+        stages = [stage for stage in all_stages if stage.name in arguments.stage]
+    else:
+        stages = STAGES + (GITHUB_STAGES if arguments.github else [])
+
+    pipeline_run = PipelineRun(stages, get_configs(arguments.project), force=arguments.force,
+                               workers=arguments.workers)
+    statuses = pipeline_run.execute()
+
+    if FAILED_STATUS in statuses.values():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Module for summarizing the issue distribution per priority. A summary is a compact table with the number of issues per
+distance column, priority, number of commits and distance value. Histograms, boxplot statistics and value counts are
+derived from it, so charts and cross-project merges don't need to go back to the issue rows.
+"""
+
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+PRIORITY_COLUMN = 'Priority'
+COMMITS_COLUMN = 'Commits'
+SUMMARY_COLUMNS = ['column', PRIORITY_COLUMN, COMMITS_COLUMN, 'value', 'count']
+# Label of issues without priority, which groupby would otherwise drop. It's what JIRA shows for an empty field.
+NO_PRIORITY = 'None'
+
+HISTOGRAM_BINS = 10
+WHISKER_RANGE = 1.5
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def summarize(issues_dataframe, distance_columns):
+    """
+    Summarizes the distance columns of a dataframe on a single groupby pass.
+    :param issues_dataframe: Dataframe with issues.
+    :param distance_columns: Columns to summarize.
+    :return: Summary dataframe, with SUMMARY_COLUMNS as columns.
+    """
+    issue_values = issues_dataframe[[PRIORITY_COLUMN, COMMITS_COLUMN] + list(distance_columns)].copy()
+    issue_values[PRIORITY_COLUMN] = issue_values[PRIORITY_COLUMN].astype(object).fillna(NO_PRIORITY)
+    issue_values[COMMITS_COLUMN] = issue_values[COMMITS_COLUMN].astype(float)
+
+    melted_values = pd.melt(issue_values, id_vars=[PRIORITY_COLUMN, COMMITS_COLUMN], value_vars=list(distance_columns),
+                            var_name='column', value_name='value')
+    melted_values['value'] = melted_values['value'].astype(float)
+    melted_values = melted_values.dropna(subset=['value'])
+
+    summary = melted_values.groupby(['column', PRIORITY_COLUMN, COMMITS_COLUMN, 'value']).size()
+    return summary.reset_index(name='count')
+
+
+def merge_summaries(summaries):
+    """
+    Merges the summaries of several projects.
+    :param summaries: List of summary dataframes.
+    :return: Merged summary.
+    """
+    merged_summary = pd.concat(summaries)
+    merged_summary = merged_summary.groupby(['column', PRIORITY_COLUMN, COMMITS_COLUMN, 'value'])['count'].sum()
+    return merged_summary.reset_index()
+
+
+def get_column_summary(summary, distance_column, priority=None):
+    """
+    Returns the summary rows of a distance column, optionally restricted to a priority.
+    :param summary: Summary dataframe.
+    :param distance_column: Distance column.
+    :param priority: Priority value. If None, all priorities are considered.
+    :return: Summary rows.
+    """
+    column_summary = summary[summary['column'] == distance_column]
+    if priority is not None:
+        column_summary = column_summary[column_summary[PRIORITY_COLUMN] == priority]
+
+    return column_summary
+
+
+def get_issue_count(column_summary):
+    return int(column_summary['count'].sum())
+
+
+def get_value_counts(column_summary, group_column, normalize=True):
+    """
+    Equivalent of Series.value_counts() over the summarized issues.
+    :param column_summary: Summary rows.
+    :param group_column: Column to count, like PRIORITY_COLUMN or COMMITS_COLUMN.
+    :param normalize: If True, returns proportions instead of counts.
+    :return: Series, sorted by index.
+    """
+    value_counts = column_summary.groupby(group_column)['count'].sum().sort_index()
+    if normalize:
+        value_counts = value_counts / float(value_counts.sum())
+
+    return value_counts
+
+
+def get_weighted_values(column_summary):
+    """
+    Returns the distinct distance values, sorted, and how many issues have each of them.
+    :param column_summary: Summary rows.
+    :return: Arrays of values and counts.
+    """
+    weighted_values = column_summary.groupby('value')['count'].sum().sort_index()
+    return weighted_values.index.values.astype(float), weighted_values.values
+
+
+def get_quantile(values, counts, quantile):
+    """
+    Quantile with linear interpolation, as numpy.percentile, over weighted values.
+    :param values: Sorted distinct values.
+    :param counts: Occurrences of each value.
+    :param quantile: Quantile, between 0 and 1.
+    :return: Quantile value.
+    """
+    cumulative_counts = np.cumsum(counts)
+    position = (cumulative_counts[-1] - 1) * quantile
+    lower_position = int(math.floor(position))
+    upper_position = min(lower_position + 1, cumulative_counts[-1] - 1)
+
+    lower_value = values[np.searchsorted(cumulative_counts, lower_position, side='right')]
+    upper_value = values[np.searchsorted(cumulative_counts, upper_position, side='right')]
+    return lower_value + (position - lower_position) * (upper_value - lower_value)
+
+
+def get_histogram(column_summary, bins=HISTOGRAM_BINS):
+    """
+    Histogram of the distance values.
+    :param column_summary: Summary rows.
+    :param bins: Number of bins.
+    :return: Bin counts and bin edges, as numpy.histogram.
+    """
+    values, counts = get_weighted_values(column_summary)
+    return np.histogram(values, bins=bins, weights=counts)
+
+
+def get_boxplot_statistics(column_summary, label):
+    """
+    Boxplot statistics of the distance values, in the format of matplotlib's Axes.bxp.
+    :param column_summary: Summary rows.
+    :param label: Box label.
+    :return: Dictionary of statistics.
+    """
+    if get_issue_count(column_summary) == 0:
+        return {'label': label, 'med': np.nan, 'q1': np.nan, 'q3': np.nan, 'whislo': np.nan, 'whishi': np.nan,
+                'fliers': []}
+
+    values, counts = get_weighted_values(column_summary)
+    first_quartile, median, third_quartile = [get_quantile(values, counts, quantile) for quantile in QUANTILES]
+
+    interquartile_range = third_quartile - first_quartile
+    whisker_values = values[(values >= first_quartile - WHISKER_RANGE * interquartile_range) &
+                            (values <= third_quartile + WHISKER_RANGE * interquartile_range)]
+    whisker_low = min(whisker_values.min(), first_quartile) if len(whisker_values) else first_quartile
+    whisker_high = max(whisker_values.max(), third_quartile) if len(whisker_values) else third_quartile
+
+    fliers = values[(values < whisker_low) | (values > whisker_high)]
+
+    return {'label': label, 'med': median, 'q1': first_quartile, 'q3': third_quartile, 'whislo': whisker_low,
+            'whishi': whisker_high, 'fliers': list(fliers)}
+
+
+def get_priority_statistics(summary):
+    """
+    Quantiles and issue counts per distance column and priority.
+    :param summary: Summary dataframe.
+    :return: Dataframe with one row per column and priority.
+    """
+    rows = []
+    for (distance_column, priority), column_summary in summary.groupby(['column', PRIORITY_COLUMN]):
+        values, counts = get_weighted_values(column_summary)
+        quantiles = [get_quantile(values, counts, quantile) for quantile in QUANTILES]
+        rows.append([distance_column, priority, get_issue_count(column_summary)] + quantiles)
+
+    return pd.DataFrame(rows, columns=['column', PRIORITY_COLUMN, 'issues'] + [str(quantile) for quantile in QUANTILES])
+
+
+def get_summary_file_name(project_id, file_prefix=""):
+    return os.path.join(".", project_id, file_prefix + "Priority_Summary_" + project_id + ".csv")
+
+
+def write_summary(summary, project_id, file_prefix=""):
+    """
+    Writes a summary to a CSV file.
+    :param summary: Summary dataframe.
+    :param project_id: Project identifier.
+    :param file_prefix: Prefix for the file name.
+    :return: None.
+    """
+    summary.to_csv(get_summary_file_name(project_id, file_prefix), index=False)
+
+
+def read_summary(project_id, file_prefix=""):
+    """
+    Reads a summary written by write_summary.
+    :param project_id: Project identifier.
+    :param file_prefix: Prefix for the file name.
+    :return: Summary dataframe.
+    """
+    # Summaries have no missing values, and NO_PRIORITY must not be read as one.
+    return pd.read_csv(get_summary_file_name(project_id, file_prefix), keep_default_na=False)
@@ -0,0 +1,118 @@
+"""
+Compact record types for the JIRA and Git rows the counters read. Each record keeps only the columns used, as
+attributes instead of positions, and the low-cardinality strings repeated across rows (repositories, authors, tag
+names, statuses, change log fields) are shared. Free text like change log values is not, so the table of shared
+values stays small; it is cleared after each project with clear_interned_values. Records are built by the cursor,
+through row_factory, so full rows are never held in memory.
+"""
+
+interned_values = {}
+
+
+def intern_value(value):
+    """
+    Returns a shared copy of a value, so equal strings on many rows are stored once. Unlike intern(), it works for
+    unicode strings, which is what SQLite returns.
+    """
+    return interned_values.setdefault(value, value)
+
+
+def clear_interned_values():
+    """
+    Discards the table of shared values. Records already built keep their values.
+    """
+    interned_values.clear()
+
+
+class Record(object):
+    """
+    Base class for records. Subclasses declare their attributes on __slots__, the row position of each one on
+    COLUMNS and the attributes whose values are interned on INTERNED.
+    """
+    __slots__ = ()
+    COLUMNS = ()
+    INTERNED = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        for name, index in zip(cls.__slots__, cls.COLUMNS):
+            value = row[index]
+            setattr(record, name, intern_value(value) if name in cls.INTERNED else value)
+        return record
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """
+        Row factory for sqlite3 cursors, e.g. dbutils.execute_query(sql, parameters, db_file, Version.row_factory).
+        """
+        return cls.from_row(row)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.__getstate__() == other.__getstate__()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.__getstate__())
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join("%s=%r" % (name, getattr(self, name)) for name in
+                                                          self.__slots__))
+
+
+class Issue(Record):
+    """
+    Row of jdata.PROJECT_ISSUES_SQL: an issue, with the names of its resolution, status and priority.
+    """
+    __slots__ = ('issue_id', 'key', 'created', 'reporter_id', 'summary', 'description', 'resolution', 'status',
+                 'priority')
+    COLUMNS = (27, 31, 15, 21, 25, 30, 34, 35, 36)
+    INTERNED = ('reporter_id', 'resolution', 'status', 'priority')
+
+
+class Version(Record):
+    """
+    Row of the JIRA Version table.
+    """
+    __slots__ = ('version_id', 'name', 'release_date')
+    COLUMNS = (4, 6, 3)
+
+
+class ChangeLogItem(Record):
+    """
+    Row of jdata.CHANGE_LOG_SQL: a change log item, with the creation date and author of its history entry.
+    """
+    __slots__ = ('created', 'author_id', 'field', 'from_string', 'to', 'to_string')
+    COLUMNS = (0, 1, 3, 6, 7, 8)
+    INTERNED = ('author_id', 'field')
+
+
+class Tag(Record):
+    """
+    Row of the git_tag table. Queries joining other tables select its columns first.
+    """
+    __slots__ = ('repository', 'name', 'date')
+    COLUMNS = (1, 2, 3)
+    INTERNED = ('repository', 'name', 'date')
+
+
+class Commit(Record):
+    """
+    Row of the git_commit table.
+    """
+    __slots__ = ('repository', 'sha', 'deletions', 'lines', 'insertions', 'files', 'author', 'date')
+    COLUMNS = (1, 2, 3, 4, 5, 6, 7, 8)
+    INTERNED = ('repository', 'author')
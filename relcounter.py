@@ -1,22 +1,25 @@
 """
 Module for the calculation of the releases to fix field.
 """
-from dateutil.tz import tzlocal
 from unicodedata import normalize
 
-import datetime
-
 import os
-import git
-import winsound
+
+from multiprocessing.pool import ThreadPool
 
 import catalog
+import charts
+import dateconv
+import gitutils
 import jiracounter
 import gitcounter
 import loader
 import jdata
+import metricscache
+import partitionstore
+import prioritysummary
+import records
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from pandas import DataFrame
 
@@ -26,24 +29,83 @@ ONE_LINE_OPTION = "--pretty=oneline"
 HEAD_OPTION = "-1"
 DATE_FORMAT_OPTION = "--format=%ai"
 
-# TODO(cgavidia): Move to JDATA module
-KEY_INDEX = 31
-ISSUE_ID_INDEX = 27
-
-RESNAME_INDEX = 34
-STATUS_INDEX = 35
-PRIORNAME_INDEX = 36
-CREATED_DATE = 15
-REPORTER_ID_INDEX = 21
-SUMMARY_INDEX = 25
-DESCRIPTION_INDEX = 30
+CSV_FORMAT = "csv"
+PARQUET_FORMAT = "parquet"
+CONSOLIDATED_FORMAT = CSV_FORMAT
+PARQUET_ROW_GROUP_SIZE = 10000
+
+CONSOLIDATED_COLUMNS = ["Issue Key", "Resolution", "Status", "Priority", "Earliest Version", "Latest Version",
+                        "Earliest Fix Version", "Latest Fix Version", "Commits",
+                        "Commits with Tags", "Earliest Tag", "JIRA/GitHub Distance", "JIRA Distance",
+                        "GitHub distance", "Fix distance", "JIRA Distance in Releases", "GitHub Distance in Releases",
+                        "Fix Distance in Releases", "Creation Date", "Closest Release JIRA", "Closest Tag Git",
+                        "Reported By", "JIRA Resolved By", "JIRA Resolver Start", "JIRA Resolver Assignment",
+                        "JIRA Resolver In Progress", "JIRA Resolved Date",
+                        "JIRA Resolution Time", "Git Committer",
+                        "Git Commit Date", "Avg Lines", "Git Resolution Time", "Comments in JIRA", "Priority Changer",
+                        "Original Priority", "New Priority", "Git Repository", "Total Deletions", "Total Insertions",
+                        "Avg Files", "Change Log Size", "Number of Reopens", "Summary", "Description", "Project Key",
+                        "Priority Change Date"]
+
+CATEGORY_COLUMNS = ["Resolution", "Status", "Priority"]
+DATE_COLUMNS = ["Creation Date", "JIRA Resolver Start", "JIRA Resolver Assignment", "JIRA Resolver In Progress",
+                "JIRA Resolved Date", "Git Commit Date", "Priority Change Date"]
+COUNT_COLUMNS = ["Commits", "Commits with Tags", "JIRA/GitHub Distance", "JIRA Distance", "GitHub distance",
+                 "Fix distance", "JIRA Distance in Releases", "GitHub Distance in Releases",
+                 "Fix Distance in Releases", "Comments in JIRA", "Total Deletions", "Total Insertions",
+                 "Change Log Size", "Number of Reopens"]
+
+# Columns needed to apply the filters of get_project_dataframe.
+FILTER_COLUMNS = ["Status", "Resolution", "Commits", "Reported By", "JIRA Resolved By"]
 
 
 def get_csv_file_name(project_id):
-    filename = ".\\" + project_id + "\\Release_Counter_" + project_id + ".csv"
+    filename = os.path.join(".", project_id, "Release_Counter_" + project_id + ".csv")
     return filename
 
 
+def get_parquet_file_name(project_id):
+    filename = os.path.join(".", project_id, "Release_Counter_" + project_id + ".parquet")
+    return filename
+
+
+def get_consolidated_file_name(project_id, file_format=None):
+    """
+    Returns the location of the consolidated file of a project, according to its format.
+    :param project_id: Project identifier in JIRA.
+    :param file_format: Either CSV_FORMAT or PARQUET_FORMAT. If None, CONSOLIDATED_FORMAT is used.
+    :return: File name.
+    """
+    file_format = file_format or CONSOLIDATED_FORMAT
+
+    if file_format == PARQUET_FORMAT:
+        return get_parquet_file_name(project_id)
+
+    return get_csv_file_name(project_id)
+
+
+def apply_consolidated_types(issues_dataframe):
+    """
+    Assigns explicit types to the columns of a consolidated dataframe: categories for Priority/Status/Resolution,
+    datetimes for dates and nullable integers for counts.
+    :param issues_dataframe: Consolidated dataframe.
+    :return: The typed dataframe.
+    """
+    for column in CATEGORY_COLUMNS:
+        if column in issues_dataframe.columns:
+            issues_dataframe[column] = issues_dataframe[column].astype('category')
+
+    for column in DATE_COLUMNS:
+        if column in issues_dataframe.columns:
+            issues_dataframe[column] = pd.to_datetime(issues_dataframe[column], utc=True)
+
+    for column in COUNT_COLUMNS:
+        if column in issues_dataframe.columns:
+            issues_dataframe[column] = pd.to_numeric(issues_dataframe[column]).round().astype('Int64')
+
+    return issues_dataframe
+
+
 def preprocess(project_id, release):
     # TODO(cgavidia): This looks awful. Refactor later.
     if project_id == "12313920":
@@ -71,47 +133,71 @@ def get_fix_distance(jira_distance, github_distance):
     return None
 
 
-def consolidate_information(project_id, release_regex, project_key=None):
+def consolidate_information(project_id, release_regex, project_key=None, use_cache=True):
     """
     Generetes a consolidated CSV report for the fix distance calculation.
     :param project_id: Project identifier in JIRA
-    :param release_regex: Regular expression for valid releases.
+    :param release_regex: Regular expression for valid releases, or its ReleaseMatcher.
+    :param use_cache: If true, JIRA and Git metrics are only calculated for issues whose inputs have changed.
     :return: A Dataframe with the consolidated information.
     """
     print "Generating consolidated file for project: ", project_id
     project_issues = jdata.get_project_issues(project_id)
+    release_matcher = catalog.get_release_matcher(release_regex)
+    release_regex = release_matcher.release_regex
 
-    records = []
+    issue_rows = []
     tags_alert = True
 
+    comment_counts = jdata.get_comment_counts(project_id)
+
+    cached_metrics = {}
+    metrics_to_cache = []
+    if use_cache:
+        metricscache.create_schema()
+        cached_metrics = metricscache.get_cached_metrics(project_id, release_regex)
+        project_fingerprint = metricscache.get_project_fingerprint(project_id)
+        jira_fingerprints, commit_fingerprints = metricscache.get_issue_fingerprints(project_id)
+
     for issue in project_issues:
-        key = issue[KEY_INDEX]
-        issue_id = issue[ISSUE_ID_INDEX]
-        resolution = issue[RESNAME_INDEX]
-        status = issue[STATUS_INDEX]
-        priority = issue[PRIORNAME_INDEX]
-        created_date = issue[CREATED_DATE]
-        reported_by = issue[REPORTER_ID_INDEX]
+        key = issue.key
+        issue_id = issue.issue_id
+        resolution = issue.resolution
+        status = issue.status
+        priority = issue.priority
+        created_date = issue.created
+        reported_by = issue.reporter_id
 
         summary = None
-        if issue[SUMMARY_INDEX]:
-            summary = normalize('NFKD', issue[SUMMARY_INDEX]).encode('ASCII', 'ignore')
+        if issue.summary:
+            summary = normalize('NFKD', issue.summary).encode('ASCII', 'ignore')
             summary = summary[0:30000]
 
         description = None
-        if issue[DESCRIPTION_INDEX]:
-            description = normalize('NFKD', issue[DESCRIPTION_INDEX]).encode('ASCII', 'ignore')
+        if issue.description:
+            description = normalize('NFKD', issue.description).encode('ASCII', 'ignore')
             description = description[0:30000]
 
-        created_date_parsed = datetime.datetime.fromtimestamp(created_date / 1000, tz=tzlocal())
+        created_date_parsed = dateconv.from_timestamp_ms(created_date)
+
+        fingerprint = None
+        if use_cache:
+            fingerprint = "%s|%s|%s|%s|%s|%s|%s|%s|%s" % (project_fingerprint, created_date, resolution, status,
+                                                          priority, reported_by, jira_fingerprints.get(issue_id),
+                                                          commit_fingerprints.get(key),
+                                                          comment_counts.get(issue_id, 0))
 
-        jira_metrics = jiracounter.get_JIRA_metrics(
-            issue_id, project_id, created_date)
-        earliest_affected_name = jira_metrics.earliest_affected[
-            jiracounter.VERSION_NAME_INDEX] if jira_metrics.earliest_affected  else None
+        cached_fingerprint, jira_metrics, git_metrics = cached_metrics.get(key, (None, None, None))
+        if fingerprint is None or fingerprint != cached_fingerprint:
+            jira_metrics = jiracounter.get_JIRA_metrics(
+                issue_id, project_id, created_date, comment_counts.get(issue_id, 0))
+            git_metrics = gitcounter.get_github_metrics(
+                project_id, key, release_matcher, created_date)
 
-        git_metrics = gitcounter.get_github_metrics(
-            project_id, key, release_regex, created_date)
+            if use_cache:
+                metrics_to_cache.append((key, fingerprint, jira_metrics, git_metrics))
+
+        earliest_affected_name = jira_metrics.earliest_affected.name if jira_metrics.earliest_affected else None
 
         github_jira_distance = None
         if jira_metrics.distance and git_metrics.distance:
@@ -141,64 +227,198 @@ def consolidate_information(project_id, release_regex, project_key=None):
             jira_metrics.change_log_len, jira_metrics.reopen_len, summary, description, project_key,
             jira_metrics.priority_change_date)
         print "Analizing Issue " + key
-        records.append(csv_record)
+        issue_rows.append(csv_record)
 
     if tags_alert:
         print "WARNING: No tags were found as valid release names for each of the commits."
 
-    return write_consolidated_file(project_id, records)
+    if use_cache:
+        hits = len(project_issues) - len(metrics_to_cache)
+        hit_rate = hits / float(len(project_issues)) if project_issues else 0.0
+        print "Metrics cache for project ", project_id, ": ", hits, " hits, ", len(metrics_to_cache), \
+            " recalculated. Hit rate: ", hit_rate
+        metricscache.store_metrics(project_id, release_regex, metrics_to_cache)
+
+    return write_consolidated_file(project_id, issue_rows)
 
 
-def write_consolidated_file(project_id, records, issues_dataframe=None):
+def write_consolidated_file(project_id, issue_rows, issues_dataframe=None, file_format=None):
     """
-    Creates a Dataframe with the consolidated fix distance information and writes it to a CSV file.
+    Creates a Dataframe with the consolidated fix distance information and writes it to a CSV or Parquet file.
     :param project_id: Project identifier in JIRA.
-    :param records: Records to be included in the CSV file.
+    :param issue_rows: Rows to be included in the CSV file.
+    :param file_format: Either CSV_FORMAT or PARQUET_FORMAT. If None, CONSOLIDATED_FORMAT is used.
     :return: The created Dataframe.
     """
-    column_header = ["Issue Key", "Resolution", "Status", "Priority", "Earliest Version", "Latest Version",
-                     "Earliest Fix Version", "Latest Fix Version", "Commits",
-                     "Commits with Tags", "Earliest Tag", "JIRA/GitHub Distance", "JIRA Distance", "GitHub distance",
-                     "Fix distance", "JIRA Distance in Releases", "GitHub Distance in Releases",
-                     "Fix Distance in Releases", "Creation Date", "Closest Release JIRA", "Closest Tag Git",
-                     "Reported By", "JIRA Resolved By", "JIRA Resolver Start", "JIRA Resolver Assignment",
-                     "JIRA Resolver In Progress", "JIRA Resolved Date",
-                     "JIRA Resolution Time", "Git Committer",
-                     "Git Commit Date", "Avg Lines", "Git Resolution Time", "Comments in JIRA", "Priority Changer",
-                     "Original Priority", "New Priority", "Git Repository", "Total Deletions", "Total Insertions",
-                     "Avg Files", "Change Log Size", "Number of Reopens", "Summary", "Description", "Project Key",
-                     "Priority Change Date"]
-
-    if issues_dataframe is None and records:
-        issues_dataframe = DataFrame(records, columns=column_header)
+    file_format = file_format or CONSOLIDATED_FORMAT
+
+    if issues_dataframe is None and issue_rows:
+        issues_dataframe = DataFrame(issue_rows, columns=CONSOLIDATED_COLUMNS)
 
+    file_name = get_consolidated_file_name(project_id, file_format)
     issues = len(issues_dataframe.index)
-    print "Writing " + str(issues) + " issues in " + get_csv_file_name(project_id)
+    print "Writing " + str(issues) + " issues in " + file_name
 
-    file_name = get_csv_file_name(project_id)
     if not os.path.exists(os.path.dirname(file_name)):
         os.makedirs(os.path.dirname(file_name))
-    issues_dataframe.to_csv(file_name, index=False)
+
+    if file_format == PARQUET_FORMAT:
+        issues_dataframe = apply_consolidated_types(issues_dataframe)
+        write_parquet_file(issues_dataframe, file_name)
+    else:
+        issues_dataframe.to_csv(file_name, index=False)
 
     return issues_dataframe
 
 
-def commit_analysis(repositories, project_id, project_key):
-    print "Analizing commits for project ", project_id
+def write_parquet_file(issues_dataframe, file_name):
+    """
+    Writes a typed consolidated dataframe to Parquet. Nullable integer columns are not supported by pyarrow's pandas
+    conversion, so they are written with an explicit int64 type.
+    :param issues_dataframe: Dataframe, after apply_consolidated_types.
+    :param file_name: Parquet file name.
+    :return: None.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    count_columns = [column for column in COUNT_COLUMNS if column in issues_dataframe.columns]
+    arrow_dataframe = issues_dataframe.copy()
+    for column in count_columns:
+        arrow_dataframe[column] = arrow_dataframe[column].astype(object)
+        arrow_dataframe[column] = arrow_dataframe[column].where(arrow_dataframe[column].notnull(), None)
+
+    schema = pa.Schema.from_pandas(arrow_dataframe, preserve_index=False)
+    for column in count_columns:
+        schema = schema.set(schema.get_field_index(column), pa.field(column, pa.int64()))
+
+    table = pa.Table.from_pandas(arrow_dataframe, schema=schema, preserve_index=False)
+    pq.write_table(table, file_name, row_group_size=PARQUET_ROW_GROUP_SIZE)
+
+
+def row_group_matches(row_group, filters):
+    """
+    Checks, using the column statistics of a Parquet row group, if it can contain rows that pass the filters.
+    :param row_group: Row group metadata.
+    :param filters: Row filters in pyarrow format.
+    :return: False only if no row of the group can pass the filters.
+    """
+    statistics = {}
+    for column_index in range(row_group.num_columns):
+        column = row_group.column(column_index)
+        if column.statistics is not None and column.statistics.has_min_max:
+            statistics[column.path_in_schema] = column.statistics.min, column.statistics.max
+
+    for column, operator, value in filters:
+        if column not in statistics:
+            continue
+
+        minimum, maximum = statistics[column]
+        if operator == '>' and not maximum > value:
+            return False
+        if operator == '>=' and not maximum >= value:
+            return False
+        if operator == '<' and not minimum < value:
+            return False
+        if operator == '<=' and not minimum <= value:
+            return False
+        if operator in ('=', '==') and not minimum <= value <= maximum:
+            return False
+        if operator == 'in' and not any(minimum <= item <= maximum for item in value):
+            return False
+
+    return True
+
+
+def read_parquet_file(file_name, columns=None, filters=None):
+    """
+    Reads a consolidated Parquet file, skipping the row groups that cannot pass the filters. Rows of the remaining
+    groups are not filtered, so callers still need to apply the filters.
+    :param file_name: Parquet file name.
+    :param columns: Columns to load. If None, all columns are loaded.
+    :param filters: Row filters in pyarrow format.
+    :return: Dataframe.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(file_name)
+    if parquet_file.num_row_groups == 0:
+        return parquet_file.read(columns=columns).to_pandas()
+
+    row_groups = [index for index in range(parquet_file.num_row_groups)
+                  if not filters or row_group_matches(parquet_file.metadata.row_group(index), filters)]
+
+    if row_groups:
+        issues_dataframe = parquet_file.read_row_groups(row_groups, columns=columns).to_pandas()
+    else:
+        # An empty dataframe with the file types is obtained from the first row group.
+        issues_dataframe = parquet_file.read_row_group(0, columns=columns).to_pandas().iloc[0:0]
+
+    for column in COUNT_COLUMNS:
+        if column in issues_dataframe.columns:
+            issues_dataframe[column] = issues_dataframe[column].astype('Int64')
+
+    return issues_dataframe
+
+
+def read_consolidated_file(project_id, columns=None, filters=None, file_format=None, file_name=None):
+    """
+    Reads a consolidated file with explicit column types.
+    :param project_id: Project identifier in JIRA.
+    :param columns: Columns to load. If None, all columns are loaded.
+    :param filters: Row filters in pyarrow format (e.g. [('Commits', '>', 0)]). Only pushed down for Parquet files.
+    :param file_format: Either CSV_FORMAT or PARQUET_FORMAT. If None, CONSOLIDATED_FORMAT is used.
+    :param file_name: File to read. If None, the consolidated file of the project is used.
+    :return: Dataframe.
+    """
+    file_format = file_format or CONSOLIDATED_FORMAT
+    file_name = file_name or get_consolidated_file_name(project_id, file_format)
 
+    if file_format == PARQUET_FORMAT:
+        return read_parquet_file(file_name, columns, filters)
+
+    date_columns = [column for column in DATE_COLUMNS if columns is None or column in columns]
+    category_types = dict((column, 'category') for column in CATEGORY_COLUMNS if columns is None or column in columns)
+    return pd.read_csv(file_name, usecols=columns, dtype=category_types, parse_dates=date_columns)
+
+
+def count_commits_with_key(repository_location, key_pattern):
+    """
+    Counts the commits of a repository, and the ones that have a JIRA key in its message. The git log output is
+    processed as it is read, so memory use doesn't depend on the size of the history.
+    :param repository_location: Location of the local repository.
+    :param key_pattern: Compiled regular expression for JIRA keys.
+    :return: Total commits and commits with a JIRA key.
+    """
     total_commits = 0
-    with_jira_reference = 0
-    for repository in repositories:
-        # TODO I don't like this dependency either ...
-        repository_location = loader.REPO_LOCATION + repository
+    with_key = 0
+
+    for log_line in gitutils.stream_lines(repository_location, ["log", ALL_BRANCHES_OPTION, ONE_LINE_OPTION]):
+        total_commits += 1
+        if key_pattern.search(log_line.partition(' ')[2]):
+            with_key += 1
+
+    return total_commits, with_key
 
-        git_client = git.Git(repository_location)
 
-        log_lines = git_client.log(ALL_BRANCHES_OPTION, ONE_LINE_OPTION).splitlines()
-        total_commits += len(log_lines)
+def commit_analysis(repositories, project_id, project_key):
+    print "Analizing commits for project ", project_id
 
-        messages = [log_line.partition(' ')[2] for log_line in log_lines]
-        with_jira_reference += sum(1 for message in messages if project_key in message) / float(total_commits)
+    key_pattern = loader.get_key_pattern(project_key)
+    # TODO I don't like this dependency either ...
+    repository_locations = [loader.REPO_LOCATION + repository for repository in repositories]
+
+    pool = ThreadPool(max(1, len(repository_locations)))
+    try:
+        commit_counts = pool.map(lambda location: count_commits_with_key(location, key_pattern),
+                                 repository_locations)
+    finally:
+        pool.close()
+        pool.join()
+
+    total_commits = sum(total for total, _ in commit_counts)
+    commits_with_key = sum(with_key for _, with_key in commit_counts)
+    with_jira_reference = commits_with_key / float(total_commits) if total_commits else 0.0
 
     print "Total commits: ", total_commits
     print "Commits with project key: ", with_jira_reference
@@ -207,30 +427,26 @@ def commit_analysis(repositories, project_id, project_key):
               "Does not contain JIRA key (" + str((1 - with_jira_reference) * 100) + " %)"]
     sizes = [with_jira_reference, 1 - with_jira_reference]
 
-    figure, axes = plt.subplots(1, 1, figsize=(10, 10))
-
-    patches, texts = plt.pie(sizes)
-    axes.set_title(
-        "Git commit messages containing JIRA key: " + str(total_commits) + " commits for Project " + project_key)
-    plt.legend(patches, labels, loc="best")
-    plt.savefig(".\\" + project_id + "\\Commits_with_JIRA_key_for_" + project_id + ".png")
+    title = "Git commit messages containing JIRA key: " + str(total_commits) + " commits for Project " + project_key
+    charts.render_charts([charts.get_pie_chart(
+        os.path.join(".", project_id, "Commits_with_JIRA_key_for_" + project_id + ".png"), title, labels, sizes)])
 
 
-def priority_analysis(project_key, project_id, issues_dataframe, distance_column, file_prefix=""):
+def priority_analysis(project_key, project_id, summary, distance_column, file_prefix=""):
     """
-    Generates charts regarding the relationship between priority and fix distance.
+    Describes the charts regarding the relationship between priority and fix distance. The charts are rendered by
+    charts.render_charts.
     :param project_key: Project key.
     :param project_id: Project identifier.
-    :param issues_dataframe: Dataframe with project issues.
+    :param summary: Priority summary of the project issues, from prioritysummary.summarize.
     :param distance_column: Dataframe series that contains the distance information.
     :param file_prefix: Prefix for the generated files.
-    :return: None.
+    :return: List of chart jobs.
     """
 
-    resolved_issues = issues_dataframe.dropna(subset=[distance_column])
+    resolved_issues = prioritysummary.get_column_summary(summary, distance_column)
     priority_list = ['Blocker', 'Critical', 'Major', 'Minor', 'Trivial']
 
-    priority_column = 'Priority'
     print "Generating histograms for project ", project_key
 
     priority_label = "Priority"
@@ -239,80 +455,89 @@ def priority_analysis(project_key, project_id, issues_dataframe, distance_column
     fix_distance_label = distance_column + ": "
     issues_in_project_label = " Issues in Project "
 
-    figure, axes = plt.subplots(1, 1, figsize=(10, 10))
-    if len(resolved_issues.index) == 0:
+    if prioritysummary.get_issue_count(resolved_issues) == 0:
         print "No issues found for project ", project_key
-        return
+        return []
 
-    issues = str(len(resolved_issues.index))
+    issues = str(prioritysummary.get_issue_count(resolved_issues))
     print project_key, ": Plotting ", issues, " issues."
 
-    resolved_issues[priority_column].value_counts(normalize=True, sort=False).plot(kind='bar', ax=axes)
-    axes.set_xlabel(priority_label)
-    axes.set_ylabel(issues_percentage_label)
-    axes.set_title("Priority Distribution for " + issues + issues_in_project_label + project_key)
-    axes.get_figure().savefig(
-        ".\\" + project_id + "\\" + file_prefix + "_Priority_Distribution_for_" + project_id + ".png")
+    chart_jobs = []
+
+    priority_distribution = prioritysummary.get_value_counts(resolved_issues, prioritysummary.PRIORITY_COLUMN)
+    chart_jobs.append(charts.get_bar_chart(
+        os.path.join(".", project_id, file_prefix + "_Priority_Distribution_for_" + project_id + ".png"),
+        "Priority Distribution for " + issues + issues_in_project_label + project_key,
+        priority_label, issues_percentage_label, priority_distribution.index, priority_distribution.values))
 
-    figure, axes = plt.subplots(1, 1, figsize=(10, 10))
-    resolved_issues['Commits'].value_counts(normalize=True).sort_index().plot(kind='bar', ax=axes)
-    axes.set_xlabel("Commits per issue")
-    axes.set_ylabel(issues_percentage_label)
-    axes.set_title("Number of Git Commits per JIRA issue: " + issues + issues_in_project_label + project_key)
-    axes.get_figure().savefig(".\\" + project_id + "\\" + file_prefix +
-                              "_Commits_Distribution_for_" + project_id + ".png")
+    commits_distribution = prioritysummary.get_value_counts(resolved_issues, prioritysummary.COMMITS_COLUMN)
+    chart_jobs.append(charts.get_bar_chart(
+        os.path.join(".", project_id, file_prefix + "_Commits_Distribution_for_" + project_id + ".png"),
+        "Number of Git Commits per JIRA issue: " + issues + issues_in_project_label + project_key,
+        "Commits per issue", issues_percentage_label, commits_distribution.index.astype(int),
+        commits_distribution.values))
 
-    priority_samples = []
+    box_statistics = []
 
     for priority_value in priority_list:
-        priority_issues = resolved_issues[resolved_issues[priority_column] == priority_value]
-        issues = str(len(priority_issues.index))
+        priority_issues = prioritysummary.get_column_summary(summary, distance_column, priority_value)
+        issues = str(prioritysummary.get_issue_count(priority_issues))
 
-        if len(priority_issues.index) > 0:
+        if prioritysummary.get_issue_count(priority_issues) > 0:
             print project_key, ": Plotting ", issues, " of Priority ", priority_value
-            figure, axes = plt.subplots(1, 1, figsize=(10, 10))
-
-            priority_issues[distance_column].hist(ax=axes)
-            axes.set_xlabel(releases_label)
-            axes.set_ylabel(issues_percentage_label)
-            axes.set_title(fix_distance_label + issues + " " + priority_value +
-                           issues_in_project_label + project_key)
-            axes.get_figure().savefig(".\\" + project_id + "\\" + file_prefix +
-                                      "_Priority_" + priority_value + "_" + project_id + ".png")
+            counts, bin_edges = prioritysummary.get_histogram(priority_issues)
+            chart_jobs.append(charts.get_histogram(
+                os.path.join(".", project_id,
+                             file_prefix + "_Priority_" + priority_value + "_" + project_id + ".png"),
+                fix_distance_label + issues + " " + priority_value + issues_in_project_label + project_key,
+                releases_label, issues_percentage_label, counts, bin_edges))
         else:
             print project_key, ": No issues found for Priority ", priority_value
 
-        priority_samples.append(priority_issues[distance_column])
+        box_statistics.append(prioritysummary.get_boxplot_statistics(priority_issues, priority_value))
 
     print "Generating consolidated priorities for project " + project_id
-    issues = str(len(resolved_issues.index))
+    issues = str(prioritysummary.get_issue_count(resolved_issues))
 
-    figure, axes = plt.subplots(1, 1, figsize=(10, 10))
-    axes.boxplot(priority_samples)
-    axes.set_xticklabels(priority_list)
-    axes.set_xlabel(priority_label)
-    axes.set_ylabel(releases_label)
-    axes.set_yscale('log')
-    axes.set_title(fix_distance_label + issues + issues_in_project_label + project_key)
-    axes.get_figure().savefig(".\\" + project_id + "\\" + file_prefix +
-                              "_All_Priorities_" + project_id + ".png")
+    chart_jobs.append(charts.get_boxplot(
+        os.path.join(".", project_id, file_prefix + "_All_Priorities_" + project_id + ".png"),
+        fix_distance_label + issues + issues_in_project_label + project_key,
+        priority_label, releases_label, box_statistics))
 
+    return chart_jobs
 
-def get_project_dataframe(project_id, filter=True):
+
+def get_project_dataframe(project_id, filter=True, columns=None, file_format=None):
     """
     Returns a dataframe with the issues valid for analysis.
     :param project_id: JIRA's project identifier.
     :param filter: If true, considers only resolved issues with commits in Git and Resolved by a different engineer.
+    :param columns: Columns to return. If None, all columns are returned.
+    :param file_format: Either CSV_FORMAT or PARQUET_FORMAT. If None, CONSOLIDATED_FORMAT is used.
     :return: Dataframe
     """
-    issues_dataframe = pd.read_csv(get_csv_file_name(project_id))
-    resolved_issues = issues_dataframe
+    if not filter:
+        return read_consolidated_file(project_id, columns=columns, file_format=file_format)
+
+    columns_to_read = None
+    if columns is not None:
+        columns_to_read = list(columns) + [column for column in FILTER_COLUMNS if column not in columns]
 
-    if filter:
-        resolved_issues = issues_dataframe[issues_dataframe['Status'].isin(['Closed', 'Resolved'])]
-        resolved_issues = resolved_issues[resolved_issues['Resolution'].isin(jiracounter.VALID_RESOLUTION_VALUES)]
-        resolved_issues = resolved_issues[resolved_issues['Commits'] > 0]
-        resolved_issues = resolved_issues[resolved_issues['Reported By'] != resolved_issues['JIRA Resolved By']]
+    # Status, Resolution and Commits are pushed down to the reader. The reporter/resolver comparison involves two
+    # columns, so it is applied after loading.
+    filters = [('Status', 'in', ['Closed', 'Resolved']),
+               ('Resolution', 'in', jiracounter.VALID_RESOLUTION_VALUES),
+               ('Commits', '>', 0)]
+    issues_dataframe = read_consolidated_file(project_id, columns=columns_to_read, filters=filters,
+                                              file_format=file_format)
+
+    resolved_issues = issues_dataframe[issues_dataframe['Status'].isin(['Closed', 'Resolved'])]
+    resolved_issues = resolved_issues[resolved_issues['Resolution'].isin(jiracounter.VALID_RESOLUTION_VALUES)]
+    resolved_issues = resolved_issues[resolved_issues['Commits'] > 0]
+    resolved_issues = resolved_issues[resolved_issues['Reported By'] != resolved_issues['JIRA Resolved By']]
+
+    if columns is not None:
+        resolved_issues = resolved_issues[list(columns)]
 
     return resolved_issues
 
@@ -330,65 +555,137 @@ def get_validated_dataframe(original_dataframe):
     return validated_dataframe
 
 
-def execute_analysis(project_key, project_id, all_dataframe, filtered_dataframe):
+ANALYSIS_LIST = [{"distance_column": "Git Resolution Time",
+                  "prefix": "GITHUB_TIME"},
+                 {"distance_column": "Avg Lines",
+                  "prefix": "GITHUB_LOC"},
+                 {"distance_column": "Comments in JIRA",
+                  "prefix": "JIRA_COMMENTS"}
+                 ]
+
+
+def get_analysis_summaries(project_id, all_dataframe, filtered_dataframe):
     """
-    Executes the project analysis, on a series of task attributes and dataframes.
-    :param project_key: Project key
+    Summarizes the columns of ANALYSIS_LIST per priority, and writes the summaries next to the consolidated file.
     :param project_id: Project id
     :param all_dataframe: Unfiltered dataframe
     :param filtered_dataframe: Data frame with validated priorities.
-    :return: None
+    :return: Summary of the unfiltered dataframe and summary of the validated dataframe.
     """
-    analysis_list = [{"distance_column": "Git Resolution Time",
-                      "prefix": "GITHUB_TIME"},
-                     {"distance_column": "Avg Lines",
-                      "prefix": "GITHUB_LOC"},
-                     {"distance_column": "Comments in JIRA",
-                      "prefix": "JIRA_COMMENTS"}
-                     ]
+    distance_columns = [analysis["distance_column"] for analysis in ANALYSIS_LIST]
+
+    all_summary = prioritysummary.summarize(all_dataframe, distance_columns)
+    filtered_summary = prioritysummary.summarize(filtered_dataframe, distance_columns)
+
+    prioritysummary.write_summary(all_summary, project_id)
+    prioritysummary.write_summary(filtered_summary, project_id, "VAL_")
+
+    return all_summary, filtered_summary
 
-    for analysis in analysis_list:
+
+def iter_merged_dataframes(project_ids=None, columns=None, filters=None):
+    """
+    Reads the merged dataset of all projects lazily, one partition at a time.
+    :param project_ids: Projects to read. If None, all the stored projects are read.
+    :param columns: Columns to load. If None, all columns are loaded.
+    :param filters: Row filters in pyarrow format. Only pushed down for Parquet partitions.
+    :return: Generator of (project identifier, dataframe) tuples.
+    """
+    for project_id, file_name in partitionstore.get_partition_files(project_ids):
+        file_format = PARQUET_FORMAT if file_name.endswith(PARQUET_FORMAT) else CSV_FORMAT
+        yield project_id, read_consolidated_file(project_id, columns=columns, filters=filters,
+                                                 file_format=file_format, file_name=file_name)
+
+
+def write_merged_file(merged_id, project_ids=None):
+    """
+    Writes the merged dataset to a single CSV file, one partition at a time, so it's never fully held in memory.
+    :param merged_id: Identifier of the merged dataset, like "UNFILTERED".
+    :param project_ids: Projects to include. If None, all the stored projects are included.
+    :return: File name.
+    """
+    file_name = get_csv_file_name(merged_id)
+    if not os.path.exists(os.path.dirname(file_name)):
+        os.makedirs(os.path.dirname(file_name))
+
+    issues = 0
+    for index, (_, partition_dataframe) in enumerate(iter_merged_dataframes(project_ids)):
+        partition_dataframe.to_csv(file_name, index=False, header=index == 0, mode="w" if index == 0 else "a")
+        issues += len(partition_dataframe.index)
+
+    print "Wrote " + str(issues) + " issues in " + file_name
+    return file_name
+
+
+def execute_analysis(project_key, project_id, all_summary, filtered_summary):
+    """
+    Executes the project analysis, on a series of task attributes and priority summaries.
+    :param project_key: Project key
+    :param project_id: Project id
+    :param all_summary: Summary of the unfiltered dataframe.
+    :param filtered_summary: Summary of the dataframe with validated priorities.
+    :return: None
+    """
+    chart_jobs = []
+    for analysis in ANALYSIS_LIST:
         distance_column = analysis["distance_column"]
         prefix = analysis["prefix"]
 
-        priority_analysis(project_key, project_id, all_dataframe, distance_column, prefix)
-        priority_analysis(project_key, project_id, filtered_dataframe, distance_column, "VAL_" + prefix)
+        chart_jobs.extend(priority_analysis(project_key, project_id, all_summary, distance_column, prefix))
+        chart_jobs.extend(
+            priority_analysis(project_key, project_id, filtered_summary, distance_column, "VAL_" + prefix))
+
+    charts.render_charts(chart_jobs)
 
 
 def main():
     try:
-        all_dataframes = []
+        consolidated_files = {}
+        all_summaries = []
+        all_training_summaries = []
 
         for config in catalog.get_project_catalog():
             if config:
                 project_id = config['project_id']
-                release_regex = config['release_regex']
+                release_matcher = config['release_matcher']
                 repositories = config['repositories']
                 project_key = config['project_key']
 
-                consolidate_information(project_id, release_regex, project_key)
+                consolidate_information(project_id, release_matcher, project_key)
                 # commit_analysis(repositories, project_id, project_key)
+                records.clear_interned_values()
 
-                # project_dataframe = get_project_dataframe(project_id)
-                project_dataframe = get_project_dataframe(project_id, filter=False)
-
-                training_dataframe = get_validated_dataframe(project_dataframe)
+                consolidated_files[project_id] = get_consolidated_file_name(project_id)
 
-                # execute_analysis(project_key, project_id, project_dataframe, training_dataframe)
-                all_dataframes.append(project_dataframe)
-
-        projects = str(len(all_dataframes))
-        merged_dataframe = pd.concat(all_dataframes)
-        merged_training_dataframe = get_validated_dataframe(merged_dataframe)
+        projects = str(len(consolidated_files))
         all_key = projects + "PROJECTS"
         all_id = "UNFILTERED"
-        write_consolidated_file(all_id, records=None, issues_dataframe=merged_dataframe)
+        updated_projects = partitionstore.update_partitions(consolidated_files)
+
+        for project_id, project_dataframe in iter_merged_dataframes(consolidated_files.keys()):
+            training_dataframe = get_validated_dataframe(project_dataframe)
+            project_summary, training_summary = get_analysis_summaries(project_id, project_dataframe,
+                                                                       training_dataframe)
+
+            # execute_analysis(project_key, project_id, project_summary, training_summary)
+            all_summaries.append(project_summary)
+            all_training_summaries.append(training_summary)
+
+        if updated_projects or not os.path.exists(get_csv_file_name(all_id)):
+            write_merged_file(all_id, consolidated_files.keys())
+        else:
+            print "No partition changed. Keeping ", get_csv_file_name(all_id)
+
+        merged_summary = prioritysummary.merge_summaries(all_summaries)
+        merged_training_summary = prioritysummary.merge_summaries(all_training_summaries)
+        prioritysummary.write_summary(merged_summary, all_id)
+        prioritysummary.write_summary(merged_training_summary, all_id, "VAL_")
 
-        # execute_analysis(all_key, all_id, merged_dataframe, merged_training_dataframe)
+        # execute_analysis(all_key, all_id, merged_summary, merged_training_summary)
         print "Finished consolidating ", projects, " project information"
 
     finally:
-        winsound.Beep(2500, 1000)
+        loader.notify_finished()
 
 
 if __name__ == "__main__":
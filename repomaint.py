@@ -0,0 +1,148 @@
+"""
+Maintenance of the local clones under loader.REPO_LOCATION. Clones are fetched, repacked when their objects are
+fragmented, and given a commit-graph file and a reachability bitmap, so git log --all, tag --contains and other
+graph walks don't have to parse every commit object. The health of each clone is recorded on gjdata.
+"""
+
+import argparse
+import datetime
+import glob
+import os
+import subprocess
+
+import catalog
+import gitutils
+import gjdata
+import loader
+
+MAX_PACKS = 10
+MAX_LOOSE_OBJECTS = 10000
+
+COMMIT_GRAPH_FILES = [os.path.join("objects", "info", "commit-graph"),
+                      os.path.join("objects", "info", "commit-graphs", "commit-graph-chain")]
+BITMAP_PATTERN = os.path.join("objects", "pack", "*.bitmap")
+
+FETCH_ARGUMENTS = ["fetch", "--all", "--tags", "--prune", "--quiet"]
+REPACK_ARGUMENTS = ["repack", "-a", "-d", "-q", "--write-bitmap-index"]
+COMMIT_GRAPH_ARGUMENTS = ["commit-graph", "write", "--reachable", "--changed-paths", "--no-progress"]
+
+
+def run_git(repository_location, arguments):
+    return list(gitutils.stream_lines(repository_location, arguments))
+
+
+def get_git_directory(repository_location):
+    git_directory = run_git(repository_location, ["rev-parse", "--git-dir"])[0]
+    return os.path.join(repository_location, git_directory)
+
+
+def get_object_counts(repository_location):
+    """
+    Returns the output of git count-objects: loose objects, packed objects, number of packs and their size.
+    :param repository_location: Location of the local repository.
+    :return: Dictionary from count-objects field, e.g. "in-pack", to its value.
+    """
+    object_counts = {}
+    for line in run_git(repository_location, ["count-objects", "-v"]):
+        field, _, value = line.partition(":")
+        object_counts[field] = int(value)
+
+    return object_counts
+
+
+def has_commit_graph(git_directory):
+    return any(os.path.exists(os.path.join(git_directory, graph_file)) for graph_file in COMMIT_GRAPH_FILES)
+
+
+def has_bitmap(git_directory):
+    return len(glob.glob(os.path.join(git_directory, BITMAP_PATTERN))) > 0
+
+
+def needs_repack(object_counts, git_directory):
+    """
+    A clone is repacked when it has too many packs or loose objects, or no reachability bitmap.
+    """
+    return object_counts['packs'] > MAX_PACKS or object_counts['count'] > MAX_LOOSE_OBJECTS or not has_bitmap(
+        git_directory)
+
+
+def fetch_repository(repository_location):
+    """
+    Fetches all the remotes of a clone. A failed fetch, e.g. when offline, is reported and the clone is used as is.
+    :param repository_location: Location of the local repository.
+    :return: True if the fetch succeeded.
+    """
+    try:
+        run_git(repository_location, FETCH_ARGUMENTS)
+        return True
+    except subprocess.CalledProcessError as e:
+        print "Fetch failed for ", repository_location, ": ", e
+        return False
+
+
+def prepare_repository(repository, fetch=True):
+    """
+    Prepares a clone for graph queries. The commit-graph is only written again when references moved since the
+    last time, and the clone is only repacked when needed.
+    :param repository: Repository name.
+    :param fetch: If True, the clone is fetched first.
+    :return: repository_health tuple.
+    """
+    repository_location = loader.REPO_LOCATION + repository
+    git_directory = get_git_directory(repository_location)
+
+    if fetch:
+        print "Fetching repository ", repository
+        fetch_repository(repository_location)
+
+    object_counts = get_object_counts(repository_location)
+    if needs_repack(object_counts, git_directory):
+        print "Repacking repository ", repository, ": ", object_counts['packs'], " packs, ", object_counts['count'], \
+            " loose objects"
+        run_git(repository_location, REPACK_ARGUMENTS)
+        object_counts = get_object_counts(repository_location)
+
+    refs_fingerprint = gitutils.get_refs_fingerprint(repository_location)
+    graph_fingerprint = gjdata.get_graph_fingerprint(repository)
+    if not has_commit_graph(git_directory) or graph_fingerprint != refs_fingerprint:
+        print "Writing commit-graph for repository ", repository
+        run_git(repository_location, COMMIT_GRAPH_ARGUMENTS)
+        graph_fingerprint = refs_fingerprint
+
+    return (repository, datetime.datetime.now().isoformat(), object_counts['count'] + object_counts['in-pack'],
+            object_counts['count'], object_counts['packs'], object_counts['size-pack'], has_bitmap(git_directory),
+            has_commit_graph(git_directory), refs_fingerprint, graph_fingerprint)
+
+
+def prepare_repositories(repositories, fetch=True):
+    """
+    Prepares the clones of a project and records their health.
+    :param repositories: Repository names.
+    :param fetch: If True, clones are fetched first.
+    :return: None.
+    """
+    gjdata.create_repository_health_schema()
+
+    health_records = [prepare_repository(repository, fetch) for repository in repositories]
+    for repository, _, object_count, loose_objects, pack_count, _, _, _, refs_fingerprint, graph_fingerprint in \
+            health_records:
+        print "Repository ", repository, ": ", object_count, " objects (", loose_objects, " loose) in ", \
+            pack_count, " packs. Commit-graph fresh: ", graph_fingerprint == refs_fingerprint
+
+    gjdata.insert_repository_health(health_records)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Prepares the local clones of the catalog projects for mining.")
+    parser.add_argument("--project", action="append", help="JIRA project key. By default, all catalog projects.")
+    parser.add_argument("--no-fetch", action="store_true", help="Don't fetch the clones before preparing them.")
+    arguments = parser.parse_args(arguments)
+
+    for config in catalog.get_project_catalog():
+        if config and (arguments.project is None or config['project_key'] in arguments.project):
+            print "Preparing repositories of project ", config['project_key']
+            prepare_repositories(config['repositories'], fetch=not arguments.no_fetch)
+
+
+if __name__ == "__main__":
+    main()
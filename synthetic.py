@@ -0,0 +1,382 @@
+"""
+Generator of synthetic, scaled fixtures for the mining pipeline: a JIRA database with the schema jdata queries, local
+Git repositories with release tags and JIRA keys on commit messages, and populated github.sqlite and
+jira_github.sqlite databases.
+"""
+
+import datetime
+import os
+import random
+import sqlite3
+import subprocess
+
+import gdata
+import gitcounter
+import gjdata
+import jdata
+import loader
+import metricscache
+
+JIRA_DATABASE = "issue_repository.db"
+JIRA_GITHUB_DATABASE = "jira_github.sqlite"
+GITHUB_DATABASE = "github.sqlite"
+METRICS_CACHE_DATABASE = "metrics_cache.sqlite"
+REPOSITORY_DIRECTORY = "repositories"
+
+PROJECT_KEY = "SYNTH"
+PROJECT_ID = "99999"
+RELEASE_REGEX = r"^(\d+\.)?(\d+\.)?(\*|\d+)$"
+
+START_TIMESTAMP = 1262304000  # 2010-01-01
+RELEASE_INTERVAL = 30 * 24 * 60 * 60
+GITHUB_API_URL = "https://api.github.com/repos/apache/"
+
+ISSUE_COLUMNS = 34
+ISSUE_NAMED_COLUMNS = {1: "projectId", 2: "resolutionId", 3: "statusId", 4: "priorityId", 15: "created",
+                       21: "reporterId", 25: "summary", 27: "id", 30: "description", 31: "key"}
+
+JIRA_DDL = ["CREATE TABLE Issue (" + ", ".join(
+    ISSUE_NAMED_COLUMNS.get(index, "field%d" % index) for index in range(ISSUE_COLUMNS)) + ")",
+            "CREATE TABLE Resolution (id INTEGER PRIMARY KEY, name TEXT)",
+            "CREATE TABLE Status (id INTEGER PRIMARY KEY, name TEXT)",
+            "CREATE TABLE Priority (id INTEGER PRIMARY KEY, name TEXT)",
+            "CREATE TABLE Comment (id INTEGER PRIMARY KEY, issueId INTEGER, authorId TEXT, created INTEGER, "
+            "body TEXT)",
+            "CREATE TABLE History (id INTEGER PRIMARY KEY, issueId INTEGER, created INTEGER, authorId TEXT)",
+            "CREATE TABLE ChangeLogItem (id INTEGER PRIMARY KEY, field TEXT, fieldType TEXT, \"from\" TEXT, "
+            "fromString TEXT, \"to\" TEXT, toString TEXT, historyId INTEGER)",
+            "CREATE TABLE Version (description TEXT, archived INTEGER, released INTEGER, releaseDate INTEGER, "
+            "id INTEGER PRIMARY KEY, projectId TEXT, name TEXT)",
+            "CREATE TABLE VersionPerIssue (issueId INTEGER, versionId INTEGER)",
+            "CREATE TABLE FixVersionPerIssue (issueId INTEGER, versionId INTEGER)"]
+
+RESOLUTIONS = [(1, "Fixed"), (2, "Won't Fix"), (3, "Done"), (4, "Implemented")]
+STATUSES = [(1, "Open"), (3, "In Progress"), (5, "Resolved"), (6, "Closed")]
+PRIORITIES = [(1, "Blocker"), (2, "Critical"), (3, "Major"), (4, "Minor"), (5, "Trivial")]
+
+USERS = ["user%d" % index for index in range(20)]
+
+SCALES = {'small': {'issues': 200, 'releases': 10},
+          'medium': {'issues': 2000, 'releases': 30},
+          'large': {'issues': 20000, 'releases': 100}}
+
+
+def get_release_name(release_index):
+    return "1.%d.0" % release_index
+
+
+def get_git_date(timestamp):
+    """
+    Formats a timestamp like git log --format=%ai does, in UTC.
+    :param timestamp: Timestamp in seconds.
+    :return: Date as string.
+    """
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") + " +0000"
+
+
+def insert_rows(connection, table, rows):
+    if rows:
+        insert_sql = "INSERT INTO " + table + " VALUES (" + ", ".join("?" * len(rows[0])) + ")"
+        connection.executemany(insert_sql, rows)
+
+
+def generate_history(issues, releases, repositories, commits_per_issue, random_generator):
+    """
+    Generates the issues and commits of the synthetic project, in memory.
+    :return: List of issue dictionaries, list of commit dictionaries sorted by date, and the release timestamps.
+    """
+    release_timestamps = [START_TIMESTAMP + (index + 1) * RELEASE_INTERVAL for index in range(releases)]
+    end_timestamp = release_timestamps[-1]
+
+    issue_list = []
+    commit_list = []
+    for index in range(issues):
+        created = START_TIMESTAMP + random_generator.randint(0, end_timestamp - START_TIMESTAMP - 1)
+        issue = {'id': index + 1, 'key': PROJECT_KEY + "-" + str(index + 1), 'created': created,
+                 'reporter': random_generator.choice(USERS), 'resolver': random_generator.choice(USERS),
+                 'priority': random_generator.choice(PRIORITIES)[0], 'commits': []}
+
+        for _ in range(random_generator.randint(0, commits_per_issue * 2)):
+            commit_date = created + random_generator.randint(60 * 60, 20 * 24 * 60 * 60)
+            commit = {'issue': issue, 'date': commit_date, 'author': issue['resolver'],
+                      'repository': random_generator.choice(repositories),
+                      'insertions': random_generator.randint(1, 200), 'deletions': random_generator.randint(0, 100)}
+            issue['commits'].append(commit)
+            commit_list.append(commit)
+
+        issue_list.append(issue)
+
+    commit_list.sort(key=lambda commit: commit['date'])
+    return issue_list, commit_list, release_timestamps
+
+
+def get_release_index(timestamp, release_timestamps):
+    """
+    Returns the index of the first release after a timestamp, or None.
+    """
+    for index, release_timestamp in enumerate(release_timestamps):
+        if release_timestamp >= timestamp:
+            return index
+
+    return None
+
+
+def create_repository(repository_location, commits, release_timestamps):
+    """
+    Creates a Git repository using git fast-import, with one commit per commit dictionary and a lightweight tag per
+    release, pointing to the last commit before the release date. The sha of each commit is stored in the dictionary.
+    :param repository_location: Directory of the new repository.
+    :param commits: Commit dictionaries, sorted by date.
+    :param release_timestamps: Release timestamps.
+    :return: List of (tag name, commit dictionary) tuples.
+    """
+    subprocess.check_call(["git", "init", "-q", repository_location])
+
+    stream = []
+    tags = []
+    release_index = 0
+    last_commit = None
+
+    for mark, commit in enumerate(commits, 1):
+        while release_index < len(release_timestamps) and release_timestamps[release_index] < commit['date']:
+            if last_commit:
+                tags.append((get_release_name(release_index), last_commit))
+            release_index += 1
+
+        message = commit['issue']['key'] + ": Synthetic change number " + str(mark) + "\n"
+        content = "\n".join("line %d" % line for line in range(commit['insertions'])) + "\n"
+        identity = "%s <%s@example.org> %d +0000" % (commit['author'], commit['author'], commit['date'])
+
+        stream.extend(["commit refs/heads/master", "mark :%d" % mark, "author " + identity,
+                       "committer " + identity, "data %d" % len(message), message,
+                       "M 644 inline file_%d.txt" % (mark % 100), "data %d" % len(content), content])
+        commit['mark'] = mark
+        last_commit = commit
+
+    while release_index < len(release_timestamps):
+        if last_commit:
+            tags.append((get_release_name(release_index), last_commit))
+        release_index += 1
+
+    for tag_name, commit in tags:
+        stream.extend(["reset refs/tags/" + tag_name, "from :%d" % commit['mark'], ""])
+
+    marks_file = os.path.abspath(os.path.join(repository_location, ".git", "synthetic_marks"))
+    process = subprocess.Popen(["git", "fast-import", "--quiet", "--export-marks=" + marks_file],
+                               cwd=repository_location, stdin=subprocess.PIPE)
+    process.communicate("\n".join(stream) + "\n")
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, "git fast-import")
+
+    with open(marks_file) as marks:
+        shas = dict(line.split() for line in marks)
+    for commit in commits:
+        commit['sha'] = shas[":%d" % commit['mark']]
+
+    subprocess.check_call(["git", "checkout", "-q", "-f", "master"], cwd=repository_location)
+    return tags
+
+
+def create_jira_database(database_file, issue_list, release_timestamps, comments_per_issue, random_generator):
+    """
+    Creates the JIRA database of the synthetic project.
+    """
+    connection = sqlite3.connect(database_file)
+    for table_ddl in JIRA_DDL:
+        connection.execute(table_ddl)
+
+    insert_rows(connection, "Resolution", RESOLUTIONS)
+    insert_rows(connection, "Status", STATUSES)
+    insert_rows(connection, "Priority", PRIORITIES)
+
+    versions = [("Release " + get_release_name(index), 0, 1, timestamp * 1000, index + 1, PROJECT_ID,
+                 get_release_name(index)) for index, timestamp in enumerate(release_timestamps)]
+    insert_rows(connection, "Version", versions)
+
+    issue_rows, comment_rows, history_rows, change_rows, affected_rows, fix_rows = [], [], [], [], [], []
+    for issue in issue_list:
+        commits = issue['commits']
+        resolved = len(commits) > 0
+
+        row = [None] * ISSUE_COLUMNS
+        row[1] = PROJECT_ID
+        row[2] = RESOLUTIONS[0][0] if resolved else None
+        row[3] = STATUSES[3][0] if resolved else STATUSES[0][0]
+        row[4] = issue['priority']
+        row[15] = issue['created'] * 1000
+        row[21] = issue['reporter']
+        row[25] = u"Synthetic issue " + issue['key']
+        row[27] = issue['id']
+        row[30] = u"Description of synthetic issue " + issue['key']
+        row[31] = issue['key']
+        issue_rows.append(tuple(row))
+
+        affected_index = get_release_index(issue['created'], release_timestamps)
+        if affected_index is not None and affected_index > 0:
+            affected_rows.append((issue['id'], affected_index))
+
+        for comment in range(random_generator.randint(0, comments_per_issue * 2)):
+            comment_rows.append((len(comment_rows) + 1, issue['id'], random_generator.choice(USERS),
+                                 (issue['created'] + comment * 3600) * 1000, "Synthetic comment " * 20))
+
+        changes = [("assignee", None, None, issue['resolver'], issue['resolver'], issue['created'] + 600),
+                   ("status", "1", "Open", "3", "In Progress", issue['created'] + 1200)]
+        if random_generator.random() < 0.3:
+            changes.append(("priority", "3", "Major", str(issue['priority']), PRIORITIES[issue['priority'] - 1][1],
+                            issue['created'] + 1800))
+        if resolved:
+            resolution_date = max(commit['date'] for commit in commits) + 600
+            changes.append(("resolution", None, None, "1", "Fixed", resolution_date))
+            changes.append(("status", "3", "In Progress", "6", "Closed", resolution_date))
+
+            fix_index = get_release_index(min(commit['date'] for commit in commits), release_timestamps)
+            if fix_index is not None:
+                fix_rows.append((issue['id'], fix_index + 1))
+
+        for field, from_value, from_string, to_value, to_string, change_date in changes:
+            history_id = len(history_rows) + 1
+            history_rows.append((history_id, issue['id'], change_date * 1000, issue['resolver']))
+            change_rows.append((len(change_rows) + 1, field, "jira", from_value, from_string, to_value, to_string,
+                                history_id))
+
+    insert_rows(connection, "Issue", issue_rows)
+    insert_rows(connection, "Comment", comment_rows)
+    insert_rows(connection, "History", history_rows)
+    insert_rows(connection, "ChangeLogItem", change_rows)
+    insert_rows(connection, "VersionPerIssue", affected_rows)
+    insert_rows(connection, "FixVersionPerIssue", fix_rows)
+
+    connection.commit()
+    connection.close()
+
+
+def to_github_commit(repository, commit):
+    """
+    Returns a commit as a github_commit tuple.
+    """
+    url = GITHUB_API_URL + repository + "/commits/" + commit['sha']
+    date = datetime.datetime.utcfromtimestamp(commit['date']).strftime("%Y-%m-%d %H:%M:%S")
+    mail = commit['author'] + "@example.org"
+    message = commit['issue']['key'] + ": Synthetic change number " + str(commit['mark']) + "\n"
+
+    return (repository, commit['sha'], commit['author'], mail, date, commit['author'], mail, date, message, None,
+            None, 0, url, url.replace("api.github.com/repos", "github.com"), url + "/comments",
+            commit['insertions'] + commit['deletions'], commit['insertions'], commit['deletions'])
+
+
+def create_jira_github_database(database_file, commit_list, tags_per_repository):
+    """
+    Creates and populates jira_github.sqlite, as loader would.
+    """
+    connection = sqlite3.connect(database_file)
+    for table_ddl in [gjdata.COMMITS_DDL, gjdata.TAGS_DDL, gjdata.TAG_TABLE_DDL, gjdata.COMMIT_TABLE_DDL]:
+        connection.execute(table_ddl)
+
+    issue_commits, commit_tags, git_tags, git_commits = [], [], [], []
+    for repository, tags in tags_per_repository.items():
+        for tag_name, tag_commit in tags:
+            git_tags.append((PROJECT_ID, repository, tag_name, get_git_date(tag_commit['date'])))
+
+    for commit in commit_list:
+        repository = commit['repository']
+        lines = commit['insertions'] + commit['deletions']
+        issue_commits.append((PROJECT_ID, repository, commit['issue']['key'], commit['sha'], commit['deletions'],
+                              lines, commit['insertions'], 1))
+        git_commits.append((PROJECT_ID, repository, commit['sha'], commit['deletions'], lines, commit['insertions'],
+                            1, commit['author'] + "@example.org", str(commit['date'])))
+        commit_tags.extend((PROJECT_ID, repository, commit['sha'], tag_name) for tag_name, tag_commit in
+                           tags_per_repository[repository] if tag_commit['date'] >= commit['date'])
+
+    insert_rows(connection, "issue_commit", issue_commits)
+    insert_rows(connection, "commit_tag", commit_tags)
+    insert_rows(connection, "git_tag", git_tags)
+    insert_rows(connection, "git_commit", git_commits)
+
+    connection.commit()
+    connection.close()
+
+
+def create_github_database(database_file, commit_list, tags_per_repository):
+    """
+    Creates and populates github.sqlite, as gminer would.
+    """
+    connection = sqlite3.connect(database_file)
+    for table_ddl in gdata.TABLE_LIST:
+        connection.execute(table_ddl)
+
+    insert_rows(connection, "github_commit", [to_github_commit(commit['repository'], commit) for commit in
+                                              commit_list])
+
+    tag_rows, compare_rows = [], []
+    for repository, tags in tags_per_repository.items():
+        for tag_name, tag_commit in tags:
+            tag_rows.append((repository, tag_name, GITHUB_API_URL + repository + "/zipball/" + tag_name,
+                             GITHUB_API_URL + repository + "/tarball/" + tag_name, tag_commit['sha'],
+                             GITHUB_API_URL + repository + "/commits/" + tag_commit['sha']))
+
+        repository_commits = [commit for commit in commit_list if commit['repository'] == repository]
+        for (previous_name, previous_commit), (tag_name, tag_commit) in zip(tags, tags[1:]):
+            compare_rows.extend((repository, previous_name, tag_name, GITHUB_API_URL + repository + "/commits/" +
+                                 commit['sha']) for commit in repository_commits if
+                                previous_commit['date'] < commit['date'] <= tag_commit['date'])
+
+    insert_rows(connection, "release_tag", tag_rows)
+    insert_rows(connection, "git_compare", compare_rows)
+
+    connection.commit()
+    connection.close()
+
+
+def build_fixture(directory, issues=1000, releases=20, repositories=1, commits_per_issue=2, comments_per_issue=3,
+                  seed=0):
+    """
+    Builds a synthetic fixture on a directory.
+    :param directory: Destination directory. It must not exist.
+    :param issues: Number of JIRA issues.
+    :param releases: Number of releases, both JIRA versions and Git tags.
+    :param repositories: Number of Git repositories of the project.
+    :param commits_per_issue: Average number of commits per issue.
+    :param comments_per_issue: Average number of comments per issue.
+    :param seed: Random seed.
+    :return: Project configuration, like the ones in the catalog, plus the fixture directory.
+    """
+    random_generator = random.Random(seed)
+    repository_names = ["synthetic-%d" % index for index in range(repositories)]
+
+    os.makedirs(os.path.join(directory, REPOSITORY_DIRECTORY))
+    issue_list, commit_list, release_timestamps = generate_history(issues, releases, repository_names,
+                                                                   commits_per_issue, random_generator)
+
+    tags_per_repository = {}
+    for repository in repository_names:
+        repository_commits = [commit for commit in commit_list if commit['repository'] == repository]
+        tags_per_repository[repository] = create_repository(
+            os.path.join(directory, REPOSITORY_DIRECTORY, repository), repository_commits, release_timestamps)
+
+    create_jira_database(os.path.join(directory, JIRA_DATABASE), issue_list, release_timestamps,
+                         comments_per_issue, random_generator)
+    create_jira_github_database(os.path.join(directory, JIRA_GITHUB_DATABASE), commit_list, tags_per_repository)
+    create_github_database(os.path.join(directory, GITHUB_DATABASE), commit_list, tags_per_repository)
+
+    return {'project_key': PROJECT_KEY,
+            'project_id': PROJECT_ID,
+            'release_regex': RELEASE_REGEX,
+            'repositories': repository_names,
+            'directory': os.path.abspath(directory)}
+
+
+def use_fixture(fixture_config):
+    """
+    Points the data modules to the databases and repositories of a fixture.
+    :param fixture_config: Configuration returned by build_fixture.
+    :return: None.
+    """
+    directory = fixture_config['directory']
+
+    jdata.DATABASE_FILE = os.path.join(directory, JIRA_DATABASE)
+    gjdata.DATABASE_FILE = os.path.join(directory, JIRA_GITHUB_DATABASE)
+    gdata.DATABASE_FILE = os.path.join(directory, GITHUB_DATABASE)
+    metricscache.DATABASE_FILE = os.path.join(directory, METRICS_CACHE_DATABASE)
+    loader.REPO_LOCATION = os.path.join(directory, REPOSITORY_DIRECTORY) + os.sep
+
+    gitcounter.release_tags_cache.clear()
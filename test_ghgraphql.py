@@ -0,0 +1,146 @@
+"""
+Tests for the GraphQL commit hydration of ghgraphql, against the GraphQL endpoint of a mockgithub server. Hydrated
+commits must map to the same github_commit tuples as the ones ghraw builds from the REST API.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import ghgraphql
+import ghraw
+import mockgithub
+import synthetic
+
+ISSUES = 120
+RELEASES = 3
+
+OFFSET_REPOSITORY = "offsets"
+# Author dates with negative, half-hour and zero offsets, and their UTC date strings.
+OFFSET_DATES = [("2010-01-29T11:48:09-08:00", "2010-01-29 19:48:09"),
+                ("2010-01-30T01:15:00+05:30", "2010-01-29 19:45:00"),
+                ("2010-01-30T22:40:30-03:30", "2010-01-31 02:10:30"),
+                ("2010-02-01T08:00:00+00:00", "2010-02-01 08:00:00")]
+
+
+class SilentOutput(object):
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def create_offset_repository(repository_location):
+    """
+    Creates a repository with one commit per date of OFFSET_DATES, authored and committed on that date.
+    """
+    subprocess.check_call(["git", "init", "-q", repository_location])
+    for index, (git_date, _) in enumerate(OFFSET_DATES):
+        environment = dict(os.environ, GIT_AUTHOR_NAME="Author", GIT_AUTHOR_EMAIL="author@example.org",
+                           GIT_COMMITTER_NAME="Committer", GIT_COMMITTER_EMAIL="committer@example.org",
+                           GIT_AUTHOR_DATE=git_date, GIT_COMMITTER_DATE=git_date)
+        with open(os.path.join(repository_location, "file.txt"), "a") as file_output:
+            file_output.write("line %d\n" % index)
+        subprocess.check_call(["git", "add", "file.txt"], cwd=repository_location, env=environment)
+        subprocess.check_call(["git", "commit", "-q", "-m", "Change %d" % index], cwd=repository_location,
+                              env=environment)
+
+
+class RecordingClient(ghraw.RawGitHubClient):
+    """
+    Client that keeps the number of commits looked up on each GraphQL request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingClient, self).__init__(*args, **kwargs)
+        self.batch_sizes = []
+
+    def post(self, path, payload):
+        self.batch_sizes.append(len(mockgithub.GRAPHQL_OBJECT_REGEX.findall(payload['query'])))
+        return super(RecordingClient, self).post(path, payload)
+
+
+class HydrateCommitsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        with SilentOutput():
+            fixture_config = synthetic.build_fixture(os.path.join(cls.directory, "fixture"), issues=ISSUES,
+                                                     releases=RELEASES)
+        cls.repository_name = fixture_config['repositories'][0]
+        repositories_directory = os.path.join(fixture_config['directory'], synthetic.REPOSITORY_DIRECTORY)
+        create_offset_repository(os.path.join(repositories_directory, OFFSET_REPOSITORY))
+
+        cls.server = mockgithub.MockGitHubServer(repositories_directory)
+        cls.base_url = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        self.client = RecordingClient(self.base_url)
+
+    def get_commits(self, repository_name):
+        return list(self.client.get_pages(self.client.get_repository_path(repository_name) + "/commits"))
+
+    def test_batches(self):
+        commits = self.get_commits(self.repository_name)
+        self.assertGreater(len(commits), 2 * ghgraphql.BATCH_SIZE)
+
+        graphql_requests = self.server.requests['graphql']
+        commit_list = ghgraphql.hydrate_commits(self.client, self.repository_name, commits)
+
+        batches = (len(commits) + ghgraphql.BATCH_SIZE - 1) // ghgraphql.BATCH_SIZE
+        self.assertEqual(batches, self.server.requests['graphql'] - graphql_requests)
+        last_batch = len(commits) - (batches - 1) * ghgraphql.BATCH_SIZE
+        self.assertEqual([ghgraphql.BATCH_SIZE] * (batches - 1) + [last_batch], self.client.batch_sizes)
+        self.assertEqual([commit['sha'] for commit in commits], [commit_tuple[1] for commit_tuple in commit_list])
+
+    def test_same_tuples_as_rest(self):
+        for repository_name in [self.repository_name, OFFSET_REPOSITORY]:
+            commits = self.get_commits(repository_name)
+            self.assertEqual(ghraw.get_commit_tuples(self.client, repository_name, commits),
+                             ghgraphql.hydrate_commits(self.client, repository_name, commits))
+
+    def test_offsets(self):
+        commit_list = ghgraphql.hydrate_commits(self.client, OFFSET_REPOSITORY, self.get_commits(OFFSET_REPOSITORY))
+        author_date_index = 4
+        committer_date_index = 7
+
+        expected_dates = sorted(utc_date for _, utc_date in OFFSET_DATES)
+        self.assertEqual(expected_dates, sorted(commit[author_date_index] for commit in commit_list))
+        self.assertEqual(expected_dates, sorted(commit[committer_date_index] for commit in commit_list))
+
+    def test_to_utc_date_string(self):
+        for git_date, utc_date in OFFSET_DATES:
+            self.assertEqual(utc_date, ghgraphql.to_utc_date_string(git_date))
+        self.assertEqual("2010-01-29 11:48:09", ghgraphql.to_utc_date_string("2010-01-29T11:48:09Z"))
+        self.assertEqual("None", ghgraphql.to_utc_date_string(None))
+
+    def test_errors(self):
+        commits = self.get_commits(OFFSET_REPOSITORY)
+        with self.assertRaisesRegexp(ValueError, "GraphQL query failed for repository missing"):
+            ghgraphql.hydrate_commits(self.client, "missing", commits)
+
+    def test_missing_alias(self):
+        commits = self.get_commits(OFFSET_REPOSITORY) + [{'sha': "0" * 40}]
+        with self.assertRaisesRegexp(ValueError, "Commit 0{40} not found on repository " + OFFSET_REPOSITORY):
+            ghgraphql.hydrate_commits(self.client, OFFSET_REPOSITORY, commits)
+
+        # A response without the alias at all, instead of a null one.
+        self.client.post = lambda path, payload: ({}, {'data': {'repository': {}}})
+        with self.assertRaisesRegexp(ValueError, "Commit " + commits[0]['sha'] + " not found"):
+            ghgraphql.hydrate_commits(self.client, OFFSET_REPOSITORY, commits)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Tests for gminer.mine_catalog against a mockgithub server serving the repositories of a synthetic fixture. What the
+API miners store is compared with what gitbackend reads from the local clones.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+import catalog
+import gdata
+import ghclient
+import gitbackend
+import gminer
+import loader
+import mockgithub
+import synthetic
+
+REPOSITORIES = 3
+ISSUES = 30
+RELEASES = 3
+WORKERS = 3
+MAX_CONCURRENT_REQUESTS = 2
+RATE_LIMIT = 40
+RATE_LIMIT_WINDOW = 2
+LATENCY = 0.01
+
+
+class SilentOutput(object):
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+class RecordingBudget(ghclient.RateLimitBudget):
+    """
+    Budget that keeps track of its instances and of the requests it lets through at the same time.
+    """
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingBudget, self).__init__(*args, **kwargs)
+        self.counter_lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        RecordingBudget.instances.append(self)
+
+    def acquire(self):
+        super(RecordingBudget, self).acquire()
+        with self.counter_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def release(self, headers=None):
+        with self.counter_lock:
+            self.in_flight -= 1
+        super(RecordingBudget, self).release(headers)
+
+
+def get_stored_rows(repository_names):
+    """
+    Returns the tags, commits and compares stored for some repositories, sorted.
+    """
+    return dict((name, sorted(row for repository_name in repository_names for row in function(repository_name)))
+                for name, function in [("tags", gdata.get_repository_tags),
+                                       ("commits", gdata.get_commits_by_repository),
+                                       ("compares", gdata.get_compares_by_repository)])
+
+
+class MineCatalogTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        with SilentOutput():
+            cls.fixture_config = synthetic.build_fixture(os.path.join(cls.directory, "fixture"), issues=ISSUES,
+                                                         releases=RELEASES, repositories=REPOSITORIES)
+        cls.repositories_directory = os.path.join(cls.fixture_config['directory'], synthetic.REPOSITORY_DIRECTORY)
+        release_matcher = catalog.get_release_matcher(cls.fixture_config['release_regex'])
+        cls.repositories = [(name, release_matcher) for name in cls.fixture_config['repositories']]
+        cls.stage_names = [stage_name for stage_name, _ in gminer.MINING_STAGES]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        self.database_file = gdata.DATABASE_FILE
+        self.repository_location = loader.REPO_LOCATION
+        self.budget_class = ghclient.RateLimitBudget
+        ghclient.RateLimitBudget = RecordingBudget
+        RecordingBudget.instances = []
+
+        self.server = mockgithub.MockGitHubServer(self.repositories_directory, RATE_LIMIT, RATE_LIMIT_WINDOW,
+                                                  LATENCY)
+        self.base_url = self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        ghclient.RateLimitBudget = self.budget_class
+        gdata.DATABASE_FILE = self.database_file
+        loader.REPO_LOCATION = self.repository_location
+
+    def mine_locally(self):
+        gdata.DATABASE_FILE = os.path.join(self.directory, "local.sqlite")
+        loader.REPO_LOCATION = self.repositories_directory + os.sep
+        with SilentOutput():
+            gdata.create_schema()
+            for repository_name, release_matcher in self.repositories:
+                gitbackend.mine_repository(repository_name, release_matcher, self.stage_names, self.base_url)
+        return get_stored_rows(self.fixture_config['repositories'])
+
+    def test_mine_catalog(self):
+        gdata.DATABASE_FILE = os.path.join(self.directory, "api.sqlite")
+        with SilentOutput():
+            results = gminer.mine_catalog(self.repositories, self.stage_names, workers=WORKERS,
+                                          base_url=self.base_url, max_concurrent_requests=MAX_CONCURRENT_REQUESTS)
+        api_rows = get_stored_rows(self.fixture_config['repositories'])
+
+        self.assertEqual(dict((name, None) for name in self.fixture_config['repositories']), results)
+
+        local_rows = self.mine_locally()
+        for name in ["tags", "commits", "compares"]:
+            self.assertTrue(api_rows[name], name + " were not stored")
+            self.assertEqual(local_rows[name], api_rows[name], name + " differ from the local clones")
+
+        # A single budget is shared by every worker, and every request goes through it. The workers wait for the
+        # reset together instead of running into the rate limit.
+        self.assertEqual(1, len(RecordingBudget.instances))
+        budget = RecordingBudget.instances[0]
+        self.assertEqual(sum(self.server.requests.values()), budget.requests)
+        self.assertGreater(budget.requests, RATE_LIMIT)
+        self.assertGreater(budget.waits, 0)
+        self.assertEqual(0, self.server.rejected)
+
+        # The global cap holds over all the repositories, on the client and on the server.
+        self.assertLessEqual(budget.max_in_flight, MAX_CONCURRENT_REQUESTS)
+        self.assertLessEqual(self.server.max_in_flight, MAX_CONCURRENT_REQUESTS)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+        self.assertIsNone(ghclient.budget)
+
+
+if __name__ == "__main__":
+    unittest.main()